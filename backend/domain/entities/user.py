@@ -1,7 +1,8 @@
-from dataclasses import dataclass
+import base64
+from dataclasses import dataclass, field
 from decimal import Decimal
 from typing import List, Optional
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
 
 
@@ -65,4 +66,81 @@ class CoinTransaction:
         if isinstance(self.price, str):
             self.price = Decimal(self.price)
         if isinstance(self.total_spent, str):
-            self.total_spent = Decimal(self.total_spent) 
\ No newline at end of file
+            self.total_spent = Decimal(self.total_spent) 
+
+
+@dataclass(frozen=True)
+class TransactionCursor:
+    """Позиция в истории транзакций: (timestamp, id) последней показанной"""
+    timestamp: datetime
+    id: int
+
+    @classmethod
+    def after(cls, transaction: CoinTransaction) -> "TransactionCursor":
+        return cls(timestamp=transaction.timestamp, id=transaction.id)
+
+    def encode(self) -> str:
+        raw = f"{self.timestamp.isoformat()}|{self.id}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str) -> "TransactionCursor":
+        """Разобрать курсор из API; ValueError, если он поврежден"""
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+            timestamp, id_ = raw.split("|")
+            return cls(timestamp=datetime.fromisoformat(timestamp), id=int(id_))
+        except (ValueError, UnicodeDecodeError) as e:
+            raise ValueError(f"Некорректный курсор: {token}") from e
+
+
+@dataclass
+class CoinPrice:
+    """Доменная сущность общей цены монеты (обновляется фоновой задачей)"""
+    symbol: str  # Символ в нижнем регистре ('btc')
+    price: Decimal
+    source: Optional[str] = None
+    last_updated: Optional[datetime] = None
+    
+    def __post_init__(self):
+        if not isinstance(self.price, Decimal):
+            self.price = Decimal(str(self.price))
+
+
+@dataclass
+class SnapshotPosition:
+    """Позиция в снимке портфеля: количество и оценка по цене дня"""
+    symbol: str
+    quantity: Decimal
+    cost_basis: Decimal
+    price: Optional[Decimal] = None  # None - цены монеты не было, позиция оценена в 0
+
+    @property
+    def value(self) -> Decimal:
+        return self.quantity * self.price if self.price is not None else Decimal('0')
+
+
+@dataclass
+class PortfolioSnapshot:
+    """Оценка портфеля пользователя на дату (в USD)"""
+    user_id: int
+    snapshot_date: date
+    total_value: Decimal
+    cost_basis: Decimal
+    positions: List[SnapshotPosition] = field(default_factory=list)
+    created_at: Optional[datetime] = None
+
+    @classmethod
+    def from_positions(cls, user_id: int, snapshot_date: date,
+                       positions: List[SnapshotPosition]) -> "PortfolioSnapshot":
+        return cls(
+            user_id=user_id,
+            snapshot_date=snapshot_date,
+            total_value=sum((position.value for position in positions), Decimal('0')),
+            cost_basis=sum((position.cost_basis for position in positions), Decimal('0')),
+            positions=positions,
+        )
+
+    @property
+    def pnl(self) -> Decimal:
+        return self.total_value - self.cost_basis
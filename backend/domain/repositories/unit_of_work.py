@@ -0,0 +1,32 @@
+from abc import ABC, abstractmethod
+from .user_repository import UserRepository, PortfolioRepository, TransactionRepository
+
+
+class UnitOfWork(ABC):
+    """Единица работы: репозитории на одной транзакции БД
+
+    Репозитории внутри единицы работы только отправляют изменения (flush),
+    фиксирует их use case одним commit. Выход из блока без commit
+    (в том числе по исключению) откатывает все изменения.
+    """
+
+    users: UserRepository
+    portfolio: PortfolioRepository
+    transactions: TransactionRepository
+
+    async def __aenter__(self) -> "UnitOfWork":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # После commit откатывать нечего
+        await self.rollback()
+
+    @abstractmethod
+    async def commit(self):
+        """Зафиксировать все изменения одной транзакцией"""
+        pass
+
+    @abstractmethod
+    async def rollback(self):
+        """Отменить незафиксированные изменения"""
+        pass
@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
-from ..entities.user import User, UserPortfolio, CoinTransaction
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Dict, List, Optional
+from ..entities.user import User, UserPortfolio, CoinTransaction, CoinPrice, PortfolioSnapshot, TransactionCursor, TransactionType
 
 
 class UserRepository(ABC):
@@ -50,6 +52,33 @@ class PortfolioRepository(ABC):
         """Удалить элемент из портфеля"""
         pass
 
+    @abstractmethod
+    async def update_current_prices(self, portfolio_items: List[UserPortfolio]) -> int:
+        """Записать current_price/last_updated для многих позиций одним запросом"""
+        pass
+
+    @abstractmethod
+    async def apply_buy(self, user_id: int, symbol: str, name: str,
+                        quantity: Decimal, price: Decimal) -> UserPortfolio:
+        """Атомарно добавить покупку к позиции (создать позицию, если ее нет)"""
+        pass
+
+    @abstractmethod
+    async def apply_sell(self, user_id: int, symbol: str, quantity: Decimal) -> Optional[UserPortfolio]:
+        """Атомарно списать продажу с позиции (None - позиции нет или монет недостаточно)"""
+        pass
+
+    @abstractmethod
+    async def get_held_symbols(self) -> List[str]:
+        """Все различные символы из портфелей пользователей (в нижнем регистре)"""
+        pass
+
+    @abstractmethod
+    def stream_positions(self, batch_size: int = 1000) -> AsyncIterator[UserPortfolio]:
+        """Позиции всех пользователей, сгруппированные по user_id,
+        порциями из серверного курсора"""
+        pass
+
 
 class TransactionRepository(ABC):
     """Интерфейс репозитория для работы с транзакциями"""
@@ -60,6 +89,60 @@ class TransactionRepository(ABC):
         pass
     
     @abstractmethod
-    async def get_user_transactions(self, user_id: int) -> List[CoinTransaction]:
-        """Получить все транзакции пользователя"""
-        pass 
\ No newline at end of file
+    async def get_user_transactions(self, user_id: int, limit: Optional[int] = None,
+                                    cursor: Optional[TransactionCursor] = None,
+                                    symbol: Optional[str] = None,
+                                    transaction_type: Optional[TransactionType] = None,
+                                    since: Optional[datetime] = None,
+                                    until: Optional[datetime] = None) -> List[CoinTransaction]:
+        """Транзакции пользователя, новые первыми
+
+        cursor - продолжить после этой транзакции, since/until - полуинтервал
+        [since, until) по времени транзакции.
+        """
+        pass
+
+    @abstractmethod
+    def stream_transactions(self, user_id: Optional[int] = None,
+                            since: Optional[datetime] = None,
+                            until: Optional[datetime] = None,
+                            batch_size: int = 1000) -> AsyncIterator[CoinTransaction]:
+        """Транзакции пользователя (или всех, если user_id=None) по порядку,
+        порциями из серверного курсора - без загрузки всей истории в память"""
+        pass
+
+
+class PriceRepository(ABC):
+    """Интерфейс репозитория общих цен монет"""
+    
+    @abstractmethod
+    async def get_prices(self, symbols: List[str]) -> Dict[str, CoinPrice]:
+        """Получить цены по символам (ключ - символ в нижнем регистре)"""
+        pass
+    
+    @abstractmethod
+    async def upsert_prices(self, prices: Dict[str, float], source: str) -> int:
+        """Сохранить цены"""
+        pass
+
+
+class PortfolioSnapshotRepository(ABC):
+    """Интерфейс репозитория дневных снимков стоимости портфелей"""
+
+    @abstractmethod
+    async def upsert_snapshots(self, snapshots: List[PortfolioSnapshot]) -> int:
+        """Сохранить снимки (снимок за ту же дату перезаписывается)"""
+        pass
+
+    @abstractmethod
+    async def get_history(self, user_id: int, since: Optional[date] = None,
+                          until: Optional[date] = None,
+                          with_positions: bool = True) -> List[PortfolioSnapshot]:
+        """Снимки пользователя за [since, until] по возрастанию даты
+        (with_positions=False - только итоги, без разбивки по монетам)"""
+        pass
+
+    @abstractmethod
+    async def get_user_ids(self, since: date, until: date) -> List[int]:
+        """Пользователи с непустым снимком (были позиции) за дату из [since, until]"""
+        pass
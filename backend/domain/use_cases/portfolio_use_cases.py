@@ -1,87 +1,66 @@
 from decimal import Decimal
-from typing import List, Optional
-from datetime import datetime
-from ..entities.user import User, UserPortfolio, CoinTransaction, TransactionType
-from ..repositories.user_repository import UserRepository, PortfolioRepository, TransactionRepository
+from typing import Callable, Dict, List, Optional, Set
+from datetime import date, datetime, timedelta
+from ..entities.user import User, UserPortfolio, CoinTransaction, CoinPrice, PortfolioSnapshot, SnapshotPosition, TransactionType
+from ..repositories.user_repository import UserRepository, PortfolioRepository, PriceRepository, PortfolioSnapshotRepository
+from ..repositories.unit_of_work import UnitOfWork
 
 
 class GetUserPortfolioUseCase:
     """Use case для получения портфеля пользователя"""
     
-    def __init__(self, user_repo: UserRepository, portfolio_repo: PortfolioRepository):
+    def __init__(self, user_repo: UserRepository, portfolio_repo: PortfolioRepository,
+                 price_repo: Optional[PriceRepository] = None,
+                 on_missing_prices: Optional[Callable[[List[str]], None]] = None,
+                 persist_prices: bool = True):
         self.user_repo = user_repo
         self.portfolio_repo = portfolio_repo
+        # False - цены только подставляются в ответ (portfolio_repo читает с реплики,
+        # а источник цен - общая таблица, так что копия в user_portfolio не нужна)
+        self.persist_prices = persist_prices
+        # Общая таблица цен, которую заполняет фоновая задача (запросов к API здесь нет)
+        self.price_repo = price_repo
+        # Вызывается для символов, которых еще нет в таблице цен
+        self.on_missing_prices = on_missing_prices
     
     async def execute(self, telegram_id: int) -> Optional[List[UserPortfolio]]:
-        """Получить портфель пользователя с обновленными ценами"""
+        """Получить портфель пользователя с актуальными ценами из общей таблицы цен"""
         user = await self.user_repo.get_by_telegram_id(telegram_id)
         if not user:
             return None
         
         portfolio_items = await self.portfolio_repo.get_user_portfolio(user.id)
         
-        # Обновляем текущие цены через CoinGecko API (только если есть монеты и цены устарели)
-        if portfolio_items:
+        if portfolio_items and self.price_repo:
             try:
-                from infrastructure.external_apis.coin_gecko_api import CoinGeckoAPI
-                from decimal import Decimal
-                from datetime import datetime, timedelta
+                prices = await self.price_repo.get_prices([item.symbol for item in portfolio_items])
                 
-                # Проверяем, нужно ли обновлять цены (если прошло более 10 минут или цена = 0)
-                need_update = False
+                missing_symbols = []
+                updated_items = []
                 for item in portfolio_items:
-                    if (not item.last_updated or 
-                        (datetime.utcnow() - item.last_updated) > timedelta(minutes=10) or
-                        item.current_price == 0):
-                        need_update = True
-                        break
-                
-                if need_update:
-                    print(f"Обновляем цены для {len(portfolio_items)} монет")
+                    coin_price = prices.get(item.symbol.lower())
+                    if coin_price is None:
+                        missing_symbols.append(item.symbol)
+                        continue
                     
-                    # Используем timeout для обновления цен, чтобы не блокировать запрос
-                    try:
-                        import asyncio
-                        coin_api = CoinGeckoAPI()
-                        
-                        # Получаем символы всех монет в портфеле
-                        symbols = [item.symbol for item in portfolio_items]
-                        print(f"Символы для обновления: {symbols}")
-                        
-                        # Получаем текущие цены с timeout 5 секунд
-                        current_prices = await asyncio.wait_for(
-                            coin_api.get_current_prices(symbols),
-                            timeout=5.0
-                        )
-                        print(f"Получены цены: {current_prices}")
-                        
-                        # Обновляем цены в портфеле
-                        updated_count = 0
-                        for item in portfolio_items:
-                            symbol_lower = item.symbol.lower()
-                            if symbol_lower in current_prices and current_prices[symbol_lower] > 0:
-                                old_price = float(item.current_price)
-                                item.current_price = Decimal(str(current_prices[symbol_lower]))
-                                item.last_updated = datetime.utcnow()
-                                print(f"Обновляем цену {item.symbol}: {old_price} -> {current_prices[symbol_lower]}")
-                                
-                                # Обновляем в базе данных
-                                await self.portfolio_repo.update_portfolio_item(item)
-                                updated_count += 1
-                        
-                        print(f"Обновлено цен в БД: {updated_count}")
-                    except asyncio.TimeoutError:
-                        print("⏰ Timeout при обновлении цен, пропускаем")
-                    except Exception as price_error:
-                        print(f"⚠️ Ошибка при обновлении цен: {price_error}")
-                        # Продолжаем без обновления цен
-                else:
-                    print("Цены актуальны, обновление не требуется")
-                        
+                    # Копируем в портфель только более свежую цену
+                    if (not item.last_updated or not coin_price.last_updated or
+                            coin_price.last_updated > item.last_updated or item.current_price == 0):
+                        item.current_price = coin_price.price
+                        item.last_updated = coin_price.last_updated or datetime.utcnow()
+                        updated_items.append(item)
+                
+                if updated_items and self.persist_prices:
+                    # Все изменившиеся цены - одним запросом и одним commit
+                    await self.portfolio_repo.update_current_prices(updated_items)
+                    print(f"Обновлено цен в портфеле: {len(updated_items)}")
+                
+                if missing_symbols:
+                    print(f"Нет цен для {missing_symbols}, запрошено фоновое обновление")
+                    if self.on_missing_prices:
+                        self.on_missing_prices(missing_symbols)
             except Exception as e:
-                print(f"Ошибка при обновлении цен: {e}")
-                import traceback
-                traceback.print_exc()
+                print(f"Ошибка при чтении цен: {e}")
                 # Продолжаем работу даже если не удалось обновить цены
         
         return portfolio_items
@@ -90,70 +69,43 @@ class GetUserPortfolioUseCase:
 class AddCoinToPortfolioUseCase:
     """Use case для добавления монеты в портфель"""
     
-    def __init__(self, user_repo: UserRepository, portfolio_repo: PortfolioRepository, 
-                 transaction_repo: TransactionRepository):
-        self.user_repo = user_repo
-        self.portfolio_repo = portfolio_repo
-        self.transaction_repo = transaction_repo
+    def __init__(self, uow: UnitOfWork, new_user_balance: Optional[Decimal] = None):
+        self.uow = uow
+        # Если задан - отсутствующий пользователь создается в той же транзакции
+        self.new_user_balance = new_user_balance
     
     async def execute(self, telegram_id: int, symbol: str, name: str, 
                      quantity: Decimal, price: Decimal) -> bool:
-        """Добавить монету в портфель"""
-        user = await self.user_repo.get_by_telegram_id(telegram_id)
-        if not user:
-            return False
-        
-        total_spent = price * quantity
-        
-        # Создаем транзакцию
-        transaction = CoinTransaction(
-            id=None,
-            user_id=user.id,
-            symbol=symbol,
-            name=name,
-            quantity=quantity,
-            price=price,
-            total_spent=total_spent,
-            transaction_type=TransactionType.BUY,
-            timestamp=None  # Будет установлено в репозитории
-        )
-        await self.transaction_repo.create_transaction(transaction)
-        
-        # Проверяем, есть ли уже такая монета в портфеле
-        existing_coin = await self.portfolio_repo.get_portfolio_item(user.id, symbol)
-        
-        if existing_coin:
-            # Обновляем существующую монету
-            total_quantity = existing_coin.total_quantity + quantity
-            total_cost = existing_coin.avg_price * existing_coin.total_quantity + total_spent
-            avg_price = total_cost / total_quantity
+        """Добавить монету в портфель (сделка и позиция - одна транзакция БД)"""
+        async with self.uow:
+            user = await self.uow.users.get_by_telegram_id(telegram_id)
+            if not user:
+                if self.new_user_balance is None:
+                    return False
+                print(f"Создаем нового пользователя с telegram_id: {telegram_id}")
+                user = await self.uow.users.create(
+                    User(id=None, telegram_id=telegram_id, balance=self.new_user_balance)
+                )
             
-            updated_coin = UserPortfolio(
-                id=existing_coin.id,
-                user_id=user.id,
-                symbol=symbol,
-                name=name,
-                total_quantity=total_quantity,
-                avg_price=avg_price,
-                current_price=existing_coin.current_price,
-                total_spent=existing_coin.total_spent + total_spent,
-                last_updated=datetime.utcnow()
-            )
-            await self.portfolio_repo.update_portfolio_item(updated_coin)
-        else:
-            # Создаем новую запись в портфеле
-            new_coin = UserPortfolio(
+            # Создаем транзакцию
+            transaction = CoinTransaction(
                 id=None,
                 user_id=user.id,
                 symbol=symbol,
                 name=name,
-                total_quantity=quantity,
-                avg_price=price,
-                current_price=Decimal('0'),  # Будет обновлено позже
-                total_spent=total_spent,
-                last_updated=datetime.utcnow()
+                quantity=quantity,
+                price=price,
+                total_spent=price * quantity,
+                transaction_type=TransactionType.BUY,
+                timestamp=None  # Будет установлено в репозитории
             )
-            await self.portfolio_repo.add_coin_to_portfolio(new_coin)
+            await self.uow.transactions.create_transaction(transaction)
+            
+            # Позиция создается или увеличивается одним запросом; средняя цена
+            # пересчитывается в БД, поэтому одновременные покупки не теряются
+            await self.uow.portfolio.apply_buy(user.id, symbol, name, quantity, price)
+            
+            await self.uow.commit()
         
         return True
 
@@ -161,66 +113,106 @@ class AddCoinToPortfolioUseCase:
 class SellCoinFromPortfolioUseCase:
     """Use case для продажи монеты из портфеля"""
     
-    def __init__(self, user_repo: UserRepository, portfolio_repo: PortfolioRepository, 
-                 transaction_repo: TransactionRepository):
-        self.user_repo = user_repo
-        self.portfolio_repo = portfolio_repo
-        self.transaction_repo = transaction_repo
+    def __init__(self, uow: UnitOfWork):
+        self.uow = uow
     
     async def execute(self, telegram_id: int, symbol: str, 
                      quantity: Decimal, price: Decimal) -> bool:
-        """Продать монету из портфеля"""
-        user = await self.user_repo.get_by_telegram_id(telegram_id)
-        if not user:
-            return False
-        
-        # Проверяем, есть ли такая монета в портфеле
-        existing_coin = await self.portfolio_repo.get_portfolio_item(user.id, symbol)
-        if not existing_coin:
-            return False
+        """Продать монету из портфеля (сделка и позиция - одна транзакция БД)"""
+        async with self.uow:
+            user = await self.uow.users.get_by_telegram_id(telegram_id)
+            if not user:
+                return False
+            
+            # Списываем монеты условным UPDATE: позиции нет или монет недостаточно - None.
+            # Средняя цена покупки не меняется, проданная целиком позиция удаляется
+            position = await self.uow.portfolio.apply_sell(user.id, symbol, quantity)
+            if position is None:
+                return False
+            
+            # Создаем транзакцию продажи
+            transaction = CoinTransaction(
+                id=None,
+                user_id=user.id,
+                symbol=symbol,
+                name=position.name,
+                quantity=quantity,
+                price=price,
+                total_spent=price * quantity,  # Для продажи это сумма получена
+                transaction_type=TransactionType.SELL,
+                timestamp=None  # Будет установлено в репозитории
+            )
+            await self.uow.transactions.create_transaction(transaction)
+            
+            await self.uow.commit()
         
-        # Проверяем, достаточно ли монет для продажи
-        if existing_coin.total_quantity < quantity:
-            return False
+        return True
+
+
+class TakePortfolioSnapshotsUseCase:
+    """Use case для дневных снимков стоимости всех портфелей"""
+    
+    def __init__(self, portfolio_repo: PortfolioRepository, price_repo: PriceRepository,
+                 snapshot_repo: PortfolioSnapshotRepository, batch_size: int = 500):
+        self.portfolio_repo = portfolio_repo
+        self.price_repo = price_repo
+        self.snapshot_repo = snapshot_repo
+        # Сколько пользователей сохранять одним пакетом
+        self.batch_size = batch_size
+    
+    async def execute(self, snapshot_date: date) -> int:
+        """Оценить портфели всех пользователей по одному набору цен и сохранить снимки"""
+        # Цены читаются один раз на весь проход, а не на каждого пользователя
+        symbols = await self.portfolio_repo.get_held_symbols()
+        prices = await self.price_repo.get_prices(symbols) if symbols else {}
         
-        total_received = price * quantity
+        saved = 0
+        batch: List[PortfolioSnapshot] = []
+        valued: Set[int] = set()
+        user_id: Optional[int] = None
+        positions: List[SnapshotPosition] = []
+        # Позиции приходят сгруппированными по user_id: снимок готов, когда сменился пользователь
+        async for item in self.portfolio_repo.stream_positions(self.batch_size):
+            if item.user_id != user_id:
+                if positions:
+                    batch.append(PortfolioSnapshot.from_positions(user_id, snapshot_date, positions))
+                    valued.add(user_id)
+                if len(batch) >= self.batch_size:
+                    saved += await self.snapshot_repo.upsert_snapshots(batch)
+                    batch = []
+                user_id, positions = item.user_id, []
+            positions.append(self._value_position(item, prices))
         
-        # Создаем транзакцию продажи
-        transaction = CoinTransaction(
-            id=None,
-            user_id=user.id,
-            symbol=symbol,
-            name=existing_coin.name,
-            quantity=quantity,
-            price=price,
-            total_spent=total_received,  # Для продажи это сумма получена
-            transaction_type=TransactionType.SELL,
-            timestamp=None  # Будет установлено в репозитории
-        )
-        await self.transaction_repo.create_transaction(transaction)
+        if positions:
+            batch.append(PortfolioSnapshot.from_positions(user_id, snapshot_date, positions))
+            valued.add(user_id)
         
-        # Обновляем портфель
-        new_quantity = existing_coin.total_quantity - quantity
+        # Продавшие все получают нулевой снимок, чтобы история не обрывалась на
+        # последней ненулевой оценке: те, у кого вчера были позиции, и те, чей
+        # сегодняшний снимок теперь устарел. На нулевом снимке ряд заканчивается
+        previous = await self.snapshot_repo.get_user_ids(snapshot_date - timedelta(days=1), snapshot_date)
+        for emptied_user_id in sorted(set(previous) - valued):
+            batch.append(PortfolioSnapshot.from_positions(emptied_user_id, snapshot_date, []))
+            if len(batch) >= self.batch_size:
+                saved += await self.snapshot_repo.upsert_snapshots(batch)
+                batch = []
         
-        if new_quantity == 0:
-            # Если продали все монеты, удаляем из портфеля
-            await self.portfolio_repo.delete_portfolio_item(existing_coin.id)
+        if batch:
+            saved += await self.snapshot_repo.upsert_snapshots(batch)
+        return saved
+    
+    @staticmethod
+    def _value_position(item: UserPortfolio, prices: Dict[str, CoinPrice]) -> SnapshotPosition:
+        coin_price = prices.get(item.symbol.lower())
+        if coin_price is not None:
+            price = coin_price.price
         else:
-            # Обновляем количество и общую потраченную сумму
-            # Средняя цена остается той же
-            new_total_spent = existing_coin.total_spent - (existing_coin.avg_price * quantity)
-            
-            updated_coin = UserPortfolio(
-                id=existing_coin.id,
-                user_id=user.id,
-                symbol=symbol,
-                name=existing_coin.name,
-                total_quantity=new_quantity,
-                avg_price=existing_coin.avg_price,  # Средняя цена покупки не меняется
-                current_price=existing_coin.current_price,
-                total_spent=new_total_spent,
-                last_updated=datetime.utcnow()
-            )
-            await self.portfolio_repo.update_portfolio_item(updated_coin)
-        
-        return True 
\ No newline at end of file
+            # Нет в общей таблице - последняя записанная в позицию цена, если она есть
+            price = item.current_price if item.current_price else None
+        return SnapshotPosition(
+            symbol=item.symbol,
+            quantity=item.total_quantity,
+            cost_basis=item.total_spent,
+            price=price,
+        )
+
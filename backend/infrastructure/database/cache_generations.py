@@ -0,0 +1,86 @@
+"""
+Поколения кэша монет (таблица coin_cache_meta) и их зеркало в памяти
+
+Каждое обновление coin_cache в той же транзакции увеличивает поколение
+списка и записывает время, провайдера и число строк. Свежесть кэша
+берется из зеркала; таблица метаданных перечитывается (один запрос по
+ключу) не чаще раза в ttl_seconds, чтобы подхватить обновления других
+экземпляров приложения. ETag для ответа 304 сверяется с поколением,
+прочитанным из таблицы в том же запросе: зеркало другого процесса может
+отставать до ttl_seconds.
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from shared.config import settings
+
+
+@dataclass(frozen=True)
+class CacheGeneration:
+    """Метаданные одного списка кэша"""
+    cache_type: str
+    generation: int
+    refreshed_at: datetime
+    source: Optional[str] = None
+    row_count: int = 0
+
+    def age_seconds(self, now: Optional[datetime] = None) -> float:
+        return ((now or datetime.utcnow()) - self.refreshed_at).total_seconds()
+
+    def etag(self, *variant: Any) -> str:
+        """ETag ответа: поколение плюс параметры, от которых зависит тело"""
+        return '"' + "-".join([self.cache_type, str(self.generation), *map(str, variant)]) + '"'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "generation": self.generation,
+            "refreshed_at": self.refreshed_at.isoformat(),
+            "age_seconds": round(self.age_seconds(), 1),
+            "source": self.source,
+            "row_count": self.row_count,
+        }
+
+
+class CacheGenerations:
+    """Зеркало coin_cache_meta в памяти процесса"""
+
+    def __init__(self, ttl_seconds: float = 30, clock: Callable[[], float] = time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: Dict[str, Tuple[CacheGeneration, float]] = {}
+        self.reloads = 0
+
+    def get(self, cache_type: str) -> Optional[CacheGeneration]:
+        entry = self._entries.get(cache_type)
+        return entry[0] if entry else None
+
+    def needs_reload(self, cache_type: str) -> bool:
+        entry = self._entries.get(cache_type)
+        return entry is None or self._clock() - entry[1] >= self.ttl_seconds
+
+    def update(self, meta: CacheGeneration) -> CacheGeneration:
+        """Запомнить поколение; более старое не вытесняет более новое"""
+        current = self.get(meta.cache_type)
+        if current is not None and current.generation > meta.generation:
+            meta = current
+        self._entries[meta.cache_type] = (meta, self._clock())
+        return meta
+
+    def is_fresh(self, cache_type: str, max_age_seconds: float) -> bool:
+        meta = self.get(cache_type)
+        return meta is not None and meta.age_seconds() < max_age_seconds
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "reloads": self.reloads,
+            "caches": {cache_type: meta.to_dict() for cache_type, (meta, _) in self._entries.items()},
+        }
+
+
+cache_generations = CacheGenerations(ttl_seconds=settings.CACHE_GENERATION_TTL_SECONDS)
@@ -2,19 +2,33 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from shared.config import settings
+from .pool import ReplicaAsyncQueuePool, async_engine_options, instrument_pool, replica_pool_monitor
 
 # Синхронное подключение (для миграций)
 engine = create_engine(settings.DB_URL)
 Session = sessionmaker(bind=engine)
 
-# Асинхронное подключение (для приложения)
-async_engine = create_async_engine(settings.ASYNC_DB_URL)
+# Асинхронное подключение (для приложения): пул по настройкам DB_POOL_*
+async_engine = create_async_engine(settings.ASYNC_DB_URL, **async_engine_options())
+instrument_pool(async_engine.sync_engine)
 AsyncSessionLocal = sessionmaker(
     async_engine, 
     class_=AsyncSession, 
     expire_on_commit=False
 )
 
+# Реплика для чтения (READ_DATABASE_URL), если задана
+read_engine = None
+ReadSessionLocal = None
+if settings.READ_DATABASE_URL:
+    read_engine = create_async_engine(settings.READ_ASYNC_DB_URL, **async_engine_options(ReplicaAsyncQueuePool))
+    instrument_pool(read_engine.sync_engine, replica_pool_monitor)
+    ReadSessionLocal = sessionmaker(
+        read_engine,
+        class_=AsyncSession,
+        expire_on_commit=False
+    )
+
 def get_session():
     """Получить синхронную сессию"""
     return Session()
@@ -23,8 +37,4 @@ async def get_async_session():
     """Получить асинхронную сессию"""
     async with AsyncSessionLocal() as session:
         yield session
-
-def init_db():
-    """Инициализация базы данных"""
-    from .models import Base
-    Base.metadata.create_all(engine) 
\ No newline at end of file
+ 
\ No newline at end of file
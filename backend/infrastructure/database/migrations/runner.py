@@ -0,0 +1,204 @@
+"""
+Версионные миграции схемы БД
+
+Примененные версии хранятся в таблице schema_migrations. Миграции
+выполняются по возрастанию версии под advisory lock, поэтому несколько
+экземпляров приложения при старте не применяют их одновременно.
+
+- transactional=True: весь SQL миграции и запись версии - одна транзакция;
+- transactional=False: выражения выполняются по одному вне транзакции
+  (CREATE INDEX CONCURRENTLY не блокирует запись в таблицу). Невалидные
+  остатки прерванного построения индекса удаляются перед повтором.
+  Выражения prepare (например, слияние дубликатов перед UNIQUE индексом)
+  выполняются в транзакции перед каждой попыткой построения: если дубликат
+  появился между ними и индекс упал на unique violation, попытка повторяется.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import asyncpg
+
+from shared.config import settings
+
+# Ключ pg_advisory_lock для миграций (произвольная константа)
+MIGRATION_LOCK_ID = 7_310_450_019
+
+# Попыток построить UNIQUE индекс, если во время построения появляются дубликаты
+INDEX_BUILD_ATTEMPTS = 3
+
+CREATE_VERSIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+)
+"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Одна версия схемы"""
+    version: int
+    name: str
+    statements: Tuple[str, ...]
+    transactional: bool = True
+    indexes: Tuple[str, ...] = ()  # индексы, которые строятся CONCURRENTLY
+    prepare: Tuple[str, ...] = ()  # транзакция перед каждой попыткой построения индексов
+
+
+def concurrent_index(version: int, name: str, index_name: str, table: str,
+                     columns: str, unique: bool = False,
+                     prepare: Tuple[str, ...] = ()) -> Migration:
+    """Миграция, создающая индекс без блокировки записи"""
+    unique_sql = "UNIQUE " if unique else ""
+    return Migration(
+        version=version,
+        name=name,
+        statements=(
+            f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table} ({columns})",
+        ),
+        transactional=False,
+        indexes=(index_name,),
+        prepare=tuple(prepare),
+    )
+
+
+def validate_migrations(migrations: Sequence[Migration]):
+    """Проверить порядок версий и совместимость выражений с режимом"""
+    previous = 0
+    for migration in migrations:
+        if migration.version <= previous:
+            raise ValueError(f"Версии миграций должны строго возрастать: {migration.version} после {previous}")
+        previous = migration.version
+        if not migration.statements:
+            raise ValueError(f"Миграция {migration.version} не содержит выражений")
+        if migration.transactional and any("CONCURRENTLY" in sql.upper() for sql in migration.statements):
+            raise ValueError(f"Миграция {migration.version}: CONCURRENTLY нельзя выполнять в транзакции")
+        if migration.prepare and (migration.transactional or not migration.indexes):
+            raise ValueError(f"Миграция {migration.version}: prepare только для миграций с CONCURRENTLY индексами")
+        if any("CONCURRENTLY" in sql.upper() for sql in migration.prepare):
+            raise ValueError(f"Миграция {migration.version}: prepare выполняется в транзакции")
+
+
+def pending_migrations(migrations: Sequence[Migration], applied: Iterable[int],
+                       target: Optional[int] = None) -> List[Migration]:
+    """Неприменные миграции по порядку (не выше target)"""
+    applied = set(applied)
+    return [
+        migration for migration in migrations
+        if migration.version not in applied and (target is None or migration.version <= target)
+    ]
+
+
+class MigrationRunner:
+    """Применение миграций на одном соединении asyncpg"""
+
+    def __init__(self, conn, migrations: Optional[Sequence[Migration]] = None):
+        if migrations is None:
+            from .versions import MIGRATIONS
+            migrations = MIGRATIONS
+        validate_migrations(migrations)
+        self.conn = conn
+        self.migrations = list(migrations)
+
+    async def applied_versions(self) -> Dict[int, Any]:
+        await self.conn.execute(CREATE_VERSIONS_TABLE)
+        rows = await self.conn.fetch("SELECT version, applied_at FROM schema_migrations ORDER BY version")
+        return {row["version"]: row["applied_at"] for row in rows}
+
+    async def status(self) -> List[Dict[str, Any]]:
+        applied = await self.applied_versions()
+        return [
+            {
+                "version": migration.version,
+                "name": migration.name,
+                "transactional": migration.transactional,
+                "applied_at": applied[migration.version].isoformat() if migration.version in applied else None,
+            }
+            for migration in self.migrations
+        ]
+
+    async def upgrade(self, target: Optional[int] = None) -> List[Migration]:
+        """Применить все неприменные миграции (до target включительно)"""
+        await self.conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+        try:
+            applied = await self.applied_versions()
+            pending = pending_migrations(self.migrations, applied, target)
+            for migration in pending:
+                print(f"🔄 Миграция {migration.version:04d}: {migration.name}...")
+                await self.apply(migration)
+                print(f"✅ Миграция {migration.version:04d} применена")
+            return pending
+        finally:
+            await self.conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+    async def apply(self, migration: Migration):
+        if migration.transactional:
+            async with self.conn.transaction():
+                for sql in migration.statements:
+                    await self.conn.execute(sql)
+                await self._record(migration)
+            return
+
+        for attempt in range(1, INDEX_BUILD_ATTEMPTS + 1):
+            for index_name in migration.indexes:
+                await self._drop_invalid_index(index_name)
+            if migration.prepare:
+                async with self.conn.transaction():
+                    for sql in migration.prepare:
+                        await self.conn.execute(sql)
+            try:
+                for sql in migration.statements:
+                    await self.conn.execute(sql)
+                break
+            except asyncpg.exceptions.UniqueViolationError:
+                # Дубликат вставлен после prepare: повтор удалит невалидный индекс и снова сольет строки
+                if not migration.prepare or attempt == INDEX_BUILD_ATTEMPTS:
+                    raise
+                print(f"⚠️ Миграция {migration.version:04d}: дубликаты во время построения индекса, повтор {attempt}")
+        for index_name in migration.indexes:
+            if await self._index_valid(index_name) is False:
+                raise RuntimeError(f"Индекс {index_name} построен невалидным")
+        await self._record(migration)
+
+    async def _record(self, migration: Migration):
+        await self.conn.execute(
+            "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)",
+            migration.version, migration.name,
+        )
+
+    async def _index_valid(self, index_name: str) -> Optional[bool]:
+        return await self.conn.fetchval(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = $1",
+            index_name,
+        )
+
+    async def _drop_invalid_index(self, index_name: str):
+        # Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс,
+        # и IF NOT EXISTS при повторе его бы пропустил
+        if await self._index_valid(index_name) is False:
+            print(f"⚠️ Удаляем невалидный индекс {index_name}")
+            await self.conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+
+
+def migration_db_url() -> str:
+    """URL для миграций: напрямую к PostgreSQL, в обход pgbouncer, если задан"""
+    return settings.DB_MIGRATION_URL or settings.DB_URL
+
+
+async def run_migrations(target: Optional[int] = None, db_url: Optional[str] = None) -> List[Migration]:
+    """Подключиться и применить неприменные миграции"""
+    conn = await asyncpg.connect(db_url or migration_db_url())
+    try:
+        return await MigrationRunner(conn).upgrade(target)
+    finally:
+        await conn.close()
+
+
+async def migration_status(db_url: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Список миграций с отметкой о применении"""
+    conn = await asyncpg.connect(db_url or migration_db_url())
+    try:
+        return await MigrationRunner(conn).status()
+    finally:
+        await conn.close()
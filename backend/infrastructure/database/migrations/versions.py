@@ -0,0 +1,267 @@
+"""
+Список миграций схемы по порядку
+
+Уже примененную миграцию не меняют - изменения схемы добавляются новой
+версией в конец списка. Модели в models.py описывают итоговую схему.
+"""
+from .runner import Migration, concurrent_index
+
+# Прежний create_all и scripts/migrate_add_coin_cache.py: на существующей БД ничего не меняет
+BASELINE = Migration(
+    version=1,
+    name="baseline",
+    statements=(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            telegram_id BIGINT NOT NULL UNIQUE,
+            balance NUMERIC
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_portfolio (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            symbol VARCHAR NOT NULL,
+            name VARCHAR NOT NULL,
+            total_quantity NUMERIC NOT NULL,
+            avg_price NUMERIC NOT NULL,
+            current_price NUMERIC,
+            total_spent NUMERIC NOT NULL,
+            last_updated TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS coin_transactions (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            symbol VARCHAR NOT NULL,
+            name VARCHAR NOT NULL,
+            quantity NUMERIC NOT NULL,
+            price NUMERIC NOT NULL,
+            total_spent NUMERIC NOT NULL,
+            "timestamp" TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS coin_cache (
+            id VARCHAR PRIMARY KEY,
+            symbol VARCHAR NOT NULL,
+            name VARCHAR NOT NULL,
+            current_price DOUBLE PRECISION NOT NULL,
+            market_cap DOUBLE PRECISION,
+            market_cap_rank INTEGER,
+            price_change_percentage_24h DOUBLE PRECISION,
+            image VARCHAR,
+            total_volume DOUBLE PRECISION,
+            last_updated TIMESTAMP DEFAULT NOW(),
+            cache_type VARCHAR DEFAULT 'top_coins'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS coin_directory (
+            id SERIAL PRIMARY KEY,
+            symbol VARCHAR NOT NULL,
+            name VARCHAR NOT NULL,
+            coingecko_id VARCHAR NOT NULL UNIQUE,
+            cmc_id INTEGER,
+            rank INTEGER,
+            last_updated TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_coin_directory_symbol ON coin_directory (symbol)",
+        """
+        CREATE TABLE IF NOT EXISTS coin_prices (
+            symbol VARCHAR PRIMARY KEY,
+            price NUMERIC NOT NULL,
+            source VARCHAR,
+            last_updated TIMESTAMP
+        )
+        """,
+    ),
+)
+
+# Заменяет /admin/migrate-transaction-type, /admin/simple-migration и
+# /admin/fix-transaction-enum: колонка приводится к VARCHAR со значениями
+# 'BUY'/'SELL', из какого бы промежуточного состояния (TEXT, ENUM) она ни была.
+# Смена типа переписывает таблицу под ACCESS EXCLUSIVE, поэтому выполняется
+# только если колонка еще не VARCHAR; значения приводятся обычным UPDATE
+TRANSACTION_TYPE = Migration(
+    version=2,
+    name="coin_transactions.transaction_type",
+    statements=(
+        "ALTER TABLE coin_transactions ADD COLUMN IF NOT EXISTS transaction_type VARCHAR",
+        """
+        DO $$ BEGIN
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'coin_transactions'
+                  AND column_name = 'transaction_type' AND data_type <> 'character varying'
+            ) THEN
+                ALTER TABLE coin_transactions ALTER COLUMN transaction_type DROP DEFAULT;
+                ALTER TABLE coin_transactions
+                ALTER COLUMN transaction_type TYPE VARCHAR USING UPPER(transaction_type::text);
+            END IF;
+        END $$
+        """,
+        "UPDATE coin_transactions SET transaction_type = UPPER(transaction_type) WHERE transaction_type <> UPPER(transaction_type)",
+        "UPDATE coin_transactions SET transaction_type = 'BUY' WHERE transaction_type IS NULL OR transaction_type = ''",
+        "ALTER TABLE coin_transactions ALTER COLUMN transaction_type SET DEFAULT 'BUY'",
+        "DROP TYPE IF EXISTS transactiontype",
+    ),
+)
+
+# Дубликаты позиций (гонки при одновременных покупках) сливаются в одну:
+# количество и сумма складываются, средняя цена пересчитывается как взвешенная
+MERGE_DUPLICATE_POSITIONS_SQL = (
+    "LOCK TABLE user_portfolio IN SHARE ROW EXCLUSIVE MODE",
+    """
+    WITH groups AS (
+        SELECT user_id, symbol,
+               MIN(id) AS keep_id,
+               SUM(total_quantity) AS total_quantity,
+               SUM(total_spent) AS total_spent,
+               SUM(avg_price * total_quantity) AS total_cost,
+               MAX(last_updated) AS last_updated
+        FROM user_portfolio
+        GROUP BY user_id, symbol
+        HAVING COUNT(*) > 1
+    ), merged AS (
+        UPDATE user_portfolio p
+        SET total_quantity = g.total_quantity,
+            total_spent = g.total_spent,
+            avg_price = CASE WHEN g.total_quantity > 0 THEN g.total_cost / g.total_quantity ELSE p.avg_price END,
+            last_updated = g.last_updated
+        FROM groups g
+        WHERE p.id = g.keep_id
+        RETURNING p.id
+    )
+    DELETE FROM user_portfolio p
+    USING groups g
+    WHERE p.user_id = g.user_id AND p.symbol = g.symbol AND p.id <> g.keep_id
+    """,
+)
+
+MERGE_DUPLICATE_POSITIONS = Migration(
+    version=3,
+    name="user_portfolio: merge duplicate positions",
+    statements=MERGE_DUPLICATE_POSITIONS_SQL,
+)
+
+# Ограничение, на которое опирается INSERT ... ON CONFLICT в apply_buy.
+# Индекс строится онлайн, затем подключается как ограничение без перестроения
+ATTACH_POSITION_CONSTRAINT = Migration(
+    version=5,
+    name="user_portfolio: attach uq_user_portfolio_user_symbol",
+    statements=(
+        """
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_user_portfolio_user_symbol') THEN
+                ALTER TABLE user_portfolio
+                ADD CONSTRAINT uq_user_portfolio_user_symbol UNIQUE USING INDEX uq_user_portfolio_user_symbol;
+            END IF;
+        END $$
+        """,
+    ),
+)
+
+# Кэш монет читается по cache_type с сортировкой по рангу: один составной
+# индекс вместо двух одиночных из scripts/migrate_add_coin_cache.py
+COIN_CACHE_INDEX = Migration(
+    version=7,
+    name="coin_cache (cache_type, market_cap_rank) index",
+    statements=(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_coin_cache_type_rank ON coin_cache (cache_type, market_cap_rank)",
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_coin_cache_type",
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_coin_cache_rank",
+    ),
+    transactional=False,
+    indexes=("ix_coin_cache_type_rank",),
+)
+
+# Лидеры роста пересекаются с топом: ключ кэша - монета в списке, чтобы
+# пакетный upsert одного списка не перезаписывал строки другого
+COIN_CACHE_PRIMARY_KEY = Migration(
+    version=8,
+    name="coin_cache primary key (id, cache_type)",
+    statements=(
+        "UPDATE coin_cache SET cache_type = 'top_coins' WHERE cache_type IS NULL",
+        "ALTER TABLE coin_cache ALTER COLUMN cache_type SET NOT NULL",
+        "ALTER TABLE coin_cache DROP CONSTRAINT IF EXISTS coin_cache_pkey",
+        "ALTER TABLE coin_cache ADD CONSTRAINT coin_cache_pkey PRIMARY KEY (id, cache_type)",
+    ),
+)
+
+# Поколения кэша монет: свежесть и ETag без чтения coin_cache.
+# Существующие списки получают первое поколение по последнему обновлению
+COIN_CACHE_META = Migration(
+    version=9,
+    name="coin_cache_meta",
+    statements=(
+        """
+        CREATE TABLE IF NOT EXISTS coin_cache_meta (
+            cache_type VARCHAR PRIMARY KEY,
+            generation BIGINT NOT NULL,
+            refreshed_at TIMESTAMP NOT NULL,
+            source VARCHAR,
+            row_count INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        INSERT INTO coin_cache_meta (cache_type, generation, refreshed_at, row_count)
+        SELECT cache_type, 1, MAX(last_updated), COUNT(*)
+        FROM coin_cache
+        WHERE last_updated IS NOT NULL
+        GROUP BY cache_type
+        ON CONFLICT (cache_type) DO NOTHING
+        """,
+    ),
+)
+
+# Дневные снимки стоимости портфелей: история читается готовыми строками,
+# без пересчета транзакций по историческим ценам на каждый запрос
+PORTFOLIO_SNAPSHOTS = Migration(
+    version=10,
+    name="portfolio_snapshots",
+    statements=(
+        """
+        CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            snapshot_date DATE NOT NULL,
+            total_value NUMERIC NOT NULL,
+            cost_basis NUMERIC NOT NULL,
+            positions JSONB NOT NULL,
+            created_at TIMESTAMP,
+            PRIMARY KEY (user_id, snapshot_date)
+        )
+        """,
+    ),
+)
+
+MIGRATIONS = [
+    BASELINE,
+    TRANSACTION_TYPE,
+    MERGE_DUPLICATE_POSITIONS,
+    # Дубликат, вставленный после миграции 3, сливается повторно перед построением
+    concurrent_index(
+        4, "user_portfolio (user_id, symbol) unique index",
+        "uq_user_portfolio_user_symbol", "user_portfolio", "user_id, symbol", unique=True,
+        prepare=MERGE_DUPLICATE_POSITIONS_SQL,
+    ),
+    ATTACH_POSITION_CONSTRAINT,
+    # История операций пользователя: WHERE user_id = ? ORDER BY timestamp DESC, id DESC
+    # (обратный проход по индексу)
+    concurrent_index(
+        6, "coin_transactions (user_id, timestamp) index",
+        "ix_coin_transactions_user_timestamp", "coin_transactions", "user_id, \"timestamp\", id",
+    ),
+    COIN_CACHE_INDEX,
+    COIN_CACHE_PRIMARY_KEY,
+    COIN_CACHE_META,
+    PORTFOLIO_SNAPSHOTS,
+    # Пользователи со снимком за дату: нулевой снимок тем, кто продал все
+    concurrent_index(
+        11, "portfolio_snapshots (snapshot_date) index",
+        "ix_portfolio_snapshots_date", "portfolio_snapshots", "snapshot_date",
+    ),
+]
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, BigInteger, TIMESTAMP, Enum, Float
+from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, BigInteger, TIMESTAMP, Date, Enum, Float, UniqueConstraint, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -25,6 +26,10 @@ class User(Base):
 
 class UserPortfolio(Base):
     __tablename__ = 'user_portfolio'
+    __table_args__ = (
+        # Одна позиция на монету: покупки и продажи применяются через ON CONFLICT
+        UniqueConstraint('user_id', 'symbol', name='uq_user_portfolio_user_symbol'),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -41,6 +46,10 @@ class UserPortfolio(Base):
 
 class CoinTransaction(Base):
     __tablename__ = 'coin_transactions'
+    __table_args__ = (
+        # История операций пользователя, новые первыми (миграция 0006)
+        Index('ix_coin_transactions_user_timestamp', 'user_id', 'timestamp', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -58,6 +67,9 @@ class CoinTransaction(Base):
 class CoinCache(Base):
     """Кэш для топ монет"""
     __tablename__ = 'coin_cache'
+    __table_args__ = (
+        Index('ix_coin_cache_type_rank', 'cache_type', 'market_cap_rank'),
+    )
 
     id = Column(String, primary_key=True)  # coin_id из CoinGecko
     symbol = Column(String, nullable=False)
@@ -69,4 +81,55 @@ class CoinCache(Base):
     image = Column(String, nullable=True)
     total_volume = Column(Float, nullable=True)
     last_updated = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
-    cache_type = Column(String, default='top_coins')  # 'top_coins' или 'growth_leaders' 
\ No newline at end of file
+    cache_type = Column(String, primary_key=True, default='top_coins')  # 'top_coins' или 'growth_leaders'; монета может быть в обоих
+
+class CoinCacheMeta(Base):
+    """Поколение каждого списка coin_cache (пишется вместе с обновлением кэша)"""
+    __tablename__ = 'coin_cache_meta'
+
+    cache_type = Column(String, primary_key=True)
+    generation = Column(BigInteger, nullable=False)
+    refreshed_at = Column(TIMESTAMP, nullable=False)
+    source = Column(String, nullable=True)  # провайдер: 'coingecko' / 'coinmarketcap'
+    row_count = Column(Integer, nullable=False, default=0)
+
+
+class CoinDirectory(Base):
+    """Справочник монет: символ -> идентификаторы у провайдеров"""
+    __tablename__ = 'coin_directory'
+
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, nullable=False, index=True)
+    name = Column(String, nullable=False)
+    coingecko_id = Column(String, unique=True, nullable=False)  # slug CoinGecko ('bitcoin')
+    cmc_id = Column(Integer, nullable=True)                     # числовой id CoinMarketCap
+    rank = Column(Integer, nullable=True)                       # рейтинг по капитализации
+    last_updated = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CoinPrice(Base):
+    """Общая таблица текущих цен (пишет только фоновый PriceRefresher)"""
+    __tablename__ = 'coin_prices'
+
+    symbol = Column(String, primary_key=True)  # символ в нижнем регистре
+    price = Column(Numeric, nullable=False)
+    source = Column(String, nullable=True)     # 'coingecko' / 'coinmarketcap'
+    last_updated = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class PortfolioSnapshot(Base):
+    """Дневной снимок стоимости портфеля (пишет фоновая задача, читает история)"""
+    __tablename__ = 'portfolio_snapshots'
+    __table_args__ = (
+        # Кто имел снимок за вчера/сегодня - нулевые снимки после продажи всего (миграция 0011)
+        Index('ix_portfolio_snapshots_date', 'snapshot_date'),
+    )
+
+    # Ключ (user_id, snapshot_date) - индекс для истории пользователя по датам
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    snapshot_date = Column(Date, primary_key=True)
+    total_value = Column(Numeric, nullable=False)  # USD по ценам дня
+    cost_basis = Column(Numeric, nullable=False)   # сумма total_spent позиций
+    positions = Column(JSONB, nullable=False)      # [{symbol, quantity, price, value, cost_basis}]
+    created_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+
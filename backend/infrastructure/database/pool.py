@@ -0,0 +1,175 @@
+"""
+Настройки и мониторинг пула соединений с БД
+
+Пул задается через Settings (DB_POOL_*). Режимы совместимости с pgbouncer:
+- session: обычный пул, pgbouncer в session-режиме ничего не требует;
+- transaction: pgbouncer в transaction-режиме - кэши подготовленных
+  выражений asyncpg отключены, имена выражений уникальны;
+- без пула (DB_POOL_MODE=null): соединения держит только pgbouncer.
+
+Мониторинг считает выдачи соединений, переполнение, таймауты и гистограмму
+ожидания свободного соединения - исчерпание пула видно в /admin/db-pool.
+"""
+import time
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+from shared.config import settings
+
+# Границы корзин гистограммы ожидания соединения, мс
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolMonitor:
+    """Счетчики пула соединений и гистограмма ожидания выдачи"""
+
+    def __init__(self, buckets_ms=WAIT_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self.reset()
+
+    def reset(self):
+        self.wait_histogram: List[int] = [0] * (len(self.buckets_ms) + 1)
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def observe_wait(self, wait_ms: float):
+        for index, bound in enumerate(self.buckets_ms):
+            if wait_ms <= bound:
+                self.wait_histogram[index] += 1
+                break
+        else:
+            self.wait_histogram[-1] += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def histogram(self) -> Dict[str, int]:
+        labels = [f"<={bound}ms" for bound in self.buckets_ms] + [f">{self.buckets_ms[-1]}ms"]
+        return dict(zip(labels, self.wait_histogram))
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sum(self.wait_histogram)
+        return {
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait_ms / waits, 3) if waits else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 3),
+            "wait_histogram": self.histogram(),
+        }
+
+
+pool_monitor = PoolMonitor()
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Пул приложения с замером времени ожидания свободного соединения"""
+
+    monitor: PoolMonitor = pool_monitor
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.monitor.timeouts += 1
+            raise
+        finally:
+            self.monitor.observe_wait((time.perf_counter() - started) * 1000)
+
+
+replica_pool_monitor = PoolMonitor()
+
+
+class ReplicaAsyncQueuePool(InstrumentedAsyncQueuePool):
+    """Пул реплики для чтения - свои счетчики"""
+
+    monitor: PoolMonitor = replica_pool_monitor
+
+
+def _prepared_statement_name() -> str:
+    return f"__asyncpg_{uuid4()}__"
+
+
+def async_engine_options(poolclass: type = InstrumentedAsyncQueuePool) -> Dict[str, Any]:
+    """Параметры create_async_engine по настройкам DB_POOL_* и DB_PGBOUNCER_MODE"""
+    options: Dict[str, Any] = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    connect_args: Dict[str, Any] = {
+        "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    }
+
+    if settings.DB_PGBOUNCER_MODE == "transaction":
+        # Подготовленные выражения не переживают смену серверного соединения
+        connect_args.update({
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": _prepared_statement_name,
+        })
+
+    if settings.DB_POOL_MODE == "null":
+        options["poolclass"] = NullPool
+    else:
+        options.update({
+            "poolclass": poolclass,
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+            "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+            "pool_use_lifo": settings.DB_POOL_USE_LIFO,
+        })
+
+    options["connect_args"] = connect_args
+    return options
+
+
+def instrument_pool(engine: Engine, monitor: PoolMonitor = pool_monitor):
+    """Подписать монитор на события пула (sync_engine для AsyncEngine)"""
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        monitor.connects += 1
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        monitor.checkouts += 1
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        monitor.checkins += 1
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        monitor.invalidations += 1
+
+
+def pool_stats(engine: Engine, monitor: Optional[PoolMonitor] = pool_monitor) -> Dict[str, Any]:
+    """Текущее состояние пула и накопленные счетчики"""
+    pool = engine.pool
+    state: Dict[str, Any] = {
+        "mode": settings.DB_POOL_MODE,
+        "pgbouncer_mode": settings.DB_PGBOUNCER_MODE or None,
+        "pool_class": type(pool).__name__,
+        "status": pool.status(),
+    }
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        state.update({
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "timeout_seconds": pool.timeout(),
+        })
+    if monitor is not None:
+        state.update(monitor.stats())
+    return state
@@ -0,0 +1,167 @@
+"""
+Маршрутизация чтения на реплику (READ_DATABASE_URL)
+
+Эндпоинты только для чтения берут сессию через get_read_session. Она
+открывается на реплике, если реплика здорова и отстает не больше
+READ_REPLICA_MAX_LAG_SECONDS, иначе - на основной БД:
+- отставание проверяется запросом к реплике не чаще раза в
+  READ_REPLICA_CHECK_INTERVAL_SECONDS;
+- ошибка соединения с репликой (событие handle_error) выключает ее до
+  следующей успешной проверки. Соединение берется до передачи сессии
+  эндпоинту: если реплика не отвечает, тот же запрос получает сессию
+  основной БД. Обрыв уже во время запроса эндпоинта по-прежнему приводит
+  к ошибке этого запроса, следующие идут в основную БД;
+- после покупки/продажи чтение этого пользователя READ_REPLICA_MAX_LAG_SECONDS
+  идет в основную БД, чтобы он сразу видел свою сделку.
+"""
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request
+from sqlalchemy import event, exc, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shared.config import settings
+from .connection import AsyncSessionLocal, ReadSessionLocal, read_engine
+
+# Реплика, которая догнала основную БД, отстает на 0, даже если записей давно не было
+REPLICA_LAG_QUERY = text("""
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+""")
+
+SessionFactory = Callable[[], AsyncSession]
+
+
+class ReadReplica:
+    """Выбор фабрики сессий для чтения: реплика или основная БД"""
+
+    def __init__(self, replica_factory: Optional[SessionFactory], primary_factory: SessionFactory,
+                 max_lag_seconds: float = 5, check_interval_seconds: float = 5,
+                 clock: Callable[[], float] = time.monotonic):
+        self.replica_factory = replica_factory
+        self.primary_factory = primary_factory
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval_seconds = check_interval_seconds
+        self._clock = clock
+
+        self.healthy = replica_factory is not None
+        self.lag_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._checked_at: Optional[float] = None
+        self._recent_writers: Dict[int, float] = {}
+
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.primary_retries = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.replica_factory is not None
+
+    async def check(self) -> bool:
+        """Проверить доступность и отставание реплики"""
+        self._checked_at = self._clock()
+        try:
+            async with self.replica_factory() as session:
+                lag = (await session.execute(REPLICA_LAG_QUERY)).scalar()
+        except Exception as e:
+            self.mark_failed(e)
+            return False
+        self.lag_seconds = float(lag or 0)
+        self.healthy = self.lag_seconds <= self.max_lag_seconds
+        if not self.healthy:
+            print(f"⚠️ Реплика отстает на {self.lag_seconds:.1f}с, чтение идет в основную БД")
+        return self.healthy
+
+    def mark_failed(self, error: BaseException):
+        if self.healthy:
+            print(f"❌ Реплика недоступна, чтение идет в основную БД: {error}")
+        self.healthy = False
+        self.failures += 1
+        self.last_error = str(error)
+        self._checked_at = self._clock()
+
+    def mark_written(self, telegram_id: int):
+        """Пользователь только что записал данные - читать его из основной БД"""
+        if not self.enabled:
+            return
+        now = self._clock()
+        self._recent_writers = {user: until for user, until in self._recent_writers.items() if until > now}
+        self._recent_writers[telegram_id] = now + self.max_lag_seconds
+
+    def recently_written(self, telegram_id: Optional[int]) -> bool:
+        until = self._recent_writers.get(telegram_id) if telegram_id is not None else None
+        return until is not None and until > self._clock()
+
+    async def choose(self, telegram_id: Optional[int] = None) -> Tuple[SessionFactory, bool]:
+        """Фабрика сессий для чтения и признак, что это реплика"""
+        if self.enabled and not self.recently_written(telegram_id):
+            if self._checked_at is None or self._clock() - self._checked_at >= self.check_interval_seconds:
+                await self.check()
+            if self.healthy:
+                self.replica_reads += 1
+                return self.replica_factory, True
+        self.primary_reads += 1
+        return self.primary_factory, False
+
+    async def open_session(self, telegram_id: Optional[int] = None) -> AsyncSession:
+        """Сессия для чтения; на реплике - с уже взятым соединением
+
+        Если соединиться с репликой не удалось, она выключается, а сессия
+        открывается на основной БД.
+        """
+        factory, is_replica = await self.choose(telegram_id)
+        session = factory()
+        if not is_replica:
+            return session
+        try:
+            await session.connection()
+        except (exc.DBAPIError, OSError) as e:
+            await session.close()
+            if self.healthy:
+                self.mark_failed(e)
+            self.primary_retries += 1
+            return self.primary_factory()
+        return session
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "primary_retries": self.primary_retries,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+read_replica = ReadReplica(
+    ReadSessionLocal,
+    AsyncSessionLocal,
+    max_lag_seconds=settings.READ_REPLICA_MAX_LAG_SECONDS,
+    check_interval_seconds=settings.READ_REPLICA_CHECK_INTERVAL_SECONDS,
+)
+
+
+if read_engine is not None:
+    @event.listens_for(read_engine.sync_engine, "handle_error")
+    def _on_replica_error(context):
+        # Ошибки SQL (нет строки, нарушение ограничения) реплику не выключают
+        if context.is_disconnect or context.connection is None:
+            read_replica.mark_failed(context.original_exception)
+
+
+async def get_read_session(request: Request):
+    """Сессия для эндпоинтов только для чтения"""
+    telegram_id = request.path_params.get("telegram_id")
+    session = await read_replica.open_session(int(telegram_id) if telegram_id is not None else None)
+    async with session:
+        yield session
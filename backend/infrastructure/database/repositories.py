@@ -1,16 +1,34 @@
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, delete, func, tuple_, values, column, Integer, Numeric, TIMESTAMP
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from decimal import Decimal
-from datetime import datetime
+from datetime import date, datetime
 
-from domain.entities.user import User as UserEntity, UserPortfolio as PortfolioEntity, CoinTransaction as TransactionEntity, TransactionType
-from domain.repositories.user_repository import UserRepository, PortfolioRepository, TransactionRepository
-from .models import User, UserPortfolio, CoinTransaction, TransactionType as DBTransactionType, CoinCache
+from domain.entities.user import User as UserEntity, UserPortfolio as PortfolioEntity, CoinTransaction as TransactionEntity, TransactionType, TransactionCursor, CoinPrice as PriceEntity, PortfolioSnapshot as SnapshotEntity, SnapshotPosition
+from domain.repositories.user_repository import UserRepository, PortfolioRepository, TransactionRepository, PriceRepository, PortfolioSnapshotRepository
+from .models import User, UserPortfolio, CoinTransaction, CoinCache, CoinCacheMeta, CoinDirectory, CoinPrice, PortfolioSnapshot
+from .cache_generations import CacheGeneration, cache_generations
 
-class SQLAlchemyUserRepository(UserRepository):
-    def __init__(self, session: AsyncSession):
+class SessionRepository:
+    """Общая часть репозиториев на AsyncSession
+
+    autocommit=True - каждая запись фиксируется сразу (отдельные вызовы);
+    autocommit=False - только flush, фиксирует единица работы (UnitOfWork).
+    """
+
+    def __init__(self, session: AsyncSession, autocommit: bool = True):
         self.session = session
+        self.autocommit = autocommit
+
+    async def _save(self):
+        if self.autocommit:
+            await self.session.commit()
+        else:
+            await self.session.flush()
+
+
+class SQLAlchemyUserRepository(SessionRepository, UserRepository):
 
     async def get_by_telegram_id(self, telegram_id: int) -> Optional[UserEntity]:
         result = await self.session.execute(
@@ -31,8 +49,7 @@ class SQLAlchemyUserRepository(UserRepository):
             balance=user.balance
         )
         self.session.add(db_user)
-        await self.session.commit()
-        await self.session.refresh(db_user)
+        await self._save()
         return UserEntity(
             id=db_user.id,
             telegram_id=db_user.telegram_id,
@@ -40,14 +57,10 @@ class SQLAlchemyUserRepository(UserRepository):
         )
 
     async def update(self, user: UserEntity) -> UserEntity:
-        result = await self.session.execute(
-            select(User).where(User.id == user.id)
-        )
-        db_user = result.scalar_one_or_none()
+        db_user = await self.session.get(User, user.id)
         if db_user:
             db_user.balance = user.balance
-            await self.session.commit()
-            await self.session.refresh(db_user)
+            await self._save()
             return UserEntity(
                 id=db_user.id,
                 telegram_id=db_user.telegram_id,
@@ -55,9 +68,7 @@ class SQLAlchemyUserRepository(UserRepository):
             )
         return user
 
-class SQLAlchemyPortfolioRepository(PortfolioRepository):
-    def __init__(self, session: AsyncSession):
-        self.session = session
+class SQLAlchemyPortfolioRepository(SessionRepository, PortfolioRepository):
 
     async def get_user_portfolio(self, user_id: int) -> List[PortfolioEntity]:
         result = await self.session.execute(
@@ -91,8 +102,7 @@ class SQLAlchemyPortfolioRepository(PortfolioRepository):
             last_updated=portfolio_item.last_updated or datetime.utcnow()
         )
         self.session.add(db_item)
-        await self.session.commit()
-        await self.session.refresh(db_item)
+        await self._save()
         return PortfolioEntity(
             id=db_item.id,
             user_id=db_item.user_id,
@@ -106,18 +116,15 @@ class SQLAlchemyPortfolioRepository(PortfolioRepository):
         )
 
     async def update_portfolio_item(self, portfolio_item: PortfolioEntity) -> PortfolioEntity:
-        result = await self.session.execute(
-            select(UserPortfolio).where(UserPortfolio.id == portfolio_item.id)
-        )
-        db_item = result.scalar_one_or_none()
+        # session.get не делает запрос, если строка еще в identity map сессии
+        db_item = await self.session.get(UserPortfolio, portfolio_item.id)
         if db_item:
             db_item.total_quantity = portfolio_item.total_quantity
             db_item.avg_price = portfolio_item.avg_price
             db_item.current_price = portfolio_item.current_price
             db_item.total_spent = portfolio_item.total_spent
             db_item.last_updated = portfolio_item.last_updated or datetime.utcnow()
-            await self.session.commit()
-            await self.session.refresh(db_item)
+            await self._save()
             return PortfolioEntity(
                 id=db_item.id,
                 user_id=db_item.user_id,
@@ -161,126 +168,232 @@ class SQLAlchemyPortfolioRepository(PortfolioRepository):
         """Получить конкретную монету из портфеля (алиас для get_by_symbol)"""
         return await self.get_by_symbol(user_id, symbol)
     
+    async def get_held_symbols(self) -> List[str]:
+        """Все различные символы, которые есть в портфелях пользователей"""
+        result = await self.session.execute(
+            select(func.lower(UserPortfolio.symbol)).distinct()
+        )
+        return [symbol for symbol in result.scalars().all() if symbol]
+    
     async def delete_portfolio_item(self, portfolio_item_id: int) -> bool:
         """Удалить элемент из портфеля"""
         try:
-            result = await self.session.execute(
-                select(UserPortfolio).where(UserPortfolio.id == portfolio_item_id)
-            )
-            db_item = result.scalar_one_or_none()
+            db_item = await self.session.get(UserPortfolio, portfolio_item_id)
             if db_item:
                 await self.session.delete(db_item)
-                await self.session.commit()
+                await self._save()
                 return True
             return False
         except Exception as e:
             print(f"Ошибка при удалении элемента портфеля: {e}")
+            if not self.autocommit:
+                # Внутри единицы работы ошибка должна откатить всю транзакцию
+                raise
             return False
 
-class SQLAlchemyTransactionRepository(TransactionRepository):
-    def __init__(self, session: AsyncSession):
-        self.session = session
+    PRICE_UPDATE_CHUNK_SIZE = 500
 
-    async def create_transaction(self, transaction: TransactionEntity) -> TransactionEntity:
-        # Преобразуем доменный тип в строку для БД
-        db_transaction_type = "BUY" if transaction.transaction_type == TransactionType.BUY else "SELL"
-        
-        # Создаем транзакцию с обработкой случая, когда колонка может не существовать
-        transaction_data = {
-            'user_id': transaction.user_id,
-            'symbol': transaction.symbol,
-            'name': transaction.name,
-            'quantity': transaction.quantity,
-            'price': transaction.price,
-            'total_spent': transaction.total_spent,
-            'timestamp': transaction.timestamp or datetime.utcnow()
-        }
-        
-        # Добавляем transaction_type только если колонка существует
-        try:
-            transaction_data['transaction_type'] = db_transaction_type
-            db_transaction = CoinTransaction(**transaction_data)
-        except Exception as e:
-            print(f"Создаем транзакцию без типа (старая схема БД): {e}")
-            # Убираем transaction_type для совместимости со старой схемой
-            del transaction_data['transaction_type']
-            db_transaction = CoinTransaction(**transaction_data)
-        self.session.add(db_transaction)
-        await self.session.commit()
-        await self.session.refresh(db_transaction)
-        # Преобразуем тип БД обратно в доменный тип
-        domain_transaction_type = TransactionType.BUY
-        if hasattr(db_transaction, 'transaction_type') and db_transaction.transaction_type:
-            domain_transaction_type = TransactionType.BUY if db_transaction.transaction_type == "BUY" else TransactionType.SELL
-        
-        return TransactionEntity(
-            id=db_transaction.id,
-            user_id=db_transaction.user_id,
-            symbol=db_transaction.symbol,
-            name=db_transaction.name,
-            quantity=db_transaction.quantity,
-            price=db_transaction.price,
-            total_spent=db_transaction.total_spent,
-            transaction_type=domain_transaction_type,
-            timestamp=db_transaction.timestamp
+    async def update_current_prices(self, portfolio_items: List[PortfolioEntity]) -> int:
+        """Цены позиций одним UPDATE ... FROM (VALUES ...) и одним commit"""
+        rows = [
+            (item.id, item.current_price, item.last_updated or datetime.utcnow())
+            for item in portfolio_items
+            if item.id is not None
+        ]
+        if not rows:
+            return 0
+        table = UserPortfolio.__table__
+        for start in range(0, len(rows), self.PRICE_UPDATE_CHUNK_SIZE):
+            prices = values(
+                column('id', Integer),
+                column('current_price', Numeric),
+                column('last_updated', TIMESTAMP),
+                name='prices'
+            ).data(rows[start:start + self.PRICE_UPDATE_CHUNK_SIZE])
+            await self.session.execute(
+                update(table)
+                .where(table.c.id == prices.c.id)
+                .values(current_price=prices.c.current_price, last_updated=prices.c.last_updated)
+            )
+        await self._save()
+        return len(rows)
+
+    @staticmethod
+    def _position_entity(row) -> PortfolioEntity:
+        return PortfolioEntity(
+            id=row.id,
+            user_id=row.user_id,
+            symbol=row.symbol,
+            name=row.name,
+            total_quantity=row.total_quantity,
+            avg_price=row.avg_price,
+            current_price=row.current_price or Decimal('0'),
+            total_spent=row.total_spent,
+            last_updated=row.last_updated
         )
 
-    async def get_user_transactions(self, user_id: int) -> List[TransactionEntity]:
-        # Проверяем, существует ли колонка transaction_type
+    async def apply_buy(self, user_id: int, symbol: str, name: str,
+                        quantity: Decimal, price: Decimal) -> PortfolioEntity:
+        """Покупка одним INSERT ... ON CONFLICT DO UPDATE: средняя цена считается в SQL"""
+        table = UserPortfolio.__table__
+        stmt = pg_insert(table).values(
+            user_id=user_id,
+            symbol=symbol,
+            name=name,
+            total_quantity=quantity,
+            avg_price=price,
+            current_price=Decimal('0'),
+            total_spent=quantity * price,
+            last_updated=datetime.utcnow()
+        )
+        new_quantity = table.c.total_quantity + stmt.excluded.total_quantity
+        stmt = stmt.on_conflict_do_update(
+            constraint='uq_user_portfolio_user_symbol',
+            set_={
+                'name': stmt.excluded.name,
+                'total_quantity': new_quantity,
+                # Взвешенная средняя: (старая стоимость + стоимость покупки) / новое количество
+                'avg_price': (
+                    table.c.avg_price * table.c.total_quantity + stmt.excluded.total_spent
+                ) / func.nullif(new_quantity, 0),
+                'total_spent': table.c.total_spent + stmt.excluded.total_spent,
+                'last_updated': stmt.excluded.last_updated
+            }
+        ).returning(*table.c)
+        row = (await self.session.execute(stmt)).one()
+        await self._save()
+        return self._position_entity(row)
+
+    async def apply_sell(self, user_id: int, symbol: str, quantity: Decimal) -> Optional[PortfolioEntity]:
+        """Продажа одним условным UPDATE; проданная целиком позиция удаляется"""
+        table = UserPortfolio.__table__
+        stmt = (
+            update(table)
+            .where(
+                table.c.user_id == user_id,
+                table.c.symbol == symbol,
+                table.c.total_quantity >= quantity
+            )
+            .values(
+                total_quantity=table.c.total_quantity - quantity,
+                # Средняя цена покупки не меняется, списывается себестоимость проданного
+                total_spent=table.c.total_spent - table.c.avg_price * quantity,
+                last_updated=datetime.utcnow()
+            )
+            .returning(*table.c)
+        )
+        row = (await self.session.execute(stmt)).one_or_none()
+        if row is None:
+            return None
+        if row.total_quantity == 0:
+            await self.session.execute(
+                delete(table).where(table.c.id == row.id, table.c.total_quantity == 0)
+            )
+        await self._save()
+        return self._position_entity(row)
+
+    async def stream_positions(self, batch_size: int = 1000) -> AsyncIterator[PortfolioEntity]:
+        query = (
+            select(UserPortfolio)
+            .where(UserPortfolio.total_quantity > 0)
+            .order_by(UserPortfolio.user_id, UserPortfolio.id)
+        )
+        # Один проход по всем портфелям без загрузки таблицы в память
+        result = await self.session.stream_scalars(query.execution_options(yield_per=batch_size))
         try:
-            # Пытаемся выполнить запрос с transaction_type
-            result = await self.session.execute(
-                select(CoinTransaction).where(CoinTransaction.user_id == user_id)
-                .order_by(CoinTransaction.timestamp.desc())
+            async for partition in result.partitions():
+                for item in partition:
+                    yield self._position_entity(item)
+        finally:
+            await result.close()
+
+class SQLAlchemyTransactionRepository(SessionRepository, TransactionRepository):
+
+    async def create_transaction(self, transaction: TransactionEntity) -> TransactionEntity:
+        db_transaction = CoinTransaction(
+            user_id=transaction.user_id,
+            symbol=transaction.symbol,
+            name=transaction.name,
+            quantity=transaction.quantity,
+            price=transaction.price,
+            total_spent=transaction.total_spent,
+            transaction_type=transaction.transaction_type.value,
+            timestamp=transaction.timestamp or datetime.utcnow()
+        )
+        self.session.add(db_transaction)
+        await self._save()
+        return self._to_entity(db_transaction)
+
+    async def get_user_transactions(self, user_id: int, limit: Optional[int] = None,
+                                    cursor: Optional[TransactionCursor] = None,
+                                    symbol: Optional[str] = None,
+                                    transaction_type: Optional[TransactionType] = None,
+                                    since: Optional[datetime] = None,
+                                    until: Optional[datetime] = None) -> List[TransactionEntity]:
+        # Порядок и курсор совпадают с индексом ix_coin_transactions_user_timestamp
+        query = select(CoinTransaction).where(CoinTransaction.user_id == user_id)
+        if cursor is not None:
+            query = query.where(
+                tuple_(CoinTransaction.timestamp, CoinTransaction.id) < tuple_(cursor.timestamp, cursor.id)
             )
-            transactions = result.scalars().all()
-            return [
-                TransactionEntity(
-                    id=tx.id,
-                    user_id=tx.user_id,
-                    symbol=tx.symbol,
-                    name=tx.name,
-                    quantity=tx.quantity,
-                    price=tx.price,
-                    total_spent=tx.total_spent,
-                    transaction_type=TransactionType.SELL if (hasattr(tx, 'transaction_type') and tx.transaction_type == "SELL") else TransactionType.BUY,
-                    timestamp=tx.timestamp
-                )
-                for tx in transactions
-            ]
-        except Exception as e:
-            if "transaction_type does not exist" in str(e):
-                print("Колонка transaction_type не существует, используем старую схему")
-                # Выполняем запрос без transaction_type
-                result = await self.session.execute(
-                    select(CoinTransaction.id, CoinTransaction.user_id, CoinTransaction.symbol, 
-                          CoinTransaction.name, CoinTransaction.quantity, CoinTransaction.price,
-                          CoinTransaction.total_spent, CoinTransaction.timestamp)
-                    .where(CoinTransaction.user_id == user_id)
-                    .order_by(CoinTransaction.timestamp.desc())
-                )
-                transactions = result.all()
-                return [
-                    TransactionEntity(
-                        id=tx.id,
-                        user_id=tx.user_id,
-                        symbol=tx.symbol,
-                        name=tx.name,
-                        quantity=tx.quantity,
-                        price=tx.price,
-                        total_spent=tx.total_spent,
-                        transaction_type=TransactionType.BUY,  # Все старые транзакции считаем покупками
-                        timestamp=tx.timestamp
-                    )
-                    for tx in transactions
-                ] 
-            else:
-                raise
+        if symbol:
+            query = query.where(CoinTransaction.symbol == symbol.upper())
+        if transaction_type is not None:
+            query = query.where(CoinTransaction.transaction_type == transaction_type.value)
+        if since is not None:
+            query = query.where(CoinTransaction.timestamp >= since)
+        if until is not None:
+            query = query.where(CoinTransaction.timestamp < until)
+        query = query.order_by(CoinTransaction.timestamp.desc(), CoinTransaction.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+
+        result = await self.session.execute(query)
+        return [self._to_entity(tx) for tx in result.scalars().all()]
+
+    async def stream_transactions(self, user_id: Optional[int] = None,
+                                  since: Optional[datetime] = None,
+                                  until: Optional[datetime] = None,
+                                  batch_size: int = 1000) -> AsyncIterator[TransactionEntity]:
+        query = select(CoinTransaction)
+        if user_id is not None:
+            query = query.where(CoinTransaction.user_id == user_id).order_by(CoinTransaction.timestamp, CoinTransaction.id)
+        else:
+            query = query.order_by(CoinTransaction.id)
+        if since is not None:
+            query = query.where(CoinTransaction.timestamp >= since)
+        if until is not None:
+            query = query.where(CoinTransaction.timestamp < until)
+
+        # yield_per: серверный курсор asyncpg, строки приходят порциями
+        result = await self.session.stream_scalars(query.execution_options(yield_per=batch_size))
+        try:
+            async for partition in result.partitions():
+                for tx in partition:
+                    yield self._to_entity(tx)
+        finally:
+            await result.close()
+
+    @staticmethod
+    def _to_entity(tx: CoinTransaction) -> TransactionEntity:
+        return TransactionEntity(
+            id=tx.id,
+            user_id=tx.user_id,
+            symbol=tx.symbol,
+            name=tx.name,
+            quantity=tx.quantity,
+            price=tx.price,
+            total_spent=tx.total_spent,
+            transaction_type=TransactionType.SELL if tx.transaction_type == "SELL" else TransactionType.BUY,
+            timestamp=tx.timestamp
+        )
 
 
 class SQLAlchemyCoinCacheRepository:
     """Репозиторий для работы с кэшем монет"""
     
+    CHUNK_SIZE = 500
+    
     def __init__(self, session: AsyncSession):
         self.session = session
     
@@ -308,50 +421,293 @@ class SQLAlchemyCoinCacheRepository:
             for coin in coins
         ]
     
-    async def update_cache(self, coins_data: List[dict], cache_type: str = 'top_coins'):
-        """Обновить кэш монет"""
-        # Сначала удаляем старые данные для этого типа
-        await self.session.execute(
-            select(CoinCache).where(CoinCache.cache_type == cache_type)
-        )
-        existing_coins = (await self.session.execute(
-            select(CoinCache).where(CoinCache.cache_type == cache_type)
-        )).scalars().all()
+    async def update_cache(self, coins_data: List[dict], cache_type: str = 'top_coins',
+                           source: Optional[str] = None) -> Optional[CacheGeneration]:
+        """Обновить кэш монет: пакетный upsert, удаление выпавших монет и новое
+        поколение в coin_cache_meta одной транзакцией
+
+        Читатели видят либо прежний, либо новый набор - пустого кэша посреди
+        обновления нет.
+        """
+        if not coins_data:
+            return None
         
-        for coin in existing_coins:
-            await self.session.delete(coin)
+        now = datetime.utcnow()
+        # Дедупликация: один INSERT ... ON CONFLICT не может обновить строку дважды
+        rows = list({
+            coin_data['id']: {
+                'id': coin_data['id'],
+                'symbol': coin_data['symbol'],
+                'name': coin_data['name'],
+                'current_price': coin_data['current_price'],
+                'market_cap': coin_data.get('market_cap'),
+                'market_cap_rank': coin_data.get('market_cap_rank'),
+                'price_change_percentage_24h': coin_data.get('price_change_percentage_24h'),
+                'image': coin_data.get('image'),
+                'total_volume': coin_data.get('total_volume'),
+                'cache_type': cache_type,
+                'last_updated': now
+            }
+            for coin_data in coins_data
+        }.values())
         
-        # Добавляем новые данные
-        for coin_data in coins_data:
-            cache_coin = CoinCache(
-                id=coin_data['id'],
-                symbol=coin_data['symbol'],
-                name=coin_data['name'],
-                current_price=coin_data['current_price'],
-                market_cap=coin_data.get('market_cap'),
-                market_cap_rank=coin_data.get('market_cap_rank'),
-                price_change_percentage_24h=coin_data.get('price_change_percentage_24h'),
-                image=coin_data.get('image'),
-                total_volume=coin_data.get('total_volume'),
-                cache_type=cache_type,
-                last_updated=datetime.utcnow()
+        for start in range(0, len(rows), self.CHUNK_SIZE):
+            stmt = pg_insert(CoinCache).values(rows[start:start + self.CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[CoinCache.id, CoinCache.cache_type],
+                set_={
+                    name: stmt.excluded[name]
+                    for name in rows[0]
+                    if name not in ('id', 'cache_type')
+                }
             )
-            self.session.add(cache_coin)
+            await self.session.execute(stmt)
         
+        # Монеты, выпавшие из списка, не обновлялись в этом проходе
+        await self.session.execute(
+            delete(CoinCache).where(CoinCache.cache_type == cache_type, CoinCache.last_updated < now)
+        )
+        
+        meta = pg_insert(CoinCacheMeta).values(
+            cache_type=cache_type, generation=1, refreshed_at=now, source=source, row_count=len(rows)
+        )
+        meta = meta.on_conflict_do_update(
+            index_elements=[CoinCacheMeta.cache_type],
+            set_={
+                'generation': CoinCacheMeta.generation + 1,
+                'refreshed_at': meta.excluded.refreshed_at,
+                'source': meta.excluded.source,
+                'row_count': meta.excluded.row_count
+            }
+        ).returning(CoinCacheMeta.generation)
+        generation = (await self.session.execute(meta)).scalar_one()
         await self.session.commit()
+        
+        return cache_generations.update(CacheGeneration(cache_type, generation, now, source, len(rows)))
+    
+    async def get_generation(self, cache_type: str = 'top_coins', reload: bool = False) -> Optional[CacheGeneration]:
+        """Поколение списка: из памяти, а раз в ttl (или при reload) - из coin_cache_meta"""
+        if not reload and not cache_generations.needs_reload(cache_type):
+            return cache_generations.get(cache_type)
+        
+        result = await self.session.execute(
+            select(CoinCacheMeta).where(CoinCacheMeta.cache_type == cache_type)
+        )
+        row = result.scalar_one_or_none()
+        cache_generations.reloads += 1
+        if row is None:
+            return None
+        return cache_generations.update(
+            CacheGeneration(row.cache_type, row.generation, row.refreshed_at, row.source, row.row_count)
+        )
     
     async def is_cache_fresh(self, cache_type: str = 'top_coins', max_age_minutes: int = 5) -> bool:
-        """Проверить, актуален ли кэш"""
+        """Проверить, актуален ли кэш (по поколению, без чтения coin_cache)"""
+        meta = await self.get_generation(cache_type)
+        return meta is not None and meta.age_seconds() < max_age_minutes * 60
+
+class SQLAlchemyCoinDirectoryRepository:
+    """Репозиторий справочника монет (символ -> id у провайдеров)"""
+    
+    CHUNK_SIZE = 1000
+    
+    def __init__(self, session: AsyncSession):
+        self.session = session
+    
+    async def get_all(self) -> List[dict]:
+        """Получить весь справочник"""
         result = await self.session.execute(
-            select(CoinCache)
-            .where(CoinCache.cache_type == cache_type)
-            .limit(1)
+            select(
+                CoinDirectory.symbol,
+                CoinDirectory.name,
+                CoinDirectory.coingecko_id,
+                CoinDirectory.cmc_id,
+                CoinDirectory.rank
+            )
         )
-        coin = result.scalar_one_or_none()
+        return [dict(row._mapping) for row in result.all()]
+    
+    async def get_last_updated(self) -> Optional[datetime]:
+        """Время последнего обновления справочника"""
+        result = await self.session.execute(select(func.max(CoinDirectory.last_updated)))
+        return result.scalar_one_or_none()
+    
+    async def replace_all(self, entries: List[dict]) -> int:
+        """Заменить справочник: пакетный upsert по coingecko_id и удаление исчезнувших монет"""
+        if not entries:
+            return 0
         
-        if not coin:
-            return False
+        now = datetime.utcnow()
+        # Дедупликация: один INSERT ... ON CONFLICT не может обновить строку дважды
+        rows = list({
+            entry['coingecko_id']: {
+                'symbol': entry['symbol'].lower(),
+                'name': entry['name'],
+                'coingecko_id': entry['coingecko_id'],
+                'cmc_id': entry.get('cmc_id'),
+                'rank': entry.get('rank'),
+                'last_updated': now
+            }
+            for entry in entries
+        }.values())
+        
+        for start in range(0, len(rows), self.CHUNK_SIZE):
+            stmt = pg_insert(CoinDirectory).values(rows[start:start + self.CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[CoinDirectory.coingecko_id],
+                set_={
+                    'symbol': stmt.excluded.symbol,
+                    'name': stmt.excluded.name,
+                    'cmc_id': stmt.excluded.cmc_id,
+                    'rank': stmt.excluded.rank,
+                    'last_updated': stmt.excluded.last_updated
+                }
+            )
+            await self.session.execute(stmt)
         
-        from datetime import timedelta
-        age = datetime.utcnow() - coin.last_updated
-        return age < timedelta(minutes=max_age_minutes) 
\ No newline at end of file
+        # Монеты, которых больше нет у провайдера, не обновлялись в этом проходе
+        await self.session.execute(
+            delete(CoinDirectory).where(CoinDirectory.last_updated < now)
+        )
+        await self.session.commit()
+        return len(rows)
+
+
+class SQLAlchemyPriceRepository(PriceRepository):
+    """Репозиторий общей таблицы цен coin_prices"""
+    
+    CHUNK_SIZE = 500
+    
+    def __init__(self, session: AsyncSession):
+        self.session = session
+    
+    async def get_prices(self, symbols: List[str]) -> Dict[str, PriceEntity]:
+        keys = list({symbol.lower() for symbol in symbols})
+        if not keys:
+            return {}
+        result = await self.session.execute(
+            select(CoinPrice).where(CoinPrice.symbol.in_(keys))
+        )
+        return {
+            row.symbol: PriceEntity(
+                symbol=row.symbol,
+                price=row.price,
+                source=row.source,
+                last_updated=row.last_updated
+            )
+            for row in result.scalars().all()
+        }
+    
+    async def upsert_prices(self, prices: Dict[str, float], source: str) -> int:
+        now = datetime.utcnow()
+        normalized = {symbol.lower(): price for symbol, price in prices.items()}
+        rows = [
+            {'symbol': symbol, 'price': Decimal(str(price)), 'source': source, 'last_updated': now}
+            for symbol, price in normalized.items()
+            if price is not None and price > 0
+        ]
+        for start in range(0, len(rows), self.CHUNK_SIZE):
+            stmt = pg_insert(CoinPrice).values(rows[start:start + self.CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[CoinPrice.symbol],
+                set_={
+                    'price': stmt.excluded.price,
+                    'source': stmt.excluded.source,
+                    'last_updated': stmt.excluded.last_updated
+                }
+            )
+            await self.session.execute(stmt)
+        await self.session.commit()
+        return len(rows)
+
+
+class SQLAlchemyPortfolioSnapshotRepository(SessionRepository, PortfolioSnapshotRepository):
+    """Репозиторий дневных снимков стоимости портфелей portfolio_snapshots"""
+
+    CHUNK_SIZE = 500
+
+    async def upsert_snapshots(self, snapshots: List[SnapshotEntity]) -> int:
+        now = datetime.utcnow()
+        rows = [
+            {
+                'user_id': snapshot.user_id,
+                'snapshot_date': snapshot.snapshot_date,
+                'total_value': snapshot.total_value,
+                'cost_basis': snapshot.cost_basis,
+                'positions': [self._position_json(position) for position in snapshot.positions],
+                'created_at': now,
+            }
+            for snapshot in snapshots
+        ]
+        for start in range(0, len(rows), self.CHUNK_SIZE):
+            stmt = pg_insert(PortfolioSnapshot).values(rows[start:start + self.CHUNK_SIZE])
+            # Повторный проход за тот же день перезаписывает снимок (последняя оценка дня)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[PortfolioSnapshot.user_id, PortfolioSnapshot.snapshot_date],
+                set_={
+                    'total_value': stmt.excluded.total_value,
+                    'cost_basis': stmt.excluded.cost_basis,
+                    'positions': stmt.excluded.positions,
+                    'created_at': stmt.excluded.created_at
+                }
+            )
+            await self.session.execute(stmt)
+        if rows:
+            await self._save()
+        return len(rows)
+
+    async def get_history(self, user_id: int, since: Optional[date] = None,
+                          until: Optional[date] = None,
+                          with_positions: bool = True) -> List[SnapshotEntity]:
+        columns = [PortfolioSnapshot.user_id, PortfolioSnapshot.snapshot_date,
+                   PortfolioSnapshot.total_value, PortfolioSnapshot.cost_basis, PortfolioSnapshot.created_at]
+        if with_positions:
+            columns.append(PortfolioSnapshot.positions)
+        query = select(*columns).where(PortfolioSnapshot.user_id == user_id)
+        if since is not None:
+            query = query.where(PortfolioSnapshot.snapshot_date >= since)
+        if until is not None:
+            query = query.where(PortfolioSnapshot.snapshot_date <= until)
+        result = await self.session.execute(query.order_by(PortfolioSnapshot.snapshot_date))
+        return [
+            SnapshotEntity(
+                user_id=row.user_id,
+                snapshot_date=row.snapshot_date,
+                total_value=row.total_value,
+                cost_basis=row.cost_basis,
+                positions=[self._position_entity(position) for position in row.positions] if with_positions else [],
+                created_at=row.created_at
+            )
+            for row in result.all()
+        ]
+
+    async def get_user_ids(self, since: date, until: date) -> List[int]:
+        result = await self.session.execute(
+            select(PortfolioSnapshot.user_id)
+            .where(PortfolioSnapshot.snapshot_date >= since, PortfolioSnapshot.snapshot_date <= until)
+            # Нулевой снимок уже записан - следующий день без пропуска не нужен
+            .where(func.jsonb_array_length(PortfolioSnapshot.positions) > 0)
+            .distinct()
+        )
+        return list(result.scalars().all())
+
+    @staticmethod
+    def _position_json(position: SnapshotPosition) -> dict:
+        # Decimal хранится строкой, чтобы JSON не терял точность
+        return {
+            'symbol': position.symbol,
+            'quantity': str(position.quantity),
+            'price': str(position.price) if position.price is not None else None,
+            'value': str(position.value),
+            'cost_basis': str(position.cost_basis),
+        }
+
+    @staticmethod
+    def _position_entity(data: dict) -> SnapshotPosition:
+        return SnapshotPosition(
+            symbol=data['symbol'],
+            quantity=Decimal(data['quantity']),
+            cost_basis=Decimal(data['cost_basis']),
+            price=Decimal(data['price']) if data.get('price') is not None else None,
+        )
+
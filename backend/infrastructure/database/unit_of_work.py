@@ -0,0 +1,42 @@
+from typing import Callable, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from domain.repositories.unit_of_work import UnitOfWork
+from .connection import AsyncSessionLocal
+from .repositories import SQLAlchemyUserRepository, SQLAlchemyPortfolioRepository, SQLAlchemyTransactionRepository
+
+
+class SQLAlchemyUnitOfWork(UnitOfWork):
+    """Единица работы на одной AsyncSession
+
+    Если сессия передана (зависимость FastAPI), она используется как есть;
+    иначе сессия создается из session_factory и закрывается на выходе.
+    """
+
+    def __init__(self, session: Optional[AsyncSession] = None,
+                 session_factory: Callable[[], AsyncSession] = AsyncSessionLocal):
+        self.session = session
+        self._session_factory = session_factory
+        self._owns_session = session is None
+
+    async def __aenter__(self) -> "SQLAlchemyUnitOfWork":
+        if self.session is None:
+            self.session = self._session_factory()
+        self.users = SQLAlchemyUserRepository(self.session, autocommit=False)
+        self.portfolio = SQLAlchemyPortfolioRepository(self.session, autocommit=False)
+        self.transactions = SQLAlchemyTransactionRepository(self.session, autocommit=False)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            await super().__aexit__(exc_type, exc_val, exc_tb)
+        finally:
+            if self._owns_session and self.session is not None:
+                await self.session.close()
+                self.session = None
+
+    async def commit(self):
+        await self.session.commit()
+
+    async def rollback(self):
+        await self.session.rollback()
@@ -0,0 +1,101 @@
+"""
+Общий интерфейс провайдеров рыночных данных
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from shared.config import settings
+from .http_cache import http_response_cache
+from .json_codec import loads
+
+
+class MarketDataProvider(ABC):
+    """Интерфейс провайдера рыночных данных (CoinGecko, CoinMarketCap)
+
+    Реализации задают session, rate_limiter и circuit_breaker и выполняют
+    HTTP-запросы через _get (или _get_json - с HTTP-кэшем ответов).
+    """
+
+    name: str = "unknown"
+
+    @asynccontextmanager
+    async def _get(self, url: str, params: Optional[Dict[str, Any]] = None,
+                   timeout: Optional[aiohttp.ClientTimeout] = None, cost: int = 1,
+                   session: Optional[aiohttp.ClientSession] = None,
+                   headers: Optional[Dict[str, str]] = None) -> AsyncIterator[aiohttp.ClientResponse]:
+        """GET-запрос через выключатель и лимитер провайдера"""
+        self.circuit_breaker.before_request()
+        recorded = False
+        try:
+            await self.rate_limiter.acquire(cost)
+            kwargs: Dict[str, Any] = {'params': params}
+            if headers:
+                kwargs['headers'] = headers
+            if timeout is not None:
+                kwargs['timeout'] = timeout
+            async with (session or self.session).get(url, **kwargs) as response:
+                self.circuit_breaker.record_response(response.status, response.headers.get('Retry-After'))
+                recorded = True
+                yield response
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if not recorded:
+                self.circuit_breaker.record_failure(type(e).__name__)
+                recorded = True
+            raise
+        finally:
+            if not recorded:
+                self.circuit_breaker.release_probe()
+
+    async def _get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+                        timeout: Optional[aiohttp.ClientTimeout] = None, cost: int = 1,
+                        session: Optional[aiohttp.ClientSession] = None) -> Tuple[int, Any]:
+        """GET с разбором JSON через HTTP-кэш: (статус, данные) или (статус, текст ошибки)
+
+        Свежий ответ (max-age) отдается без запроса, устаревший проверяется
+        условным запросом; на 304 разбирается сохраненное тело. В кэше лежат
+        сырые байты, поэтому каждый вызов получает свой разобранный документ.
+        """
+        if not settings.HTTP_CACHE_ENABLED:
+            async with self._get(url, params=params, timeout=timeout, cost=cost, session=session) as response:
+                if response.status != 200:
+                    return response.status, await response.text()
+                return response.status, loads(await response.read())
+
+        key = http_response_cache.key(self.name, url, params)
+        fresh = http_response_cache.lookup(key)
+        if fresh is not None:
+            return 200, loads(fresh.body)
+
+        entry = http_response_cache.get(key)
+        headers = http_response_cache.conditional_headers(entry)
+        async with self._get(url, params=params, timeout=timeout, cost=cost, session=session,
+                             headers=headers) as response:
+            if response.status == 304 and entry is not None:
+                return 200, loads(http_response_cache.revalidate(key, entry, response.headers).body)
+            if response.status != 200:
+                return response.status, await response.text()
+            body = await response.read()
+            response_headers = response.headers
+
+        data = loads(body)
+        http_response_cache.store(key, body, response_headers)
+        return 200, data
+
+    @abstractmethod
+    async def get_top_coins(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Получить топ монет по рыночной капитализации"""
+        pass
+
+    @abstractmethod
+    async def get_growth_leaders(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Получить лидеров роста за 24 часа"""
+        pass
+
+    @abstractmethod
+    async def get_current_prices(self, symbols: List[str], use_cache: bool = True) -> Dict[str, float]:
+        """Получить текущие цены по символам (ключ - символ в нижнем регистре)"""
+        pass
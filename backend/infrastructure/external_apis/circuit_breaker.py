@@ -0,0 +1,160 @@
+"""
+Автоматический выключатель (circuit breaker) для внешних API
+
+Один выключатель на провайдера, общий для всех вызовов CoinGeckoAPI/CoinMarketCapAPI.
+После 429 (с учетом Retry-After) или серии ошибок провайдер считается недоступным
+на время backoff, и запросы к нему сразу завершаются CircuitOpenError - вызывающий
+код уходит в кэш, не тратя время на заведомо неудачный запрос. По истечении
+backoff пропускается один пробный запрос (half-open).
+"""
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+from shared.config import settings
+from .http_client import COINGECKO, COINMARKETCAP
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Запрос не выполнен: выключатель провайдера разомкнут"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name}: провайдер временно недоступен, повтор через {retry_in:.1f} с")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value: Optional[str], now: Optional[datetime] = None) -> Optional[float]:
+    """Разобрать заголовок Retry-After (секунды или HTTP-дата)"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+class CircuitBreaker:
+    """Выключатель closed/open/half-open с экспоненциальным backoff и jitter"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, base_backoff_seconds: float = 5.0,
+                 max_backoff_seconds: float = 300.0, jitter: float = 0.2,
+                 clock: Callable[[], float] = time.monotonic, rng: Callable[[], float] = random.random):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.jitter = jitter
+        self._clock = clock
+        self._rng = rng
+
+        self.state = CLOSED
+        self.failures = 0
+        self.consecutive_opens = 0
+        self.open_until = 0.0
+        self._probe_in_flight = False
+
+        self.opened = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+
+    def retry_in(self) -> float:
+        return max(0.0, self.open_until - self._clock())
+
+    def before_request(self):
+        """Проверить, можно ли выполнять запрос (иначе CircuitOpenError)"""
+        if self.state == OPEN:
+            if self._clock() < self.open_until:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.retry_in())
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == HALF_OPEN:
+            # Пока пробный запрос не завершился, остальные сразу уходят в кэш
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.consecutive_opens = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """Запрос завершился без ответа провайдера (отмена, лимит) - пробу можно повторить"""
+        self._probe_in_flight = False
+
+    def record_failure(self, error: str = "", retry_after: Optional[float] = None):
+        """Учесть ошибку; 429 (retry_after) и неудачная проба размыкают сразу"""
+        self.failures += 1
+        self.last_error = error or None
+        if retry_after is not None or self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._trip(retry_after)
+
+    def record_response(self, status: int, retry_after_header: Optional[str] = None):
+        """Учесть HTTP-ответ: 429 и 5xx - ошибки провайдера, остальное - успех"""
+        if status == 429:
+            retry_after = parse_retry_after(retry_after_header)
+            self.record_failure("HTTP 429", retry_after if retry_after is not None else 0.0)
+        elif status >= 500:
+            self.record_failure(f"HTTP {status}")
+        else:
+            self.record_success()
+
+    def _backoff(self) -> float:
+        backoff = min(self.max_backoff_seconds, self.base_backoff_seconds * 2 ** (self.consecutive_opens - 1))
+        return backoff * (1 + self.jitter * self._rng())
+
+    def _trip(self, retry_after: Optional[float]):
+        self.consecutive_opens += 1
+        self.opened += 1
+        delay = self._backoff()
+        if retry_after:
+            delay = max(delay, retry_after)
+        self.state = OPEN
+        self.open_until = self._clock() + delay
+        self._probe_in_flight = False
+        print(f"⛔ {self.name}: выключатель разомкнут на {delay:.1f} с ({self.last_error or 'ошибки'})")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_in_seconds": round(self.retry_in(), 1) if self.state == OPEN else 0.0,
+            "last_error": self.last_error,
+        }
+
+
+def _make_breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        base_backoff_seconds=settings.CIRCUIT_BREAKER_BASE_BACKOFF_SECONDS,
+        max_backoff_seconds=settings.CIRCUIT_BREAKER_MAX_BACKOFF_SECONDS,
+    )
+
+
+circuit_breakers: Dict[str, CircuitBreaker] = {
+    COINGECKO: _make_breaker(COINGECKO),
+    COINMARKETCAP: _make_breaker(COINMARKETCAP),
+}
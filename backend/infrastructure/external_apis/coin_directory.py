@@ -0,0 +1,151 @@
+"""
+In-memory индекс справочника монет (символ/название -> id у провайдеров)
+
+Загружается из таблицы coin_directory при старте и после каждого обновления,
+поэтому разрешение символов не требует запросов к /search. Пока справочник
+не загружен (пустая таблица при первом запуске, неудачное обновление),
+крупнейшие монеты разрешаются по встроенному списку BUILTIN_COINS.
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+
+# Крупнейшие монеты: запасной справочник, пока coin_directory не загружен
+BUILTIN_COINS = [
+    {'symbol': symbol, 'name': name, 'coingecko_id': coingecko_id, 'cmc_id': cmc_id, 'rank': rank}
+    for rank, (symbol, name, coingecko_id, cmc_id) in enumerate([
+        ('btc', 'Bitcoin', 'bitcoin', 1),
+        ('eth', 'Ethereum', 'ethereum', 1027),
+        ('usdt', 'Tether', 'tether', 825),
+        ('bnb', 'BNB', 'binancecoin', 1839),
+        ('sol', 'Solana', 'solana', 5426),
+        ('xrp', 'XRP', 'ripple', 52),
+        ('usdc', 'USDC', 'usd-coin', 3408),
+        ('doge', 'Dogecoin', 'dogecoin', 74),
+        ('ada', 'Cardano', 'cardano', 2010),
+        ('trx', 'TRON', 'tron', 1958),
+        ('ton', 'Toncoin', 'the-open-network', 11419),
+        ('avax', 'Avalanche', 'avalanche-2', 5805),
+        ('shib', 'Shiba Inu', 'shiba-inu', 5994),
+        ('dot', 'Polkadot', 'polkadot', 6636),
+        ('link', 'Chainlink', 'chainlink', 1975),
+        ('bch', 'Bitcoin Cash', 'bitcoin-cash', 1831),
+        ('ltc', 'Litecoin', 'litecoin', 2),
+        ('matic', 'Polygon', 'matic-network', 3890),
+        ('uni', 'Uniswap', 'uniswap', 7083),
+        ('xlm', 'Stellar', 'stellar', 512),
+        ('atom', 'Cosmos Hub', 'cosmos', 3794),
+        ('etc', 'Ethereum Classic', 'ethereum-classic', 1321),
+        ('xmr', 'Monero', 'monero', 328),
+        ('near', 'NEAR Protocol', 'near', 6535),
+        ('apt', 'Aptos', 'aptos', 21794),
+        ('fil', 'Filecoin', 'filecoin', 2280),
+        ('arb', 'Arbitrum', 'arbitrum', 11841),
+        ('op', 'Optimism', 'optimism', 11840),
+        ('dai', 'Dai', 'dai', 4943),
+        ('pepe', 'Pepe', 'pepe', 24478),
+    ], start=1)
+]
+
+
+@dataclass
+class CoinDirectoryRecord:
+    """Запись справочника монет"""
+    symbol: str
+    name: str
+    coingecko_id: str
+    cmc_id: Optional[int] = None
+    rank: Optional[int] = None
+
+    @property
+    def sort_key(self) -> int:
+        # Монеты с рейтингом важнее монет без рейтинга
+        return self.rank if self.rank is not None else 10 ** 9
+
+
+class CoinIndex:
+    """Индекс для разрешения символов и названий монет без сетевых запросов"""
+
+    def __init__(self, fallback: Iterable[dict] = ()):
+        self._by_symbol: Dict[str, CoinDirectoryRecord] = {}
+        self._by_name: Dict[str, CoinDirectoryRecord] = {}
+        self._by_coingecko_id: Dict[str, CoinDirectoryRecord] = {}
+        # Записи, которые есть в индексе всегда (под загруженным справочником)
+        self._fallback = list(fallback)
+        # Загружен ли настоящий справочник (а не только запасной список)
+        self.loaded = False
+        self.load([])
+
+    def __len__(self) -> int:
+        return len(self._by_coingecko_id)
+
+    def load(self, entries: Iterable[dict]):
+        """Перестроить индекс из записей справочника"""
+        entries = list(entries)
+        by_symbol: Dict[str, CoinDirectoryRecord] = {}
+        by_name: Dict[str, CoinDirectoryRecord] = {}
+        by_coingecko_id: Dict[str, CoinDirectoryRecord] = {}
+
+        # Запасные записи - только для монет, которых нет в загруженном справочнике
+        known = {entry['coingecko_id'] for entry in entries}
+        fallback = [entry for entry in self._fallback if entry['coingecko_id'] not in known]
+        for entry in entries + fallback:
+            record = CoinDirectoryRecord(
+                symbol=entry['symbol'].lower(),
+                name=entry['name'],
+                coingecko_id=entry['coingecko_id'],
+                cmc_id=entry.get('cmc_id'),
+                rank=entry.get('rank'),
+            )
+            by_coingecko_id[record.coingecko_id] = record
+            self._put_best(by_symbol, record.symbol, record)
+            self._put_best(by_name, record.name.lower(), record)
+
+        # Атомарная подмена: читатели не увидят наполовину построенный индекс
+        self._by_symbol = by_symbol
+        self._by_name = by_name
+        self._by_coingecko_id = by_coingecko_id
+        self.loaded = self.loaded or bool(entries)
+
+    def add(self, record: CoinDirectoryRecord):
+        """Добавить монету, найденную вне справочника (например, через /search)"""
+        record.symbol = record.symbol.lower()
+        self._by_coingecko_id[record.coingecko_id] = record
+        self._put_best(self._by_symbol, record.symbol, record)
+        self._put_best(self._by_name, record.name.lower(), record)
+
+    @staticmethod
+    def _put_best(index: Dict[str, CoinDirectoryRecord], key: str, record: CoinDirectoryRecord):
+        # Один тикер бывает у многих токенов - оставляем монету с лучшим рейтингом
+        current = index.get(key)
+        if current is None or record.sort_key < current.sort_key:
+            index[key] = record
+
+    def resolve_symbol(self, symbol: str) -> Optional[CoinDirectoryRecord]:
+        """Найти монету по символу (BTC, eth)"""
+        return self._by_symbol.get(symbol.lower().strip())
+
+    def resolve_name(self, name: str) -> Optional[CoinDirectoryRecord]:
+        """Найти монету по названию, id CoinGecko или символу"""
+        key = name.lower().strip()
+        return (
+            self._by_name.get(key)
+            or self._by_coingecko_id.get(key)
+            or self._by_symbol.get(key)
+        )
+
+    def coingecko_id(self, symbol: str) -> Optional[str]:
+        """Получить id CoinGecko по символу"""
+        record = self.resolve_symbol(symbol)
+        return record.coingecko_id if record else None
+
+    def cmc_id(self, symbol: str) -> Optional[int]:
+        """Получить id CoinMarketCap по символу"""
+        record = self.resolve_symbol(symbol)
+        return record.cmc_id if record else None
+
+    def records(self) -> List[CoinDirectoryRecord]:
+        return list(self._by_coingecko_id.values())
+
+
+coin_index = CoinIndex(fallback=BUILTIN_COINS)
@@ -3,23 +3,49 @@ from decimal import Decimal
 from typing import Optional, Dict, Any, List
 import asyncio
 
+from shared.config import settings
+from .http_client import http_clients, create_http_session, COINGECKO
+from .single_flight import SingleFlight
+from .price_cache import price_cache, price_key
+from .coin_directory import coin_index, CoinDirectoryRecord
+from .rate_limiter import rate_limiters
+from .circuit_breaker import circuit_breakers, CircuitOpenError
+from .base import MarketDataProvider
+from .json_codec import project_records
 
-class CoinGeckoAPI:
+
+class CoinGeckoAPI(MarketDataProvider):
     """API для работы с CoinGecko"""
     
-    def __init__(self):
-        self.base_url = "https://api.coingecko.com/api/v3"
-        self.session: Optional[aiohttp.ClientSession] = None
+    name = COINGECKO
+    
+    # Общий на процесс: одновременные запросы цен одних и тех же монет объединяются
+    _price_flight = SingleFlight()
+    
+    # Сколько id передавать в одном запросе /simple/price (ограничение длины URL)
+    SIMPLE_PRICE_CHUNK_SIZE = 250
+    
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        self.base_url = settings.COINGECKO_API_URL.rstrip("/")
+        # По умолчанию используется общая сессия из пула (см. http_client.py)
+        self._session = session
+        # Общий на процесс лимитер запросов к CoinGecko
+        self.rate_limiter = rate_limiters[COINGECKO]
+        # Общий на процесс выключатель: после 429/ошибок запросы сразу уходят в кэш
+        self.circuit_breaker = circuit_breakers[COINGECKO]
+    
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = http_clients.coingecko()
+        return self._session
     
     async def __aenter__(self):
-        # Создаем сессию с отключенной проверкой SSL для разработки
-        connector = aiohttp.TCPConnector(ssl=False)
-        self.session = aiohttp.ClientSession(connector=connector)
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
+        # Общая сессия закрывается при остановке приложения, а не здесь
+        pass
     
     async def get_top_coins(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Получить топ монет по рыночной капитализации"""
@@ -34,10 +60,6 @@ class CoinGeckoAPI:
                 'locale': 'ru'
             }
             
-            if not self.session:
-                connector = aiohttp.TCPConnector(ssl=False)
-                async with aiohttp.ClientSession(connector=connector) as session:
-                    return await self._fetch_coins_data(session, url, params)
             return await self._fetch_coins_data(self.session, url, params)
             
         except Exception as e:
@@ -58,65 +80,56 @@ class CoinGeckoAPI:
                 'price_change_percentage': '24h'  # Включаем данные о изменении цены
             }
             
-            if not self.session:
-                connector = aiohttp.TCPConnector(ssl=False)
-                async with aiohttp.ClientSession(connector=connector) as session:
-                    return await self._fetch_growth_leaders_data(session, url, params, limit)
             return await self._fetch_growth_leaders_data(self.session, url, params, limit)
             
         except Exception as e:
             print(f"Ошибка при получении лидеров роста: {e}")
             return []
     
+    @staticmethod
+    def _market_record(coin: Dict[str, Any]) -> Dict[str, Any]:
+        """Элемент /coins/markets -> запись рыночных данных (поля таблицы coin_cache)"""
+        return {
+            'id': coin['id'],
+            'symbol': coin['symbol'].upper(),
+            'name': coin['name'],
+            'current_price': coin['current_price'],
+            'market_cap': coin['market_cap'],
+            'market_cap_rank': coin['market_cap_rank'],
+            'price_change_percentage_24h': coin['price_change_percentage_24h'],
+            'image': coin['image'],
+            'total_volume': coin['total_volume']
+        }
+    
     async def _fetch_coins_data(self, session: aiohttp.ClientSession, url: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Получить данные о монетах"""
         try:
-            # Задержка перед запросом для избежания rate limit
-            await asyncio.sleep(2)
-            
             print(f"🌐 Запрос к CoinGecko API: {url}")
             print(f"📊 Параметры: {params}")
             
-            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=20)) as response:
-                print(f"📡 Получен ответ: HTTP {response.status}")
-                
-                if response.status == 429:
-                    print("⚠️ Rate limit превышен. Используем fallback данные")
-                    return []
-                elif response.status != 200:
-                    error_text = await response.text()
-                    print(f"❌ HTTP {response.status}: {error_text}")
-                    return []
-                
-                data = await response.json()
-                print(f"📦 Получено данных: {len(data) if data else 0} монет")
-                
-                if not data:
-                    print("⚠️ Пустой ответ от API")
-                    return []
-                
-                result = []
-                for coin in data:
-                    try:
-                        coin_data = {
-                            'id': coin['id'],
-                            'symbol': coin['symbol'].upper(),
-                            'name': coin['name'],
-                            'current_price': coin['current_price'],
-                            'market_cap': coin['market_cap'],
-                            'market_cap_rank': coin['market_cap_rank'],
-                            'price_change_percentage_24h': coin['price_change_percentage_24h'],
-                            'image': coin['image'],
-                            'total_volume': coin['total_volume']
-                        }
-                        result.append(coin_data)
-                    except KeyError as e:
-                        print(f"⚠️ Отсутствует поле {e} в данных монеты {coin.get('id', 'unknown')}")
-                        continue
-                
-                print(f"✅ Обработано успешно: {len(result)} монет")
-                return result
+            status, data = await self._get_json(url, params=params, timeout=aiohttp.ClientTimeout(total=20), session=session)
+            print(f"📡 Получен ответ: HTTP {status}")
+            
+            if status == 429:
+                print("⚠️ Rate limit превышен. Используем fallback данные")
+                return []
+            elif status != 200:
+                print(f"❌ HTTP {status}: {data}")
+                return []
+            
+            print(f"📦 Получено данных: {len(data) if data else 0} монет")
+            
+            if not data:
+                print("⚠️ Пустой ответ от API")
+                return []
+            
+            result = project_records(data, self._market_record)
+            print(f"✅ Обработано успешно: {len(result)} монет")
+            return result
                 
+        except CircuitOpenError as e:
+            print(f"⛔ {e}")
+            return []
         except asyncio.TimeoutError:
             print("⏱️ Timeout при получении данных о монетах")
             return []
@@ -126,278 +139,311 @@ class CoinGeckoAPI:
             traceback.print_exc()
             return []
 
+    async def get_coins_list(self) -> List[Dict[str, Any]]:
+        """Получить полный список монет (id, symbol, name) для справочника"""
+        try:
+            url = f"{self.base_url}/coins/list"
+            status, data = await self._get_json(url, timeout=aiohttp.ClientTimeout(total=60))
+            if status != 200:
+                print(f"❌ HTTP {status} при получении списка монет")
+                return []
+            print(f"📦 Список монет CoinGecko: {len(data)}")
+            return [
+                {'coingecko_id': coin['id'], 'symbol': coin['symbol'], 'name': coin['name']}
+                for coin in data
+                if coin.get('id') and coin.get('symbol') and coin.get('name')
+            ]
+        except Exception as e:
+            print(f"❌ Ошибка при получении списка монет: {e}")
+            return []
+    
+    async def get_market_ranks(self, pages: int = 4) -> Dict[str, int]:
+        """Получить рейтинг по капитализации (coin id -> rank) для топ pages*250 монет"""
+        ranks: Dict[str, int] = {}
+        url = f"{self.base_url}/coins/markets"
+        for page in range(1, pages + 1):
+            params = {
+                'vs_currency': 'usd',
+                'order': 'market_cap_desc',
+                'per_page': 250,
+                'page': page,
+                'sparkline': 'false'
+            }
+            try:
+                status, data = await self._get_json(url, params=params, timeout=aiohttp.ClientTimeout(total=30))
+                if status != 200:
+                    print(f"❌ HTTP {status} при получении рейтинга (страница {page})")
+                    break
+            except Exception as e:
+                print(f"❌ Ошибка при получении рейтинга (страница {page}): {e}")
+                break
+            for coin in data:
+                if coin.get('id') and coin.get('market_cap_rank'):
+                    ranks[coin['id']] = coin['market_cap_rank']
+            if len(data) < 250:
+                break
+        return ranks
+    
+    async def get_exchange_rates(self) -> Dict[str, float]:
+        """Курсы валют к BTC одним запросом (/exchange_rates): валюта -> единиц за 1 BTC"""
+        try:
+            url = f"{self.base_url}/exchange_rates"
+            status, data = await self._get_json(url)
+            if status != 200:
+                print(f"❌ HTTP {status} при получении курсов валют")
+                return {}
+            return {
+                currency.lower(): float(rate['value'])
+                for currency, rate in data.get('rates', {}).items()
+                if rate.get('value')
+            }
+        except CircuitOpenError as e:
+            print(f"⛔ {e}")
+            return {}
+        except Exception as e:
+            print(f"❌ Ошибка при получении курсов валют: {e}")
+            return {}
+    
     async def get_price_by_name(self, coin_name: str) -> Optional[Decimal]:
         """Получить цену монеты по названию"""
-        if not self.session:
-            connector = aiohttp.TCPConnector(ssl=False)
-            async with aiohttp.ClientSession(connector=connector) as session:
-                return await self._fetch_price(session, coin_name)
-        return await self._fetch_price(self.session, coin_name)
+        prices = await self._fetch_prices_batch(self.session, [coin_name])
+        return prices.get(coin_name)
     
     async def get_prices_batch(self, coin_names: list[str]) -> Dict[str, Decimal]:
         """Получить цены для нескольких монет"""
-        if not self.session:
-            connector = aiohttp.TCPConnector(ssl=False)
-            async with aiohttp.ClientSession(connector=connector) as session:
-                return await self._fetch_prices_batch(session, coin_names)
         return await self._fetch_prices_batch(self.session, coin_names)
     
-    async def _fetch_price(self, session: aiohttp.ClientSession, coin_name: str) -> Optional[Decimal]:
-        """Получить цену одной монеты"""
+    async def _resolve_name(self, session: aiohttp.ClientSession, coin_name: str) -> Optional[CoinDirectoryRecord]:
+        """Найти монету по названию: справочник, для неизвестных - search API"""
+        record = coin_index.resolve_name(coin_name)
+        if record:
+            return record
+        if not coin_index.loaded:
+            # Без справочника поиск шел бы на каждое название - ждем загрузки
+            print(f"⚠️ Справочник монет не загружен, поиск '{coin_name}' пропущен")
+            return None
+        
         try:
-            # Поиск монеты
-            search_url = f"{self.base_url}/search?query={coin_name.lower().strip()}"
-            async with session.get(search_url) as response:
-                if response.status != 200:
-                    print(f"HTTP {response.status} при поиске монеты {coin_name}")
-                    return None
-                
-                data = await response.json()
-                results = data.get("coins", [])
-                
-                if not results:
-                    print(f"Монета '{coin_name}' не найдена")
-                    return None
-                
-                # Берем первую найденную монету
-                coin_id = results[0]["id"]
-                coin_name_found = results[0]["name"]
-                
-                # Проверяем, что найденная монета похожа на запрошенную
-                if coin_name.lower() not in coin_name_found.lower() and coin_name_found.lower() not in coin_name.lower():
-                    print(f"Предупреждение: запрошена '{coin_name}', найдена '{coin_name_found}'")
+            status, data = await self._search(coin_name.lower().strip(), session=session)
+            if status != 200:
+                print(f"HTTP {status} при поиске монеты {coin_name}")
+                return None
             
-            # Получение цены
-            price_url = f"{self.base_url}/simple/price?ids={coin_id}&vs_currencies=usd"
-            async with session.get(price_url) as response:
-                if response.status != 200:
-                    print(f"HTTP {response.status} при получении цены для {coin_name}")
-                    return None
-                
-                data = await response.json()
-                if coin_id not in data:
-                    print(f"Цена для {coin_name} (ID: {coin_id}) не найдена в ответе")
-                    return None
-                
-                price = data[coin_id]["usd"]
-                if price is None:
-                    print(f"Цена для {coin_name} равна None")
-                    return None
-                
-                return Decimal(str(price))
-                
+            results = data.get("coins", [])
         except Exception as e:
-            print(f"Ошибка при получении цены для {coin_name}: {e}")
+            print(f"Ошибка при поиске монеты {coin_name}: {e}")
             return None
+        
+        if not results:
+            print(f"Монета '{coin_name}' не найдена")
+            return None
+        
+        # Берем первую найденную монету
+        coin = results[0]
+        coin_name_found = coin["name"]
+        
+        # Проверяем, что найденная монета похожа на запрошенную
+        if coin_name.lower() not in coin_name_found.lower() and coin_name_found.lower() not in coin_name.lower():
+            print(f"Предупреждение: запрошена '{coin_name}', найдена '{coin_name_found}'")
+        
+        record = CoinDirectoryRecord(
+            symbol=(coin.get("symbol") or coin["id"]),
+            name=coin_name_found,
+            coingecko_id=coin["id"],
+            rank=coin.get("market_cap_rank")
+        )
+        # Запоминаем до следующего обновления справочника
+        coin_index.add(record)
+        return record
     
     async def _fetch_prices_batch(self, session: aiohttp.ClientSession, coin_names: list[str]) -> Dict[str, Decimal]:
-        """Получить цены для нескольких монет"""
-        results = {}
-        
-        # Получаем все цены параллельно
-        tasks = []
+        """Получить цены для нескольких монет одним запросом /simple/price на пачку"""
+        # Повторяющиеся названия (с точностью до регистра и пробелов) ищем один раз
+        names_by_key: Dict[str, List[str]] = {}
         for coin_name in coin_names:
-            task = self._fetch_price(session, coin_name)
-            tasks.append((coin_name, task))
+            names_by_key.setdefault(coin_name.lower().strip(), []).append(coin_name)
+        
+        # Неизвестные названия ищутся параллельно (частоту ограничивает общий лимитер)
+        resolved = await asyncio.gather(*(
+            self._resolve_name(session, names[0]) for names in names_by_key.values()
+        ))
+        records: Dict[str, CoinDirectoryRecord] = {
+            key: record for key, record in zip(names_by_key, resolved) if record
+        }
         
-        # Выполняем все запросы параллельно
-        completed_tasks = await asyncio.gather(*[task for _, task in tasks], return_exceptions=True)
+        # Кэш цен общий с get_current_prices: ключ - id монеты в CoinGecko
+        prices: Dict[str, float] = {}
+        missing_ids = []
+        for key, record in records.items():
+            cached_price = price_cache.get(price_key(COINGECKO, record.coingecko_id))
+            if cached_price is not None:
+                prices[key] = cached_price
+            else:
+                missing_ids.append(record.coingecko_id)
         
-        # Обрабатываем результаты
-        for i, (coin_name, _) in enumerate(tasks):
-            result = completed_tasks[i]
-            if isinstance(result, Exception):
-                print(f"Ошибка при получении цены для {coin_name}: {result}")
-            elif result is not None:
-                results[coin_name] = result
+        if missing_ids:
+            try:
+                fetched = await self._fetch_simple_prices(list(dict.fromkeys(missing_ids)), session)
+            except Exception as e:
+                print(f"Ошибка при получении цен: {e}")
+                fetched = {}
+            for key, record in records.items():
+                if key in prices:
+                    continue
+                price = fetched.get(record.coingecko_id)
+                if price is None:
+                    print(f"Цена для {record.name} (ID: {record.coingecko_id}) не найдена в ответе")
+                    continue
+                prices[key] = price
+                price_cache.set(price_key(COINGECKO, record.coingecko_id), price)
         
+        results = {}
+        for key, price in prices.items():
+            for coin_name in names_by_key[key]:
+                results[coin_name] = Decimal(str(price))
         return results
     
-    async def get_current_prices(self, symbols: List[str]) -> Dict[str, float]:
-        """Получить текущие цены монет по символам (BTC, ETH, etc.)"""
-        try:
-            # Маппинг символов в ID CoinGecko
-            symbol_to_id = {
-                'btc': 'bitcoin',
-                'eth': 'ethereum', 
-                'usdt': 'tether',
-                'bnb': 'binancecoin',
-                'sol': 'solana',
-                'xrp': 'ripple',
-                'usdc': 'usd-coin',
-                'ada': 'cardano',
-                'doge': 'dogecoin',
-                'trx': 'tron',
-                'avax': 'avalanche-2',
-                'dot': 'polkadot',
-                'matic': 'matic-network',
-                'ltc': 'litecoin',
-                'link': 'chainlink',
-                'ape': 'apecoin',  # Добавляем APE
-                'atom': 'cosmos',
-                'near': 'near',
-                'uni': 'uniswap',
-                'shib': 'shiba-inu',
-                'pepe': 'pepe',
-                'wif': 'dogwifcoin',
-                'bonk': 'bonk',
-                'floki': 'floki',
-            }
-            
-            # Преобразуем символы в ID
-            coin_ids = []
-            missing_symbols = []
-            for symbol in symbols:
-                symbol_lower = symbol.lower()
-                if symbol_lower in symbol_to_id:
-                    coin_ids.append(symbol_to_id[symbol_lower])
-                else:
-                    missing_symbols.append(symbol)
-            
-            # Для отсутствующих символов пытаемся найти через поиск
-            if missing_symbols:
-                print(f"🔍 Ищем отсутствующие символы: {missing_symbols}")
-                for symbol in missing_symbols:
-                    try:
-                        # Ищем монету через search API
-                        search_url = f"{self.base_url}/search?query={symbol}"
-                        
-                        if not self.session:
-                            connector = aiohttp.TCPConnector(ssl=False)
-                            async with aiohttp.ClientSession(connector=connector) as session:
-                                async with session.get(search_url) as search_response:
-                                    if search_response.status == 200:
-                                        search_data = await search_response.json()
-                                        coins = search_data.get('coins', [])
-                                        # Берем первую найденную монету с точным совпадением символа
-                                        for coin in coins:
-                                            if coin.get('symbol', '').upper() == symbol.upper():
-                                                coin_id = coin.get('id')
-                                                if coin_id:
-                                                    print(f"✅ Найден {symbol}: {coin_id}")
-                                                    coin_ids.append(coin_id)
-                                                    symbol_to_id[symbol.lower()] = coin_id
-                                                break
-                        else:
-                            async with self.session.get(search_url) as search_response:
-                                if search_response.status == 200:
-                                    search_data = await search_response.json()
-                                    coins = search_data.get('coins', [])
-                                    # Берем первую найденную монету с точным совпадением символа
-                                    for coin in coins:
-                                        if coin.get('symbol', '').upper() == symbol.upper():
-                                            coin_id = coin.get('id')
-                                            if coin_id:
-                                                print(f"✅ Найден {symbol}: {coin_id}")
-                                                coin_ids.append(coin_id)
-                                                symbol_to_id[symbol.lower()] = coin_id
-                                            break
-                        
-                        await asyncio.sleep(0.1)  # Задержка между поисками
-                    except Exception as search_error:
-                        print(f"❌ Ошибка поиска {symbol}: {search_error}")
-            
-            if not coin_ids:
-                print("❌ Нет монет для обновления цен после поиска")
-                return {}
-            
-            # Делаем запрос к API
-            url = f"{self.base_url}/simple/price"
+    async def _fetch_simple_prices(self, coin_ids: List[str], session: Optional[aiohttp.ClientSession] = None) -> Dict[str, float]:
+        """Цены в USD по id CoinGecko: один запрос /simple/price на SIMPLE_PRICE_CHUNK_SIZE монет"""
+        url = f"{self.base_url}/simple/price"
+        prices: Dict[str, float] = {}
+        for start in range(0, len(coin_ids), self.SIMPLE_PRICE_CHUNK_SIZE):
+            chunk = coin_ids[start:start + self.SIMPLE_PRICE_CHUNK_SIZE]
             params = {
-                'ids': ','.join(coin_ids),
+                'ids': ','.join(chunk),
                 'vs_currencies': 'usd'
             }
+            status, data = await self._get_json(url, params=params, session=session)
+            if status == 429:  # Rate limit - выключатель уже разомкнут (Retry-After)
+                print("⚠️ Rate limit превышен, цены будут взяты из кэша")
+                break
+            if status != 200:
+                print(f"❌ HTTP {status} при получении цен")
+                continue
             
-            # Добавляем задержку для избежания rate limit
-            await asyncio.sleep(0.1)
-            
-            if not self.session:
-                connector = aiohttp.TCPConnector(ssl=False)
-                async with aiohttp.ClientSession(connector=connector) as session:
-                    async with session.get(url, params=params) as response:
-                        if response.status == 429:  # Rate limit
-                            print("Rate limit превышен. Ожидание 10 секунд...")
-                            await asyncio.sleep(10)
-                            return {}
-                        
-                        if response.status == 200:
-                            data = await response.json()
-                            print(f"📊 Получены данные от CoinGecko: {data}")
-                            
-                            # Преобразуем обратно в символы
-                            result = {}
-                            id_to_symbol = {v: k for k, v in symbol_to_id.items()}
-                            
-                            for coin_id, price_data in data.items():
-                                if coin_id in id_to_symbol:
-                                    symbol = id_to_symbol[coin_id]
-                                    price = price_data.get('usd', 0)
-                                    result[symbol] = price
-                                    print(f"💰 {symbol.upper()}: ${price}")
-                            
-                            print(f"✅ Итого получено цен: {len(result)}")
-                            return result
-            
-            return {}
-            
+            for coin_id, price_data in data.items():
+                price = (price_data or {}).get('usd')
+                if price is not None:
+                    prices[coin_id] = price
+        return prices
+    
+    async def get_current_prices(self, symbols: List[str], use_cache: bool = True) -> Dict[str, float]:
+        """Получить текущие цены монет по символам (BTC, ETH, etc.)"""
+        # Кэш и запрос цен работают с id CoinGecko: тикер одной монеты не отдаст цену другой
+        symbol_to_id = await self._resolve_symbols([symbol.lower() for symbol in symbols])
+        keys = {symbol: price_key(COINGECKO, coin_id) for symbol, coin_id in symbol_to_id.items()}
+        unique_keys = list(dict.fromkeys(keys.values()))
+        
+        def load(missing: List[str]):
+            return self._price_flight.do_many(missing, self._fetch_prices_by_key)
+        
+        if not use_cache:
+            # Принудительный запрос к провайдеру (фоновое обновление цен), результат кладем в кэш
+            prices = await load(unique_keys)
+            price_cache.set_many(prices)
+        else:
+            prices = await price_cache.get_or_load(unique_keys, load)
+        return {symbol: prices[key] for symbol, key in keys.items() if key in prices}
+    
+    async def _resolve_symbols(self, symbols: List[str]) -> Dict[str, str]:
+        """Символы в нижнем регистре -> id CoinGecko: справочник монет, неизвестные - search API"""
+        symbol_to_id = {}
+        missing_symbols = []
+        for symbol in dict.fromkeys(symbols):
+            coin_id = coin_index.coingecko_id(symbol)
+            if coin_id:
+                symbol_to_id[symbol] = coin_id
+            else:
+                missing_symbols.append(symbol)
+        
+        if missing_symbols and not coin_index.loaded:
+            # Без справочника поиск шел бы на каждый символ - ждем загрузки
+            print(f"⚠️ Справочник монет не загружен, поиск {missing_symbols} пропущен")
+            missing_symbols = []
+        
+        # Символов нет в справочнике (новые листинги) - ищем через search API параллельно
+        if missing_symbols:
+            print(f"🔍 Ищем символы вне справочника: {missing_symbols}")
+            found = await asyncio.gather(*(self._search_symbol(symbol) for symbol in missing_symbols))
+            symbol_to_id.update(
+                (symbol, coin_id) for symbol, coin_id in zip(missing_symbols, found) if coin_id
+            )
+        return symbol_to_id
+    
+    async def _search(self, query: str, session: Optional[aiohttp.ClientSession] = None):
+        """Запрос /search: строка запроса передается параметром (кодируется в URL)"""
+        return await self._get_json(f"{self.base_url}/search", params={'query': query}, session=session)
+    
+    async def _search_symbol(self, symbol: str) -> Optional[str]:
+        """Найти id CoinGecko по точному совпадению символа через search API"""
+        try:
+            status, search_data = await self._search(symbol)
+            if status != 200:
+                return None
+            # Берем первую найденную монету с точным совпадением символа
+            for coin in search_data.get('coins', []):
+                if coin.get('symbol', '').upper() == symbol.upper():
+                    coin_id = coin.get('id')
+                    if coin_id:
+                        print(f"✅ Найден {symbol}: {coin_id}")
+                        # Запоминаем до следующего обновления справочника
+                        coin_index.add(CoinDirectoryRecord(
+                            symbol=symbol,
+                            name=coin.get('name', symbol),
+                            coingecko_id=coin_id,
+                            rank=coin.get('market_cap_rank')
+                        ))
+                    return coin_id
+        except Exception as search_error:
+            print(f"❌ Ошибка поиска {symbol}: {search_error}")
+        return None
+    
+    async def _fetch_prices_by_key(self, keys: List[str]) -> Dict[str, float]:
+        """Запрос цен к CoinGecko по ключам кэша цен (price_key)"""
+        coin_ids = {key: key.split(":", 1)[1] for key in keys}
+        try:
+            data = await self._fetch_simple_prices(list(coin_ids.values()))
         except Exception as e:
             print(f"Ошибка при получении цен: {e}")
             return {}
+        print(f"✅ Итого получено цен: {len(data)}")
+        return {key: data[coin_id] for key, coin_id in coin_ids.items() if coin_id in data}
     
     async def _fetch_growth_leaders_data(self, session: aiohttp.ClientSession, url: str, params: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
         """Получить данные лидеров роста с фильтрацией"""
         try:
-            # Задержка перед запросом для избежания rate limit
-            await asyncio.sleep(2)
-            
             print(f"🌐 Запрос лидеров роста к CoinGecko API: {url}")
             print(f"📊 Параметры: {params}")
             
-            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=20)) as response:
-                print(f"📡 Получен ответ: HTTP {response.status}")
-                
-                if response.status == 429:
-                    print("⚠️ Rate limit превышен. Используем fallback данные")
-                    return []
-                elif response.status != 200:
-                    error_text = await response.text()
-                    print(f"❌ HTTP {response.status}: {error_text}")
-                    return []
-                
-                data = await response.json()
-                print(f"📦 Получено данных: {len(data) if data else 0} монет")
-                
-                if not data:
-                    print("⚠️ Пустой ответ от API")
-                    return []
-                
-                # Фильтруем только монеты с положительным ростом
-                growth_leaders = []
-                for coin in data:
-                    try:
-                        price_change = coin.get('price_change_percentage_24h', 0)
-                        if price_change and price_change > 0:  # Только с положительным ростом
-                            growth_leaders.append({
-                                'id': coin['id'],
-                                'symbol': coin['symbol'].upper(),
-                                'name': coin['name'],
-                                'current_price': coin['current_price'],
-                                'market_cap': coin['market_cap'],
-                                'market_cap_rank': coin['market_cap_rank'],
-                                'price_change_percentage_24h': coin['price_change_percentage_24h'],
-                                'image': coin['image'],
-                                'total_volume': coin['total_volume']
-                            })
-                            
-                            if len(growth_leaders) >= limit:
-                                break
-                    except (KeyError, TypeError) as e:
-                        print(f"⚠️ Ошибка обработки монеты: {e}")
-                        continue
-                
-                print(f"✅ Найдено лидеров роста: {len(growth_leaders)}")
-                return growth_leaders
+            status, data = await self._get_json(url, params=params, timeout=aiohttp.ClientTimeout(total=20), session=session)
+            print(f"📡 Получен ответ: HTTP {status}")
+            
+            if status == 429:
+                print("⚠️ Rate limit превышен. Используем fallback данные")
+                return []
+            elif status != 200:
+                print(f"❌ HTTP {status}: {data}")
+                return []
+            
+            print(f"📦 Получено данных: {len(data) if data else 0} монет")
+            
+            if not data:
+                print("⚠️ Пустой ответ от API")
+                return []
+            
+            # Фильтруем только монеты с положительным ростом
+            growth_leaders = project_records(
+                (coin for coin in data if (coin.get('price_change_percentage_24h') or 0) > 0),
+                self._market_record,
+                limit
+            )
+            
+            print(f"✅ Найдено лидеров роста: {len(growth_leaders)}")
+            return growth_leaders
                 
+        except CircuitOpenError as e:
+            print(f"⛔ {e}")
+            return []
         except asyncio.TimeoutError:
             print("⏱️ Timeout при получении лидеров роста")
             return []
@@ -412,15 +458,17 @@ class CoinGeckoAPI:
 def fetch_price_by_name(user_input: str) -> Decimal:
     """Синхронная версия для обратной совместимости"""
     async def _async_fetch():
-        async with CoinGeckoAPI() as api:
-            return await api.get_price_by_name(user_input)
+        # Отдельная сессия: asyncio.run создает новый event loop,
+        # к которому общая сессия из пула не привязана
+        async with create_http_session() as session:
+            return await CoinGeckoAPI(session).get_price_by_name(user_input)
     
     try:
         loop = asyncio.get_event_loop()
         if loop.is_running():
             # Если мы уже в асинхронном контексте, создаем новую задачу
             # и ждем её завершения
-            future = asyncio.create_task(_async_fetch())
+            future = asyncio.create_task(CoinGeckoAPI().get_price_by_name(user_input))
             # Возвращаем None, так как в асинхронном контексте нужно использовать await
             return None
         else:
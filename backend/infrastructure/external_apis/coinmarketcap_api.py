@@ -4,29 +4,61 @@ CoinMarketCap API для получения данных о криптовалю
 """
 import aiohttp
 from decimal import Decimal
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 import asyncio
 
+from shared.config import settings
+from .http_client import http_clients, COINMARKETCAP
+from .single_flight import SingleFlight
+from .rate_limiter import rate_limiters
+from .circuit_breaker import circuit_breakers, CircuitOpenError
+from .base import MarketDataProvider
+from .price_cache import price_cache, price_key
+from .coin_directory import coin_index
+from .json_codec import project_records
 
-class CoinMarketCapAPI:
+
+class CoinMarketCapAPI(MarketDataProvider):
     """API для работы с CoinMarketCap"""
     
-    def __init__(self, api_key: str):
-        self.base_url = "https://pro-api.coinmarketcap.com/v1"
+    name = COINMARKETCAP
+    
+    # Общий на процесс: одновременные запросы цен одних и тех же монет объединяются
+    _price_flight = SingleFlight()
+    
+    def __init__(self, api_key: str, session: Optional[aiohttp.ClientSession] = None):
+        self.base_url = settings.COINMARKETCAP_API_URL.rstrip("/")
         self.api_key = api_key
-        self.session: Optional[aiohttp.ClientSession] = None
+        # По умолчанию используется общая сессия из пула (см. http_client.py);
+        # переданная сессия должна содержать заголовок X-CMC_PRO_API_KEY
+        self._session = session
+        # Общий на процесс лимитер (частота + месячный бюджет кредитов)
+        self.rate_limiter = rate_limiters[COINMARKETCAP]
+        # Общий на процесс выключатель: после 429/ошибок запросы сразу уходят в кэш
+        self.circuit_breaker = circuit_breakers[COINMARKETCAP]
+    
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = http_clients.coinmarketcap()
+        return self._session
+    
+    @staticmethod
+    def _credits(params: Dict[str, Any]) -> int:
+        """Стоимость запроса в кредитах: 1 кредит на 200 монет листинга или 100 монет котировок"""
+        for key in ('symbol', 'id'):
+            if key in params:
+                return max(1, -(-len(str(params[key]).split(',')) // 100))
+        if 'limit' in params:
+            return max(1, -(-int(params['limit']) // 200))
+        return 1
     
     async def __aenter__(self):
-        headers = {
-            'X-CMC_PRO_API_KEY': self.api_key,
-            'Accept': 'application/json'
-        }
-        self.session = aiohttp.ClientSession(headers=headers)
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
+        # Общая сессия закрывается при остановке приложения, а не здесь
+        pass
     
     async def get_top_coins(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Получить топ монет по рыночной капитализации"""
@@ -43,14 +75,6 @@ class CoinMarketCapAPI:
             print(f"🌐 Запрос к CoinMarketCap API: {url}")
             print(f"📊 Параметры: limit={limit}")
             
-            if not self.session:
-                headers = {
-                    'X-CMC_PRO_API_KEY': self.api_key,
-                    'Accept': 'application/json'
-                }
-                async with aiohttp.ClientSession(headers=headers) as session:
-                    return await self._fetch_coins_data(session, url, params)
-            
             return await self._fetch_coins_data(self.session, url, params)
             
         except Exception as e:
@@ -74,14 +98,6 @@ class CoinMarketCapAPI:
             
             print(f"🌐 Запрос лидеров роста к CoinMarketCap API: {url}")
             
-            if not self.session:
-                headers = {
-                    'X-CMC_PRO_API_KEY': self.api_key,
-                    'Accept': 'application/json'
-                }
-                async with aiohttp.ClientSession(headers=headers) as session:
-                    return await self._fetch_growth_leaders_data(session, url, params, limit)
-            
             return await self._fetch_growth_leaders_data(self.session, url, params, limit)
             
         except Exception as e:
@@ -90,55 +106,82 @@ class CoinMarketCapAPI:
             traceback.print_exc()
             return []
     
+    async def get_coin_map(self) -> List[Dict[str, Any]]:
+        """Получить справочник активных монет CoinMarketCap (id, symbol, name, slug, rank)"""
+        try:
+            url = f"{self.base_url}/cryptocurrency/map"
+            params = {'listing_status': 'active', 'sort': 'cmc_rank'}
+            status, data = await self._get_json(url, params=params, timeout=aiohttp.ClientTimeout(total=30), cost=self._credits(params))
+            if status != 200:
+                print(f"❌ HTTP {status}: {data}")
+                return []
+            return [
+                {
+                    'cmc_id': coin['id'],
+                    'symbol': coin['symbol'],
+                    'name': coin['name'],
+                    'slug': coin.get('slug'),
+                    'rank': coin.get('rank')
+                }
+                for coin in data.get('data', [])
+            ]
+        except Exception as e:
+            print(f"❌ Ошибка при получении справочника CoinMarketCap: {e}")
+            return []
+    
+    @staticmethod
+    def _market_record(coin: Dict[str, Any]) -> Dict[str, Any]:
+        """Элемент listings/latest -> запись рыночных данных (поля таблицы coin_cache)"""
+        quote = coin['quote']['USD']
+        return {
+            'id': coin['slug'],  # используем slug как id
+            'symbol': coin['symbol'],
+            'name': coin['name'],
+            'current_price': quote['price'],
+            'market_cap': quote['market_cap'],
+            'market_cap_rank': coin['cmc_rank'],
+            'price_change_percentage_24h': quote['percent_change_24h'],
+            'image': f"https://s2.coinmarketcap.com/static/img/coins/64x64/{coin['id']}.png",
+            'total_volume': quote['volume_24h']
+        }
+    
+    @staticmethod
+    def _percent_change_24h(coin: Dict[str, Any]) -> float:
+        try:
+            return coin['quote']['USD']['percent_change_24h'] or 0
+        except (KeyError, TypeError):
+            return 0
+    
     async def _fetch_coins_data(self, session: aiohttp.ClientSession, url: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Получить данные о монетах"""
         try:
-            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=20)) as response:
-                print(f"📡 Получен ответ: HTTP {response.status}")
-                
-                if response.status == 429:
-                    print("⚠️ Rate limit превышен")
-                    return []
-                elif response.status == 401:
-                    print("❌ Неверный API ключ CoinMarketCap")
-                    return []
-                elif response.status != 200:
-                    error_text = await response.text()
-                    print(f"❌ HTTP {response.status}: {error_text}")
-                    return []
-                
-                data = await response.json()
-                
-                if 'data' not in data:
-                    print("⚠️ Нет данных в ответе")
-                    return []
-                
-                coins_data = data['data']
-                print(f"📦 Получено данных: {len(coins_data)} монет")
-                
-                result = []
-                for coin in coins_data:
-                    try:
-                        quote = coin['quote']['USD']
-                        coin_data = {
-                            'id': coin['slug'],  # используем slug как id
-                            'symbol': coin['symbol'],
-                            'name': coin['name'],
-                            'current_price': quote['price'],
-                            'market_cap': quote['market_cap'],
-                            'market_cap_rank': coin['cmc_rank'],
-                            'price_change_percentage_24h': quote['percent_change_24h'],
-                            'image': f"https://s2.coinmarketcap.com/static/img/coins/64x64/{coin['id']}.png",
-                            'total_volume': quote['volume_24h']
-                        }
-                        result.append(coin_data)
-                    except (KeyError, TypeError) as e:
-                        print(f"⚠️ Ошибка обработки монеты {coin.get('symbol', 'unknown')}: {e}")
-                        continue
-                
-                print(f"✅ Обработано успешно: {len(result)} монет")
-                return result
+            status, data = await self._get_json(url, params=params, timeout=aiohttp.ClientTimeout(total=20), cost=self._credits(params), session=session)
+            print(f"📡 Получен ответ: HTTP {status}")
+            
+            if status == 429:
+                print("⚠️ Rate limit превышен")
+                return []
+            elif status == 401:
+                print("❌ Неверный API ключ CoinMarketCap")
+                return []
+            elif status != 200:
+                print(f"❌ HTTP {status}: {data}")
+                return []
+            
+            if 'data' not in data:
+                print("⚠️ Нет данных в ответе")
+                return []
+            
+            coins_data = data['data']
+            print(f"📦 Получено данных: {len(coins_data)} монет")
+            
+            result = project_records(coins_data, self._market_record)
+            print(f"✅ Обработано успешно: {len(result)} монет")
+            return result
                 
+        except CircuitOpenError as e:
+            print(f"⛔ {e}")
+            return []
         except asyncio.TimeoutError:
             print("⏱️ Timeout при получении данных о монетах")
             return []
@@ -151,53 +194,33 @@ class CoinMarketCapAPI:
     async def _fetch_growth_leaders_data(self, session: aiohttp.ClientSession, url: str, params: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
         """Получить данные лидеров роста с фильтрацией"""
         try:
-            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=20)) as response:
-                print(f"📡 Получен ответ: HTTP {response.status}")
-                
-                if response.status != 200:
-                    error_text = await response.text()
-                    print(f"❌ HTTP {response.status}: {error_text}")
-                    return []
-                
-                data = await response.json()
-                
-                if 'data' not in data:
-                    print("⚠️ Нет данных в ответе")
-                    return []
-                
-                coins_data = data['data']
-                print(f"📦 Получено данных: {len(coins_data)} монет")
-                
-                # Фильтруем только монеты с положительным ростом
-                growth_leaders = []
-                for coin in coins_data:
-                    try:
-                        quote = coin['quote']['USD']
-                        price_change = quote.get('percent_change_24h', 0)
-                        
-                        if price_change and price_change > 0:  # Только с положительным ростом
-                            coin_data = {
-                                'id': coin['slug'],
-                                'symbol': coin['symbol'],
-                                'name': coin['name'],
-                                'current_price': quote['price'],
-                                'market_cap': quote['market_cap'],
-                                'market_cap_rank': coin['cmc_rank'],
-                                'price_change_percentage_24h': quote['percent_change_24h'],
-                                'image': f"https://s2.coinmarketcap.com/static/img/coins/64x64/{coin['id']}.png",
-                                'total_volume': quote['volume_24h']
-                            }
-                            growth_leaders.append(coin_data)
-                            
-                            if len(growth_leaders) >= limit:
-                                break
-                    except (KeyError, TypeError) as e:
-                        print(f"⚠️ Ошибка обработки монеты: {e}")
-                        continue
-                
-                print(f"✅ Найдено лидеров роста: {len(growth_leaders)}")
-                return growth_leaders
+            status, data = await self._get_json(url, params=params, timeout=aiohttp.ClientTimeout(total=20), cost=self._credits(params), session=session)
+            print(f"📡 Получен ответ: HTTP {status}")
+            
+            if status != 200:
+                print(f"❌ HTTP {status}: {data}")
+                return []
+            
+            if 'data' not in data:
+                print("⚠️ Нет данных в ответе")
+                return []
+            
+            coins_data = data['data']
+            print(f"📦 Получено данных: {len(coins_data)} монет")
+            
+            # Фильтруем только монеты с положительным ростом
+            growth_leaders = project_records(
+                (coin for coin in coins_data if self._percent_change_24h(coin) > 0),
+                self._market_record,
+                limit
+            )
+            
+            print(f"✅ Найдено лидеров роста: {len(growth_leaders)}")
+            return growth_leaders
                 
+        except CircuitOpenError as e:
+            print(f"⛔ {e}")
+            return []
         except asyncio.TimeoutError:
             print("⏱️ Timeout при получении лидеров роста")
             return []
@@ -207,41 +230,81 @@ class CoinMarketCapAPI:
             traceback.print_exc()
             return []
     
-    async def get_current_prices(self, symbols: List[str]) -> Dict[str, float]:
+    async def get_current_prices(self, symbols: List[str], use_cache: bool = True) -> Dict[str, float]:
         """Получить текущие цены монет по символам"""
+        symbols = list(dict.fromkeys(symbol.lower() for symbol in symbols))
+        # Символы с id CoinMarketCap из справочника идут через кэш цен по id;
+        # неизвестные запрашиваются по символу, цена кладется в кэш под id из ответа
+        keys = {}
+        unknown = []
+        for symbol in symbols:
+            cmc_id = coin_index.cmc_id(symbol)
+            if cmc_id:
+                keys[symbol] = price_key(COINMARKETCAP, cmc_id)
+            else:
+                unknown.append(symbol)
+        unique_keys = list(dict.fromkeys(keys.values()))
+        
+        def load(missing: List[str]):
+            return self._price_flight.do_many(missing, self._fetch_prices_by_key)
+        
+        if not use_cache:
+            # Принудительный запрос к провайдеру (фоновое обновление цен), результат кладем в кэш
+            prices = await load(unique_keys)
+            price_cache.set_many(prices)
+        else:
+            prices = await price_cache.get_or_load(unique_keys, load)
+        
+        result = {symbol: prices[key] for symbol, key in keys.items() if key in prices}
+        if unknown:
+            result.update(await self._price_flight.do_many(unknown, self._fetch_current_prices))
+        return result
+    
+    async def _fetch_prices_by_key(self, keys: List[str]) -> Dict[str, float]:
+        """Запрос цен к CoinMarketCap по ключам кэша цен (price_key)"""
+        cmc_ids = {key: key.split(":", 1)[1] for key in keys}
+        quotes = await self._fetch_quotes({'id': ','.join(cmc_ids.values())})
+        prices = {str(cmc_id): price for cmc_id, _, price in quotes}
+        return {key: prices[cmc_id] for key, cmc_id in cmc_ids.items() if cmc_id in prices}
+    
+    async def _fetch_current_prices(self, symbols: List[str]) -> Dict[str, float]:
+        """Запрос цен к CoinMarketCap по символам (ключи результата - символы в нижнем регистре)"""
+        quotes = await self._fetch_quotes({'symbol': ','.join(symbol.upper() for symbol in symbols)})
+        result = {}
+        for cmc_id, symbol, price in quotes:
+            result[symbol.lower()] = price
+            price_cache.set(price_key(COINMARKETCAP, cmc_id), price)
+        return result
+    
+    async def _fetch_quotes(self, params: Dict[str, Any]) -> List[Tuple[int, str, float]]:
+        """Запрос /cryptocurrency/quotes/latest: список (id CoinMarketCap, символ, цена)"""
         try:
             url = f"{self.base_url}/cryptocurrency/quotes/latest"
-            params = {
-                'symbol': ','.join(symbols),
-                'convert': 'USD'
-            }
+            params = {**params, 'convert': 'USD'}
             
-            print(f"🌐 Запрос цен к CoinMarketCap: {symbols}")
+            print(f"🌐 Запрос цен к CoinMarketCap: {params}")
             
-            async with self.session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    print(f"❌ HTTP {response.status}: {error_text}")
-                    return {}
-                
-                data = await response.json()
-                
-                if 'data' not in data:
-                    return {}
-                
-                result = {}
-                for symbol, coin_data in data['data'].items():
-                    try:
-                        price = coin_data['quote']['USD']['price']
-                        result[symbol.lower()] = price
-                        print(f"💰 {symbol}: ${price}")
-                    except (KeyError, TypeError) as e:
-                        print(f"⚠️ Ошибка получения цены для {symbol}: {e}")
-                        continue
-                
-                print(f"✅ Получено цен: {len(result)}")
-                return result
+            status, data = await self._get_json(url, params=params, timeout=aiohttp.ClientTimeout(total=10), cost=self._credits(params))
+            if status != 200:
+                print(f"❌ HTTP {status}: {data}")
+                return []
+            
+            if 'data' not in data:
+                return []
+            
+            result = []
+            for key, coin_data in data['data'].items():
+                try:
+                    price = coin_data['quote']['USD']['price']
+                    result.append((coin_data['id'], coin_data['symbol'], price))
+                    print(f"💰 {coin_data['symbol']}: ${price}")
+                except (KeyError, TypeError) as e:
+                    print(f"⚠️ Ошибка получения цены для {key}: {e}")
+                    continue
+            
+            print(f"✅ Получено цен: {len(result)}")
+            return result
                 
         except Exception as e:
             print(f"❌ Ошибка при получении цен: {e}")
-            return {}
+            return []
@@ -0,0 +1,121 @@
+"""
+Матрица курсов валют котировки (фиат, BTC, ETH)
+
+Провайдеры всегда запрашиваются в USD. Курсы остальных валют котировки
+обновляются в фоне одним запросом /exchange_rates и хранятся в памяти;
+пересчет цен и стоимости портфеля в EUR/RUB/BTC/... выполняется без
+дополнительных запросов к провайдерам.
+"""
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
+
+from shared.config import settings
+
+Amount = TypeVar("Amount", float, Decimal)
+
+# Поля рыночных данных, выраженные в валюте котировки
+MARKET_VALUE_FIELDS = ('current_price', 'market_cap', 'total_volume')
+
+CURRENCY_SIGNS = {"usd": "$", "eur": "€", "rub": "₽", "btc": "₿", "eth": "Ξ"}
+
+
+class UnsupportedCurrencyError(ValueError):
+    """Валюта не входит в QUOTE_CURRENCIES"""
+
+
+class FXRatesUnavailableError(RuntimeError):
+    """Курс валюты еще не загружен"""
+
+
+class FXRates:
+    """Курсы валют котировки: сколько единиц валюты стоит 1 USD"""
+
+    def __init__(self, currencies: Iterable[str], clock: Callable[[], float] = time.time):
+        self.currencies: List[str] = [currency.lower() for currency in currencies]
+        if "usd" not in self.currencies:
+            self.currencies.insert(0, "usd")
+        self._clock = clock
+        self._rates: Dict[str, Decimal] = {"usd": Decimal(1)}
+        self.updated_at: Optional[float] = None
+        self.refreshes = 0
+
+    def normalize(self, currency: Optional[str]) -> str:
+        """Проверить код валюты (пустой - USD)"""
+        currency = (currency or "usd").lower()
+        if currency not in self.currencies:
+            raise UnsupportedCurrencyError(
+                f"Валюта {currency} не поддерживается, доступны: {', '.join(self.currencies)}"
+            )
+        return currency
+
+    def set_btc_rates(self, btc_rates: Dict[str, float]) -> int:
+        """Обновить матрицу по курсам к BTC (ответ /exchange_rates)"""
+        usd_per_btc = btc_rates.get("usd")
+        if not usd_per_btc:
+            return 0
+        updated = 0
+        for currency in self.currencies:
+            value = btc_rates.get(currency)
+            if value:
+                self._rates[currency] = Decimal(str(value)) / Decimal(str(usd_per_btc))
+                updated += 1
+        self.updated_at = self._clock()
+        self.refreshes += 1
+        return updated
+
+    def rate(self, currency: str) -> Decimal:
+        """Единиц валюты за 1 USD"""
+        currency = self.normalize(currency)
+        rate = self._rates.get(currency)
+        if rate is None:
+            raise FXRatesUnavailableError(f"Курс {currency} еще не загружен")
+        return rate
+
+    def convert(self, amount_usd: Amount, currency: str) -> Amount:
+        """Пересчитать сумму в USD в валюту котировки (тип результата - как у суммы)"""
+        rate = self.rate(currency)
+        if isinstance(amount_usd, Decimal):
+            return amount_usd * rate
+        return amount_usd * float(rate)
+
+    def convert_market_record(self, coin: Dict[str, Any], currency: str) -> Dict[str, Any]:
+        """Пересчитать цену, капитализацию и объем записи рынка"""
+        rate = float(self.rate(currency))
+        converted = dict(coin)
+        for field in MARKET_VALUE_FIELDS:
+            if converted.get(field) is not None:
+                converted[field] = converted[field] * rate
+        return converted
+
+    def format(self, amount_usd: Amount, currency: str, digits: int = 2) -> str:
+        """Сумма в валюте котировки для сообщений бота ('$12.50', '₽1020.00')"""
+        currency = self.normalize(currency)
+        value = self.convert(amount_usd, currency)
+        if currency in ("btc", "eth"):
+            digits = max(digits, 8)
+        sign = CURRENCY_SIGNS.get(currency)
+        if sign:
+            return f"{sign}{value:.{digits}f}"
+        return f"{value:.{digits}f} {currency.upper()}"
+
+    def age_seconds(self) -> Optional[float]:
+        if self.updated_at is None:
+            return None
+        return self._clock() - self.updated_at
+
+    def stats(self) -> Dict[str, Any]:
+        age = self.age_seconds()
+        return {
+            "currencies": self.currencies,
+            "rates": {currency: float(rate) for currency, rate in self._rates.items()},
+            "refreshes": self.refreshes,
+            "age_seconds": round(age, 1) if age is not None else None,
+        }
+
+
+def parse_currencies(value: str) -> List[str]:
+    return [currency.strip().lower() for currency in value.split(",") if currency.strip()]
+
+
+fx_rates = FXRates(parse_currencies(settings.QUOTE_CURRENCIES))
@@ -0,0 +1,175 @@
+"""
+HTTP-кэш ответов внешних API (conditional GET)
+
+Ключ - провайдер + URL + параметры запроса. Хранится сырое тело ответа и
+валидаторы (ETag, Last-Modified); размер кэша ограничен суммой байт тел
+(max_bytes), а не числом записей. Разобранные документы в кэше не живут:
+тело разбирается заново при каждом использовании и отбрасывается после
+сведения к записям. Пока не истек max-age из Cache-Control, ответ отдается
+без запроса к провайдеру; после - запрос уходит с If-None-Match/
+If-Modified-Since, и на 304 повторно используется сохраненное тело (без
+скачивания).
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from shared.config import settings
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Разобрать заголовок Cache-Control в словарь директив"""
+    directives: Dict[str, Optional[str]] = {}
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip().lower()] = arg.strip().strip('"') or None
+    return directives
+
+
+@dataclass
+class CachedResponse:
+    """Закэшированный ответ: сырое тело и валидаторы"""
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    expires_at: float
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    @property
+    def revalidatable(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+
+class HTTPResponseCache:
+    """LRU-кэш ответов с учетом Cache-Control, ETag и Last-Modified"""
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(provider: str, url: str, params: Optional[Mapping[str, Any]] = None) -> str:
+        query = "&".join(f"{name}={params[name]}" for name in sorted(params or {}))
+        return f"{provider} {url}?{query}"
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def is_fresh(self, entry: CachedResponse) -> bool:
+        return self._clock() < entry.expires_at
+
+    def lookup(self, key: str) -> Optional[CachedResponse]:
+        """Свежий ответ без запроса к провайдеру (или None)"""
+        entry = self.get(key)
+        if entry is not None and self.is_fresh(entry):
+            self.hits += 1
+            self.bytes_saved += entry.size
+            return entry
+        return None
+
+    @staticmethod
+    def conditional_headers(entry: Optional[CachedResponse]) -> Dict[str, str]:
+        """Заголовки для повторной проверки устаревшего ответа"""
+        headers: Dict[str, str] = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def _max_age(self, headers: Mapping[str, str]) -> Optional[float]:
+        """Время жизни ответа; None - ответ не кэшируется"""
+        directives = parse_cache_control(headers.get("Cache-Control"))
+        if "no-store" in directives or "private" in directives:
+            return None
+        if "no-cache" in directives:
+            return 0.0
+        try:
+            max_age = float(directives.get("s-maxage") or directives.get("max-age") or 0)
+            age = float(headers.get("Age") or 0)
+        except ValueError:
+            return 0.0
+        return max(0.0, max_age - age)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+    def store(self, key: str, body: bytes, headers: Mapping[str, str]) -> Optional[CachedResponse]:
+        """Сохранить тело ответа 200, если его можно использовать повторно"""
+        self.misses += 1
+        max_age = self._max_age(headers)
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        self._remove(key)
+        if max_age is None or (max_age == 0 and not (etag or last_modified)) or len(body) > self.max_bytes:
+            return None
+
+        entry = CachedResponse(
+            body=bytes(body),
+            etag=etag,
+            last_modified=last_modified,
+            expires_at=self._clock() + max_age,
+        )
+        self._insert(key, entry)
+        return entry
+
+    def _insert(self, key: str, entry: CachedResponse):
+        self._remove(key)
+        self._entries[key] = entry
+        self.total_bytes += entry.size
+        # Вытесняются давно не использованные ответы, пока сумма тел не уложится в max_bytes
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= evicted.size
+            self.evictions += 1
+
+    def revalidate(self, key: str, entry: CachedResponse, headers: Mapping[str, str]) -> CachedResponse:
+        """Ответ 304: продлить закэшированный ответ новыми заголовками"""
+        self.revalidated += 1
+        self.bytes_saved += entry.size
+        max_age = self._max_age(headers)
+        entry.expires_at = self._clock() + (max_age or 0.0)
+        entry.etag = headers.get("ETag") or entry.etag
+        entry.last_modified = headers.get("Last-Modified") or entry.last_modified
+        self._insert(key, entry)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+http_response_cache = HTTPResponseCache(max_bytes=settings.HTTP_CACHE_MAX_BYTES)
@@ -0,0 +1,76 @@
+"""
+Общие HTTP клиенты для внешних API (CoinGecko, CoinMarketCap)
+
+Одна долгоживущая aiohttp-сессия на провайдера: keep-alive пул соединений,
+кэш DNS и лимиты на хост. Сессии создаются в lifespan приложения
+и закрываются при остановке.
+"""
+import aiohttp
+from typing import Dict, Optional
+
+from shared.config import settings
+
+
+COINGECKO = "coingecko"
+COINMARKETCAP = "coinmarketcap"
+
+
+def create_http_session(headers: Optional[Dict[str, str]] = None) -> aiohttp.ClientSession:
+    """Создать сессию с пулом соединений по настройкам приложения"""
+    connector = aiohttp.TCPConnector(
+        ssl=False,  # Отключенная проверка SSL для разработки (как и раньше)
+        limit=settings.HTTP_POOL_LIMIT,
+        limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+        use_dns_cache=True,
+        keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=headers,
+        timeout=aiohttp.ClientTimeout(total=settings.HTTP_REQUEST_TIMEOUT),
+    )
+
+
+class HTTPClientPool:
+    """Реестр общих HTTP сессий по провайдерам"""
+
+    def __init__(self):
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    async def start(self):
+        """Создать сессии для всех провайдеров (вызывается из lifespan)"""
+        self.coingecko()
+        if settings.COINMARKETCAP_API_KEY:
+            self.coinmarketcap()
+        print(f"✅ HTTP клиенты созданы: {', '.join(self._sessions)}")
+
+    def coingecko(self) -> aiohttp.ClientSession:
+        """Общая сессия CoinGecko"""
+        return self._get_or_create(COINGECKO, None)
+
+    def coinmarketcap(self) -> aiohttp.ClientSession:
+        """Общая сессия CoinMarketCap (с API ключом в заголовках)"""
+        headers = {
+            'X-CMC_PRO_API_KEY': settings.COINMARKETCAP_API_KEY,
+            'Accept': 'application/json'
+        }
+        return self._get_or_create(COINMARKETCAP, headers)
+
+    def _get_or_create(self, name: str, headers: Optional[Dict[str, str]]) -> aiohttp.ClientSession:
+        session = self._sessions.get(name)
+        if session is None or session.closed:
+            # Ленивое создание, если lifespan не запускался (скрипты, бот)
+            session = create_http_session(headers)
+            self._sessions[name] = session
+        return session
+
+    async def close(self):
+        """Закрыть все сессии (вызывается при остановке приложения)"""
+        for session in self._sessions.values():
+            if not session.closed:
+                await session.close()
+        self._sessions.clear()
+
+
+http_clients = HTTPClientPool()
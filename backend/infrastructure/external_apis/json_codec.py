@@ -0,0 +1,42 @@
+"""
+Декодирование JSON ответов внешних API
+
+Если установлен orjson, ответ разбирается прямо из байтов - без промежуточной
+строки и в разы быстрее стандартного json; без orjson (он необязателен)
+используется json из stdlib. Документ разбирается целиком, затем элементы
+больших ответов (/coins/markets, listings/latest) сводятся project_records к
+компактным записям рыночных данных. Разобранный документ не сохраняется:
+после обработки ответа в памяти остаются только записи.
+"""
+import json
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: bytes) -> Any:
+    """Разобрать JSON из байтов (orjson, если доступен)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def project_records(
+    items: Iterable[Dict[str, Any]],
+    project: Callable[[Dict[str, Any]], Dict[str, Any]],
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Свести элементы ответа к компактным записям, пропуская неполные"""
+    result = []
+    for item in items:
+        try:
+            result.append(project(item))
+        except (KeyError, TypeError, AttributeError) as e:
+            print(f"⚠️ Отсутствует поле {e} в данных монеты {item.get('id', 'unknown') if isinstance(item, dict) else 'unknown'}")
+            continue
+        if limit is not None and len(result) >= limit:
+            break
+    return result
@@ -0,0 +1,170 @@
+"""
+In-memory кэш цен (TTL + LRU) перед запросами к внешним API
+
+Ключ - провайдер и id монеты у него (price_key('coingecko', 'bitcoin')), а не
+тикер: один тикер бывает у многих монет, и по символу в одной ячейке
+оказались бы цены разных монет. Символ переводится в id через справочник
+монет до обращения к кэшу.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from shared.config import settings
+
+
+def price_key(provider: str, coin_id: Any) -> str:
+    """Ключ кэша цен: провайдер и id монеты у провайдера"""
+    return f"{provider}:{coin_id}"
+
+
+class PriceCache:
+    """Ограниченный по размеру кэш цен с TTL, LRU вытеснением и отдачей устаревших значений"""
+
+    def __init__(self, max_size: int = 5000, ttl_seconds: float = 60,
+                 stale_ttl_seconds: float = 600, serve_stale: bool = True,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.stale_ttl_seconds = stale_ttl_seconds
+        self.serve_stale = serve_stale
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._refreshing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: str) -> Tuple[Optional[Any], Optional[float]]:
+        """Вернуть (значение, возраст) или (None, None), удаляя совсем старые записи"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, None
+        value, stored_at = entry
+        age = self._clock() - stored_at
+        if age > self.ttl_seconds + self.stale_ttl_seconds:
+            del self._entries[key]
+            return None, None
+        self._entries.move_to_end(key)
+        return value, age
+
+    def get(self, key: str) -> Optional[Any]:
+        """Получить свежее значение из кэша"""
+        value, age = self._lookup(key)
+        if value is not None and age <= self.ttl_seconds:
+            self.hits += 1
+            return value
+        self.misses += 1
+        return None
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        """Получить значение, даже если TTL истек (но не старше stale_ttl)"""
+        value, _ = self._lookup(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        """Сохранить значение"""
+        self._entries[key] = (value, self._clock())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def set_many(self, values: Dict[str, Any]):
+        """Сохранить несколько значений"""
+        for key, value in values.items():
+            if value is not None:
+                self.set(key, value)
+
+    async def get_or_load(
+        self,
+        keys: Iterable[str],
+        loader: Callable[[List[str]], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """Вернуть цены из кэша, недостающие загрузить одним вызовом loader(missing).
+
+        Устаревшие значения при serve_stale отдаются сразу, а обновляются в фоне.
+        Если загрузка не удалась, для ключа отдается последнее известное значение.
+        """
+        result: Dict[str, Any] = {}
+        missing: List[str] = []
+        stale: List[str] = []
+
+        for key in dict.fromkeys(keys):
+            value, age = self._lookup(key)
+            if value is None:
+                self.misses += 1
+                missing.append(key)
+            elif age <= self.ttl_seconds:
+                self.hits += 1
+                result[key] = value
+            elif self.serve_stale:
+                self.stale_hits += 1
+                result[key] = value
+                stale.append(key)
+            else:
+                self.misses += 1
+                missing.append(key)
+
+        if stale:
+            self._schedule_refresh(stale, loader)
+
+        if missing:
+            loaded = await loader(missing) or {}
+            self.set_many(loaded)
+            for key in missing:
+                value = loaded.get(key)
+                if value is None:
+                    value = self.get_stale(key)
+                if value is not None:
+                    result[key] = value
+
+        return result
+
+    def _schedule_refresh(self, keys: List[str], loader: Callable[[List[str]], Awaitable[Dict[str, Any]]]):
+        """Фоновое обновление устаревших ключей (не больше одного на ключ)"""
+        keys = [key for key in keys if key not in self._refreshing]
+        if not keys:
+            return
+        self._refreshing.update(keys)
+
+        async def _refresh():
+            try:
+                self.set_many(await loader(keys) or {})
+            except Exception as e:
+                print(f"⚠️ Ошибка фонового обновления цен {keys}: {e}")
+            finally:
+                self._refreshing.difference_update(keys)
+
+        task = asyncio.create_task(_refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий/промахов"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+price_cache = PriceCache(
+    max_size=settings.PRICE_CACHE_MAX_SIZE,
+    ttl_seconds=settings.PRICE_CACHE_TTL_SECONDS,
+    stale_ttl_seconds=settings.PRICE_CACHE_STALE_SECONDS,
+    serve_stale=settings.PRICE_CACHE_SERVE_STALE,
+)
@@ -0,0 +1,173 @@
+"""
+Маршрутизация запросов между провайдерами с хеджированием
+
+Запрос уходит основному провайдеру. Если он не ответил за свой наблюдаемый
+p90 (или ответил ошибкой/пустым результатом), параллельно запускается
+следующий провайдер. Берется первый непустой ответ, остальные запросы
+отменяются, поэтому худшая задержка - примерно один таймаут провайдера.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from shared.config import settings
+from .base import MarketDataProvider
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных ответов провайдера"""
+
+    def __init__(self, window: int = 100, default_seconds: float = 2.0):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self.default_seconds = default_seconds
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.cancelled = 0
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        """Перцентиль задержки (пока нет данных - значение по умолчанию)"""
+        if not self._samples:
+            return self.default_seconds
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "cancelled": self.cancelled,
+            "samples": len(self._samples),
+            "p50_seconds": round(self.percentile(50), 3),
+            "p90_seconds": round(self.percentile(90), 3),
+        }
+
+
+class ProviderRouter:
+    """Хеджированные запросы к нескольким провайдерам в порядке приоритета"""
+
+    def __init__(self, providers: List[MarketDataProvider], timeout: float = 20.0,
+                 min_hedge_delay: float = 0.2):
+        self.providers = providers
+        self.timeout = timeout
+        self.min_hedge_delay = min_hedge_delay
+        self.latency: Dict[str, LatencyTracker] = {
+            provider.name: LatencyTracker(default_seconds=settings.HEDGE_DEFAULT_DELAY_SECONDS)
+            for provider in providers
+        }
+        self.hedges = 0
+        self.wins: Dict[str, int] = {provider.name: 0 for provider in providers}
+
+    async def get_top_coins(self, limit: int = 100) -> List[Dict[str, Any]]:
+        result, _ = await self.call('get_top_coins', limit)
+        return result or []
+
+    async def get_growth_leaders(self, limit: int = 20) -> List[Dict[str, Any]]:
+        result, _ = await self.call('get_growth_leaders', limit)
+        return result or []
+
+    async def get_current_prices(self, symbols: List[str]) -> Dict[str, float]:
+        result, _ = await self.call('get_current_prices', symbols)
+        return result or {}
+
+    async def _timed(self, provider: MarketDataProvider, method: str, *args) -> Any:
+        tracker = self.latency[provider.name]
+        tracker.requests += 1
+        started = time.monotonic()
+        try:
+            result = await getattr(provider, method)(*args)
+        except asyncio.CancelledError:
+            tracker.cancelled += 1
+            raise
+        except Exception as e:
+            tracker.failures += 1
+            print(f"❌ {provider.name}.{method}: {e}")
+            return None
+        if result:
+            tracker.successes += 1
+            tracker.record(time.monotonic() - started)
+        else:
+            tracker.failures += 1
+        return result
+
+    async def call(self, method: str, *args) -> Tuple[Optional[Any], Optional[str]]:
+        """Вызвать метод у провайдеров с хеджированием; вернуть (результат, имя провайдера)"""
+        if not self.providers:
+            return None, None
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        queue = list(self.providers)
+        running: Dict[asyncio.Task, str] = {}
+
+        def launch():
+            provider = queue.pop(0)
+            task = asyncio.create_task(self._timed(provider, method, *args))
+            running[task] = provider.name
+            return provider
+
+        current = launch()
+        try:
+            while running:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+
+                wait_for = remaining
+                if queue:
+                    hedge_delay = max(self.min_hedge_delay, self.latency[current.name].percentile(90))
+                    wait_for = min(remaining, hedge_delay)
+
+                done, _ = await asyncio.wait(running, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    name = running.pop(task)
+                    result = task.result()
+                    if result:
+                        self.wins[name] += 1
+                        return result, name
+
+                # Ответа нет дольше p90 или провайдер ответил ошибкой - подключаем следующий
+                if queue and (not done or not running):
+                    if not done:
+                        self.hedges += 1
+                        print(f"⏱️ {current.name} не ответил за p90, хеджируем запрос {method}")
+                    current = launch()
+
+            print(f"❌ Ни один провайдер не вернул данные для {method}")
+            return None, None
+        finally:
+            for task in running:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "order": [provider.name for provider in self.providers],
+            "hedges": self.hedges,
+            "wins": self.wins,
+            "providers": {name: tracker.stats() for name, tracker in self.latency.items()},
+        }
+
+
+_market_router: Optional[ProviderRouter] = None
+
+
+def get_market_router() -> ProviderRouter:
+    """Общий роутер рыночных данных: CoinMarketCap (если есть ключ), затем CoinGecko"""
+    global _market_router
+    if _market_router is None:
+        from .coin_gecko_api import CoinGeckoAPI
+        from .coinmarketcap_api import CoinMarketCapAPI
+
+        providers: List[MarketDataProvider] = []
+        if settings.COINMARKETCAP_API_KEY:
+            providers.append(CoinMarketCapAPI(settings.COINMARKETCAP_API_KEY))
+        providers.append(CoinGeckoAPI())
+        _market_router = ProviderRouter(providers, timeout=settings.MARKET_DATA_TIMEOUT_SECONDS)
+    return _market_router
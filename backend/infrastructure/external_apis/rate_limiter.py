@@ -0,0 +1,114 @@
+"""
+Ограничение частоты запросов к внешним API (token bucket)
+
+Один лимитер на провайдера, общий для всех вызовов CoinGeckoAPI/CoinMarketCapAPI.
+Запрос ждет только тогда, когда токенов действительно не осталось.
+Для CoinMarketCap дополнительно учитывается месячный бюджет кредитов.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from shared.config import settings
+from .http_client import COINGECKO, COINMARKETCAP
+
+
+class RateLimitExceeded(Exception):
+    """Исчерпан месячный бюджет запросов провайдера"""
+
+
+class TokenBucket:
+    """Асинхронный token bucket с метриками ожидания"""
+
+    def __init__(self, name: str, requests_per_minute: float, burst: Optional[int] = None,
+                 monthly_budget: Optional[int] = None, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.rate_per_second = requests_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, int(requests_per_minute // 6)))
+        self.monthly_budget = monthly_budget
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = asyncio.Lock()
+
+        self._month = self._current_month()
+        self.monthly_used = 0
+
+        self.acquired = 0
+        self.waited = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @staticmethod
+    def _current_month() -> str:
+        return datetime.utcnow().strftime('%Y-%m')
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    def _check_budget(self, cost: int):
+        if self.monthly_budget is None:
+            return
+        month = self._current_month()
+        if month != self._month:
+            self._month = month
+            self.monthly_used = 0
+        if self.monthly_used + cost > self.monthly_budget:
+            raise RateLimitExceeded(
+                f"{self.name}: исчерпан месячный бюджет ({self.monthly_used}/{self.monthly_budget})"
+            )
+
+    async def acquire(self, cost: int = 1):
+        """Дождаться разрешения на запрос стоимостью cost"""
+        # Исчерпанный бюджет отклоняет запрос сразу, без ожидания токена
+        self._check_budget(cost)
+        started = self._clock()
+        async with self._lock:
+            while True:
+                self._refill()
+                # Запрос дороже емкости ведра ждет полного ведра, а не бесконечно
+                needed = min(float(cost), self.capacity)
+                if self._tokens >= needed:
+                    # Кредиты списываются вместе с выдачей токена, прямо перед запросом:
+                    # отмененное ожидание (проигравший hedge-запрос) бюджет не тратит
+                    self._check_budget(cost)
+                    if self.monthly_budget is not None:
+                        self.monthly_used += cost
+                    self._tokens -= needed
+                    break
+                await asyncio.sleep((needed - self._tokens) / self.rate_per_second)
+
+        waited = self._clock() - started
+        self.acquired += 1
+        if waited > 0.001:
+            self.waited += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики ожидания"""
+        return {
+            "requests_per_minute": round(self.rate_per_second * 60, 2),
+            "capacity": self.capacity,
+            "available_tokens": round(self._tokens, 2),
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "total_wait_seconds": round(self.total_wait_seconds, 3),
+            "avg_wait_seconds": round(self.total_wait_seconds / self.waited, 3) if self.waited else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+            "monthly_budget": self.monthly_budget,
+            "monthly_used": self.monthly_used,
+        }
+
+
+rate_limiters: Dict[str, TokenBucket] = {
+    COINGECKO: TokenBucket(COINGECKO, settings.COINGECKO_RATE_LIMIT_PER_MINUTE),
+    COINMARKETCAP: TokenBucket(
+        COINMARKETCAP,
+        settings.COINMARKETCAP_RATE_LIMIT_PER_MINUTE,
+        monthly_budget=settings.COINMARKETCAP_MONTHLY_CREDITS or None,
+    ),
+}
@@ -0,0 +1,95 @@
+"""
+Объединение (single-flight) одновременных запросов к внешним API
+
+Если несколько запросов одновременно просят цену одной и той же монеты,
+к провайдеру уходит только один запрос, остальные ждут его результат.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List
+
+
+class SingleFlight:
+    """Коалесцирование одновременных запросов по ключу"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0      # Сколько раз реально вызывался загрузчик
+        self.shared = 0     # Сколько ключей получили чужой результат
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполнить fn() один раз для всех одновременных вызовов с ключом key"""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.calls += 1
+        try:
+            result = await fn()
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # Ожидающих может не быть - помечаем исключение как полученное
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def do_many(
+        self,
+        keys: Iterable[Hashable],
+        fetch_many: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+    ) -> Dict[Hashable, Any]:
+        """Пакетный вариант: ключи, которые уже запрашиваются, ждут чужой запрос,
+        остальные загружаются одним вызовом fetch_many(missing).
+
+        Ключи, которых нет в ответе (или при ошибке загрузчика), в результат не попадают.
+        """
+        waiting: Dict[Hashable, asyncio.Future] = {}
+        owned: Dict[Hashable, asyncio.Future] = {}
+        loop = asyncio.get_running_loop()
+
+        for key in dict.fromkeys(keys):  # дедупликация с сохранением порядка
+            future = self._inflight.get(key)
+            if future is not None:
+                waiting[key] = future
+                self.shared += 1
+            else:
+                future = loop.create_future()
+                self._inflight[key] = future
+                owned[key] = future
+
+        result: Dict[Hashable, Any] = {}
+
+        if owned:
+            self.calls += 1
+            data: Dict[Hashable, Any] = {}
+            try:
+                data = await fetch_many(list(owned)) or {}
+            except Exception as e:
+                print(f"❌ Ошибка загрузки {list(owned)}: {e}")
+            finally:
+                # Будим ожидающих даже при ошибке или отмене (для них ключ просто не найден)
+                for key, future in owned.items():
+                    self._inflight.pop(key, None)
+                    if not future.done():
+                        future.set_result(data.get(key))
+            for key in owned:
+                if data.get(key) is not None:
+                    result[key] = data[key]
+
+        for key, future in waiting.items():
+            value = await asyncio.shield(future)
+            if value is not None:
+                result[key] = value
+
+        return result
@@ -0,0 +1 @@
+# Live price feeds
@@ -0,0 +1,85 @@
+"""
+Общий интерфейс потоковых источников цен
+"""
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Optional
+
+
+@dataclass(frozen=True)
+class PriceTick:
+    """Нормализованное обновление цены"""
+    symbol: str  # Символ в нижнем регистре ('btc')
+    price: float  # Цена в USD
+    ts: float  # Unix-время обновления в секундах
+    source: str = "feed"
+
+
+def normalize_tick(raw: Any, source: str = "feed") -> Optional[PriceTick]:
+    """Привести сообщение источника к PriceTick (None - сообщение не о цене)
+
+    Понимает PriceTick и словари с ключами symbol/s, price/p/c и ts/t/timestamp
+    (секунды или миллисекунды). Символы вида BTCUSDT сводятся к 'btc'.
+    """
+    if isinstance(raw, PriceTick):
+        return raw
+    if not isinstance(raw, dict):
+        return None
+
+    symbol = raw.get("symbol") or raw.get("s")
+    price = raw.get("price", raw.get("p", raw.get("c")))
+    if not symbol or price is None:
+        return None
+
+    symbol = str(symbol).lower()
+    for quote in ("usdt", "usd"):
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            symbol = symbol[:-len(quote)]
+            break
+
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return None
+    if price <= 0:
+        return None
+
+    ts = raw.get("ts", raw.get("t", raw.get("timestamp")))
+    try:
+        ts = float(ts) if ts is not None else time.time()
+    except (TypeError, ValueError):
+        ts = time.time()
+    if ts > 1e11:  # миллисекунды
+        ts /= 1000
+
+    return PriceTick(symbol=symbol, price=price, ts=ts, source=raw.get("source") or source)
+
+
+class PriceFeed(ABC):
+    """Источник потока цен (WebSocket, запись для воспроизведения и т.п.)"""
+
+    name: str = "feed"
+
+    @abstractmethod
+    def ticks(self) -> AsyncIterator[PriceTick]:
+        """Асинхронный поток нормализованных обновлений цен"""
+        pass
+
+
+class IteratorFeed(PriceFeed):
+    """Источник из любого асинхронного итератора сообщений"""
+
+    def __init__(self, messages: AsyncIterable[Any], name: str = "iterator"):
+        self.messages = messages
+        self.name = name
+
+    async def ticks(self) -> AsyncIterator[PriceTick]:
+        async for message in self.messages:
+            tick = normalize_tick(message, self.name)
+            if tick:
+                yield tick
+
+
+def tick_to_dict(tick: PriceTick) -> Dict[str, Any]:
+    return {"symbol": tick.symbol, "price": tick.price, "ts": tick.ts, "source": tick.source}
@@ -0,0 +1,83 @@
+"""
+Прием потока цен в общую таблицу live_prices
+"""
+import asyncio
+from typing import Any, Dict, Optional
+
+from infrastructure.external_apis.coin_directory import coin_index
+from infrastructure.external_apis.http_client import COINGECKO
+from infrastructure.external_apis.price_cache import price_cache, price_key
+from shared.config import settings
+from .base import PriceFeed
+from .price_table import LivePriceTable, live_prices
+
+
+class PriceFeedIngestor:
+    """Читает источник цен и пишет тики в таблицу (и в in-memory кэш цен)"""
+
+    def __init__(self, feed: PriceFeed, table: LivePriceTable = live_prices,
+                 update_price_cache: bool = True, restart_delay: float = 5.0):
+        self.feed = feed
+        self.table = table
+        self.update_price_cache = update_price_cache
+        self.restart_delay = restart_delay
+        self.ingested = 0
+        self.running = False
+        self.last_error: Optional[str] = None
+
+    async def run_once(self) -> int:
+        """Прочитать источник до конца (для бесконечных источников - до отмены)"""
+        count = 0
+        async for tick in self.feed.ticks():
+            if self.table.update(tick) and self.update_price_cache:
+                # Кэш цен ключуется id монеты: тикер переводится через справочник
+                coin_id = coin_index.coingecko_id(tick.symbol)
+                if coin_id:
+                    price_cache.set(price_key(COINGECKO, coin_id), tick.price)
+            count += 1
+            self.ingested += 1
+        return count
+
+    async def run(self):
+        """Основной цикл (запускается из lifespan); ошибки источника не роняют приложение"""
+        self.running = True
+        try:
+            while True:
+                try:
+                    count = await self.run_once()
+                    print(f"ℹ️ Поток цен {self.feed.name} завершен ({count} тиков)")
+                    return
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.last_error = str(e)
+                    print(f"❌ Ошибка потока цен {self.feed.name}: {e}")
+                    await asyncio.sleep(self.restart_delay)
+        finally:
+            self.running = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "feed": self.feed.name,
+            "running": self.running,
+            "ingested": self.ingested,
+            "last_error": self.last_error,
+        }
+
+
+def create_feed_from_settings() -> Optional[PriceFeed]:
+    """Источник цен по PRICE_FEED_SOURCE (None - поток цен отключен)"""
+    source = settings.PRICE_FEED_SOURCE.lower()
+    if source == "replay":
+        from .replay import ReplayFeed
+        return ReplayFeed(
+            settings.PRICE_FEED_REPLAY_PATH,
+            speed=settings.PRICE_FEED_REPLAY_SPEED,
+            loop=settings.PRICE_FEED_REPLAY_LOOP,
+        )
+    if source == "websocket":
+        from .websocket import WebSocketFeed
+        return WebSocketFeed(settings.PRICE_FEED_WS_URL)
+    if source:
+        print(f"⚠️ Неизвестный источник цен PRICE_FEED_SOURCE={source}")
+    return None
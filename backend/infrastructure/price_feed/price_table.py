@@ -0,0 +1,123 @@
+"""
+Общая in-memory таблица текущих цен из потоковых источников
+
+Хранит последнюю цену по каждому символу и рассылает обновления подписчикам.
+Каждый подписчик получает свою ограниченную очередь: медленный подписчик теряет
+самые старые обновления, но не тормозит прием цен и других подписчиков.
+"""
+import asyncio
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from .base import PriceTick
+
+
+class Subscription:
+    """Подписка на обновления цен (асинхронный итератор PriceTick)"""
+
+    def __init__(self, table: "LivePriceTable", symbols: Optional[Set[str]], maxsize: int):
+        self._table = table
+        self.symbols = symbols
+        self.queue: "asyncio.Queue[Optional[PriceTick]]" = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def wants(self, tick: PriceTick) -> bool:
+        return self.symbols is None or tick.symbol in self.symbols
+
+    def push(self, tick: Optional[PriceTick]):
+        if self.queue.full():
+            # Отбрасываем самое старое обновление - важна последняя цена
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(tick)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._table._unsubscribe(self)
+            self.push(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> PriceTick:
+        tick = await self.queue.get()
+        if tick is None:
+            raise StopAsyncIteration
+        return tick
+
+
+class LivePriceTable:
+    """Последние цены по символам с рассылкой обновлений подписчикам"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._prices: Dict[str, PriceTick] = {}
+        self._subscribers: List[Subscription] = []
+
+        self.ticks = 0
+        self.updates = 0
+        self.out_of_order = 0
+
+    def __len__(self) -> int:
+        return len(self._prices)
+
+    def update(self, tick: PriceTick) -> bool:
+        """Принять обновление; устаревшие (более старые, чем текущее) игнорируются"""
+        self.ticks += 1
+        current = self._prices.get(tick.symbol)
+        if current is not None and tick.ts < current.ts:
+            self.out_of_order += 1
+            return False
+
+        self._prices[tick.symbol] = tick
+        self.updates += 1
+        for subscriber in self._subscribers:
+            if subscriber.wants(tick):
+                subscriber.push(tick)
+        return True
+
+    def get(self, symbol: str, max_age: Optional[float] = None) -> Optional[PriceTick]:
+        """Последняя цена символа (None - нет или старше max_age секунд)"""
+        tick = self._prices.get(symbol.lower())
+        if tick is None:
+            return None
+        if max_age is not None and self._clock() - tick.ts > max_age:
+            return None
+        return tick
+
+    def get_many(self, symbols: Iterable[str], max_age: Optional[float] = None) -> Dict[str, PriceTick]:
+        result = {}
+        for symbol in symbols:
+            tick = self.get(symbol, max_age)
+            if tick is not None:
+                result[tick.symbol] = tick
+        return result
+
+    def subscribe(self, symbols: Optional[Iterable[str]] = None, maxsize: int = 1000) -> Subscription:
+        """Подписаться на обновления (всех символов или только указанных)"""
+        wanted = {symbol.lower() for symbol in symbols} if symbols is not None else None
+        subscription = Subscription(self, wanted, maxsize)
+        self._subscribers.append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        if subscription in self._subscribers:
+            self._subscribers.remove(subscription)
+
+    def stats(self) -> Dict[str, Any]:
+        now = self._clock()
+        newest = max((tick.ts for tick in self._prices.values()), default=None)
+        return {
+            "symbols": len(self._prices),
+            "ticks": self.ticks,
+            "updates": self.updates,
+            "out_of_order": self.out_of_order,
+            "subscribers": len(self._subscribers),
+            "dropped": sum(subscriber.dropped for subscriber in self._subscribers),
+            "newest_age_seconds": round(now - newest, 3) if newest is not None else None,
+        }
+
+
+live_prices = LivePriceTable()
@@ -0,0 +1,78 @@
+"""
+Воспроизведение записанного потока цен (локально, без сети)
+
+Формат записи - NDJSON, по одному тику на строку:
+{"ts": 1760000000.0, "symbol": "btc", "price": 112000.5, "source": "binance"}
+"""
+import asyncio
+import json
+import time
+from typing import AsyncIterator, List, Optional
+
+from .base import PriceFeed, PriceTick, normalize_tick, tick_to_dict
+
+
+def load_ticks(path: str) -> List[PriceTick]:
+    """Прочитать записанные тики (некорректные строки пропускаются)"""
+    ticks = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                tick = normalize_tick(json.loads(line), "replay")
+            except ValueError:
+                continue
+            if tick:
+                ticks.append(tick)
+    return ticks
+
+
+def save_ticks(path: str, ticks: List[PriceTick]):
+    """Записать тики в NDJSON (для последующего воспроизведения)"""
+    with open(path, "w", encoding="utf-8") as f:
+        for tick in ticks:
+            f.write(json.dumps(tick_to_dict(tick)) + "\n")
+
+
+class ReplayFeed(PriceFeed):
+    """Источник цен из записи с сохранением интервалов между тиками
+
+    speed - ускорение воспроизведения (0 - без пауз, максимально быстро);
+    loop - воспроизводить запись по кругу; retime - проставлять тикам текущее
+    время, чтобы воспроизведенные цены считались свежими.
+    """
+
+    name = "replay"
+
+    def __init__(self, path: Optional[str] = None, ticks: Optional[List[PriceTick]] = None,
+                 speed: float = 1.0, loop: bool = False, retime: bool = True):
+        if ticks is None:
+            if not path:
+                raise ValueError("Для воспроизведения нужен путь к записи или список тиков")
+            ticks = load_ticks(path)
+        self.recorded = sorted(ticks, key=lambda tick: tick.ts)
+        self.speed = speed
+        self.loop = loop
+        self.retime = retime
+        self.replayed = 0
+
+    async def ticks(self) -> AsyncIterator[PriceTick]:
+        if not self.recorded:
+            return
+        while True:
+            previous_ts = None
+            for tick in self.recorded:
+                if self.speed > 0 and previous_ts is not None and tick.ts > previous_ts:
+                    await asyncio.sleep((tick.ts - previous_ts) / self.speed)
+                previous_ts = tick.ts
+                self.replayed += 1
+                if self.retime:
+                    tick = PriceTick(tick.symbol, tick.price, time.time(), tick.source)
+                yield tick
+                if self.speed <= 0 and self.replayed % 1000 == 0:
+                    # Отдаем управление циклу событий при воспроизведении без пауз
+                    await asyncio.sleep(0)
+            if not self.loop:
+                return
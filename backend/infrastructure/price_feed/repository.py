@@ -0,0 +1,44 @@
+"""
+Репозиторий цен с наложением живых цен из потока
+"""
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from domain.entities.user import CoinPrice
+from domain.repositories.user_repository import PriceRepository
+from shared.config import settings
+from .price_table import LivePriceTable, live_prices
+
+
+class LivePriceRepository(PriceRepository):
+    """Цены из таблицы live_prices, недостающие и устаревшие - из основного репозитория"""
+
+    def __init__(self, repository: PriceRepository, table: LivePriceTable = live_prices,
+                 max_age_seconds: Optional[float] = None):
+        self.repository = repository
+        self.table = table
+        self.max_age_seconds = max_age_seconds
+
+    async def get_prices(self, symbols: List[str]) -> Dict[str, CoinPrice]:
+        live = self.table.get_many(symbols, self.max_age_seconds)
+        missing = [symbol for symbol in symbols if symbol.lower() not in live]
+        prices = await self.repository.get_prices(missing) if missing else {}
+        for symbol, tick in live.items():
+            prices[symbol] = CoinPrice(
+                symbol=symbol,
+                price=Decimal(str(tick.price)),
+                source=tick.source,
+                last_updated=datetime.utcfromtimestamp(tick.ts),
+            )
+        return prices
+
+    async def upsert_prices(self, prices: Dict[str, float], source: str) -> int:
+        return await self.repository.upsert_prices(prices, source)
+
+
+def with_live_prices(repository: PriceRepository) -> PriceRepository:
+    """Обернуть репозиторий цен, если включен поток цен (PRICE_FEED_SOURCE)"""
+    if not settings.PRICE_FEED_SOURCE:
+        return repository
+    return LivePriceRepository(repository, max_age_seconds=settings.PRICE_FEED_MAX_AGE_SECONDS)
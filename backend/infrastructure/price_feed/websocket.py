@@ -0,0 +1,73 @@
+"""
+Источник цен из WebSocket-потока биржи/агрегатора
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Callable, List, Optional
+
+import aiohttp
+
+from infrastructure.external_apis.json_codec import loads
+from .base import PriceFeed, PriceTick, normalize_tick
+
+
+class WebSocketFeed(PriceFeed):
+    """Подписка на WebSocket с переподключением и экспоненциальной паузой
+
+    parse - функция сообщение -> список PriceTick (по умолчанию normalize_tick,
+    сообщение может быть объектом или массивом объектов).
+    """
+
+    name = "websocket"
+
+    def __init__(self, url: str, subscribe_message: Optional[Any] = None,
+                 parse: Optional[Callable[[Any], List[PriceTick]]] = None,
+                 reconnect_delay: float = 1.0, max_reconnect_delay: float = 60.0,
+                 heartbeat: float = 30.0):
+        self.url = url
+        self.subscribe_message = subscribe_message
+        self.parse = parse or self._default_parse
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.heartbeat = heartbeat
+        self.reconnects = 0
+
+    def _default_parse(self, message: Any) -> List[PriceTick]:
+        items = message if isinstance(message, list) else [message]
+        ticks = []
+        for item in items:
+            if isinstance(item, dict) and isinstance(item.get("data"), (dict, list)):
+                ticks.extend(self._default_parse(item["data"]))
+                continue
+            tick = normalize_tick(item, self.name)
+            if tick:
+                ticks.append(tick)
+        return ticks
+
+    async def ticks(self) -> AsyncIterator[PriceTick]:
+        delay = self.reconnect_delay
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    async with session.ws_connect(self.url, heartbeat=self.heartbeat) as ws:
+                        print(f"✅ Поток цен подключен: {self.url}")
+                        if self.subscribe_message is not None:
+                            await ws.send_str(json.dumps(self.subscribe_message))
+                        delay = self.reconnect_delay
+                        async for msg in ws:
+                            if msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                                try:
+                                    message = loads(msg.data)
+                                except ValueError:
+                                    continue
+                                for tick in self.parse(message):
+                                    yield tick
+                            elif msg.type == aiohttp.WSMsgType.ERROR:
+                                break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    print(f"⚠️ Поток цен недоступен: {e}")
+
+                self.reconnects += 1
+                print(f"🔄 Переподключение к потоку цен через {delay:.0f}с")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
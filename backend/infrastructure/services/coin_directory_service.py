@@ -0,0 +1,91 @@
+"""
+Загрузка и периодическое обновление справочника монет (таблица coin_directory)
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from infrastructure.database.connection import AsyncSessionLocal
+from infrastructure.database.repositories import SQLAlchemyCoinDirectoryRepository
+from infrastructure.external_apis.coin_directory import coin_index
+from infrastructure.external_apis.coin_gecko_api import CoinGeckoAPI
+from infrastructure.external_apis.coinmarketcap_api import CoinMarketCapAPI
+from shared.config import settings
+
+
+async def load_coin_index() -> int:
+    """Загрузить справочник из БД в память"""
+    async with AsyncSessionLocal() as session:
+        entries = await SQLAlchemyCoinDirectoryRepository(session).get_all()
+    coin_index.load(entries)
+    print(f"✅ Справочник монет загружен в память: {len(coin_index)} монет")
+    return len(coin_index)
+
+
+def merge_directory(coingecko_coins: List[dict], ranks: Dict[str, int], cmc_coins: List[dict]) -> List[dict]:
+    """Объединить списки провайдеров в записи справочника"""
+    cmc_by_slug = {coin['slug']: coin for coin in cmc_coins if coin.get('slug')}
+    cmc_by_key: Dict[Tuple[str, str], dict] = {
+        (coin['symbol'].lower(), coin['name'].lower()): coin for coin in cmc_coins
+    }
+
+    entries = []
+    for coin in coingecko_coins:
+        cmc = (
+            cmc_by_slug.get(coin['coingecko_id'])
+            or cmc_by_key.get((coin['symbol'].lower(), coin['name'].lower()))
+        )
+        entries.append({
+            'symbol': coin['symbol'],
+            'name': coin['name'],
+            'coingecko_id': coin['coingecko_id'],
+            'cmc_id': cmc['cmc_id'] if cmc else None,
+            'rank': ranks.get(coin['coingecko_id']) or (cmc.get('rank') if cmc else None)
+        })
+    return entries
+
+
+async def refresh_coin_directory() -> int:
+    """Загрузить справочник из list-эндпоинтов провайдеров и сохранить в БД"""
+    api = CoinGeckoAPI()
+    coingecko_coins = await api.get_coins_list()
+    if not coingecko_coins:
+        print("⚠️ Список монет CoinGecko пуст, справочник не обновлен")
+        return 0
+
+    ranks = await api.get_market_ranks(settings.COIN_DIRECTORY_RANKED_PAGES)
+
+    cmc_coins = []
+    if settings.COINMARKETCAP_API_KEY:
+        cmc_coins = await CoinMarketCapAPI(settings.COINMARKETCAP_API_KEY).get_coin_map()
+
+    entries = merge_directory(coingecko_coins, ranks, cmc_coins)
+
+    async with AsyncSessionLocal() as session:
+        count = await SQLAlchemyCoinDirectoryRepository(session).replace_all(entries)
+
+    coin_index.load(entries)
+    print(f"✅ Справочник монет обновлен: {count} монет, с рейтингом: {len(ranks)}")
+    return count
+
+
+async def run_coin_directory_refresher():
+    """Фоновая задача: обновлять справочник раз в COIN_DIRECTORY_REFRESH_HOURS"""
+    interval = timedelta(hours=settings.COIN_DIRECTORY_REFRESH_HOURS)
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                last_updated = await SQLAlchemyCoinDirectoryRepository(session).get_last_updated()
+
+            if last_updated is None or datetime.utcnow() - last_updated >= interval:
+                await refresh_coin_directory()
+                wait = interval
+            else:
+                wait = interval - (datetime.utcnow() - last_updated)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Ошибка при обновлении справочника монет: {e}")
+            wait = timedelta(minutes=10)
+
+        await asyncio.sleep(wait.total_seconds())
@@ -0,0 +1,33 @@
+"""
+Фоновое обновление курсов валют котировки
+"""
+import asyncio
+
+from infrastructure.external_apis.coin_gecko_api import CoinGeckoAPI
+from infrastructure.external_apis.fx_rates import fx_rates
+from shared.config import settings
+
+
+async def refresh_fx_rates() -> int:
+    """Один запрос /exchange_rates -> матрица курсов в памяти"""
+    btc_rates = await CoinGeckoAPI().get_exchange_rates()
+    updated = fx_rates.set_btc_rates(btc_rates)
+    if updated:
+        print(f"✅ Курсы валют обновлены: {updated}/{len(fx_rates.currencies)}")
+    else:
+        print("⚠️ Курсы валют не обновлены, используются прежние")
+    return updated
+
+
+async def run_fx_refresher():
+    """Фоновая задача: обновлять курсы раз в FX_REFRESH_INTERVAL_SECONDS"""
+    while True:
+        try:
+            updated = await refresh_fx_rates()
+            wait = settings.FX_REFRESH_INTERVAL_SECONDS if updated else 60
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Ошибка при обновлении курсов валют: {e}")
+            wait = 60
+        await asyncio.sleep(wait)
@@ -0,0 +1,90 @@
+"""
+Дневные снимки стоимости портфелей (таблица portfolio_snapshots)
+
+Раз в PORTFOLIO_SNAPSHOT_INTERVAL_SECONDS оценивает портфели всех
+пользователей по одному набору цен из coin_prices (с живыми ценами потока,
+если он включен) и сохраняет снимок за текущую дату UTC. Повторный проход
+в тот же день перезаписывает снимок, поэтому в истории остается последняя
+оценка дня. Пользователь, продавший все, получает один нулевой снимок
+(если накануне у него были позиции): ряд заканчивается нулем, а не
+последней ненулевой оценкой, и дальше нулевые строки не копятся. Эндпоинт истории читает готовые строки
+и ничего не пересчитывает.
+"""
+import asyncio
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+from domain.use_cases.portfolio_use_cases import TakePortfolioSnapshotsUseCase
+from infrastructure.database.connection import AsyncSessionLocal
+from infrastructure.database.repositories import (
+    SQLAlchemyPortfolioRepository, SQLAlchemyPortfolioSnapshotRepository, SQLAlchemyPriceRepository,
+)
+from infrastructure.price_feed.repository import with_live_prices
+from shared.config import settings
+
+
+class PortfolioSnapshotter:
+    """Периодически сохраняет снимки стоимости всех портфелей"""
+
+    def __init__(self, interval_seconds: float = 3600, batch_size: int = 500):
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self._lock = asyncio.Lock()
+        self.last_run: Optional[datetime] = None
+        self.last_snapshot_date: Optional[date] = None
+        self.last_saved = 0
+        self.last_duration_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    async def run(self):
+        """Основной цикл (запускается из lifespan)"""
+        while True:
+            try:
+                await self.take_snapshots()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ Ошибка при сохранении снимков портфелей: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def take_snapshots(self, snapshot_date: Optional[date] = None) -> int:
+        """Один проход: позиции всех пользователей -> оценка -> portfolio_snapshots"""
+        snapshot_date = snapshot_date or datetime.utcnow().date()
+        # Ручной запуск из админки не выполняется параллельно с фоновым
+        async with self._lock:
+            started = datetime.utcnow()
+            # Чтение позиций идет курсором в своей сессии, запись - пакетами в другой
+            async with AsyncSessionLocal() as read_session, AsyncSessionLocal() as write_session:
+                use_case = TakePortfolioSnapshotsUseCase(
+                    SQLAlchemyPortfolioRepository(read_session),
+                    with_live_prices(SQLAlchemyPriceRepository(read_session)),
+                    SQLAlchemyPortfolioSnapshotRepository(write_session),
+                    batch_size=self.batch_size,
+                )
+                saved = await use_case.execute(snapshot_date)
+
+            self.last_run = started
+            self.last_snapshot_date = snapshot_date
+            self.last_saved = saved
+            self.last_duration_seconds = (datetime.utcnow() - started).total_seconds()
+        print(f"✅ Снимки портфелей за {snapshot_date}: {saved} за {self.last_duration_seconds:.1f}с")
+        return saved
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval_seconds,
+            "batch_size": self.batch_size,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_snapshot_date": self.last_snapshot_date.isoformat() if self.last_snapshot_date else None,
+            "last_saved": self.last_saved,
+            "last_duration_seconds": self.last_duration_seconds,
+            "last_error": self.last_error,
+        }
+
+
+portfolio_snapshotter = PortfolioSnapshotter(
+    interval_seconds=settings.PORTFOLIO_SNAPSHOT_INTERVAL_SECONDS,
+    batch_size=settings.PORTFOLIO_SNAPSHOT_BATCH_SIZE,
+)
@@ -0,0 +1,111 @@
+"""
+Фоновое обновление цен монет
+
+Единственный источник запросов цен к провайдерам для портфелей: раз в
+PRICE_REFRESH_INTERVAL_SECONDS собирает различные символы из user_portfolio,
+запрашивает их пачками и пишет в общую таблицу coin_prices. Обработчики
+запросов читают цены только из БД, поэтому число запросов к API не зависит
+от числа пользователей.
+"""
+import asyncio
+from typing import Dict, Iterable, List, Set
+
+from infrastructure.database.connection import AsyncSessionLocal
+from infrastructure.database.repositories import SQLAlchemyPortfolioRepository, SQLAlchemyPriceRepository
+from infrastructure.external_apis.coin_gecko_api import CoinGeckoAPI
+from infrastructure.external_apis.coinmarketcap_api import CoinMarketCapAPI
+from shared.config import settings
+
+
+class PriceRefresher:
+    """Периодически обновляет таблицу coin_prices для всех символов из портфелей"""
+
+    def __init__(self, interval_seconds: float = 60, chunk_size: int = 100):
+        self.interval_seconds = interval_seconds
+        self.chunk_size = chunk_size
+        self._requested: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self.last_refreshed = 0
+        self.last_error = None
+
+    def request(self, symbols: Iterable[str]):
+        """Попросить обновить символы вне очереди (например, только что добавленная монета)"""
+        new_symbols = {symbol.lower() for symbol in symbols} - self._requested
+        if new_symbols:
+            self._requested.update(new_symbols)
+            self._wakeup.set()
+
+    async def run(self):
+        """Основной цикл (запускается из lifespan)"""
+        while True:
+            try:
+                await self.refresh_once()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ Ошибка фонового обновления цен: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def refresh_once(self) -> int:
+        """Один проход: символы из портфелей -> цены у провайдеров -> coin_prices"""
+        async with AsyncSessionLocal() as session:
+            symbols = set(await SQLAlchemyPortfolioRepository(session).get_held_symbols())
+        symbols |= self._requested
+        self._requested = set()
+
+        if not symbols:
+            return 0
+
+        prices = await self.fetch_prices(sorted(symbols))
+        if not prices:
+            print(f"⚠️ Не удалось получить цены для {len(symbols)} символов")
+            return 0
+
+        saved = 0
+        async with AsyncSessionLocal() as session:
+            price_repo = SQLAlchemyPriceRepository(session)
+            for source, source_prices in prices.items():
+                saved += await price_repo.upsert_prices(source_prices, source)
+
+        self.last_refreshed = saved
+        print(f"✅ Фоновое обновление цен: {saved}/{len(symbols)} символов")
+        return saved
+
+    async def fetch_prices(self, symbols: List[str]) -> Dict[str, Dict[str, float]]:
+        """Запросить цены пачками: CoinGecko, недостающие - CoinMarketCap"""
+        result: Dict[str, Dict[str, float]] = {}
+
+        coingecko_prices: Dict[str, float] = {}
+        api = CoinGeckoAPI()
+        for chunk in self._chunks(symbols):
+            coingecko_prices.update(await api.get_current_prices(chunk, use_cache=False))
+        if coingecko_prices:
+            result['coingecko'] = coingecko_prices
+
+        missing = [symbol for symbol in symbols if symbol not in coingecko_prices]
+        if missing and settings.COINMARKETCAP_API_KEY:
+            cmc_api = CoinMarketCapAPI(settings.COINMARKETCAP_API_KEY)
+            cmc_prices: Dict[str, float] = {}
+            for chunk in self._chunks(missing):
+                cmc_prices.update(await cmc_api.get_current_prices(chunk, use_cache=False))
+            if cmc_prices:
+                result['coinmarketcap'] = cmc_prices
+
+        return result
+
+    def _chunks(self, symbols: List[str]) -> Iterable[List[str]]:
+        for start in range(0, len(symbols), self.chunk_size):
+            yield symbols[start:start + self.chunk_size]
+
+
+price_refresher = PriceRefresher(
+    interval_seconds=settings.PRICE_REFRESH_INTERVAL_SECONDS,
+    chunk_size=settings.PRICE_REFRESH_CHUNK_SIZE,
+)
@@ -5,7 +5,8 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 
-from infrastructure.database.connection import init_db
+from infrastructure.database.migrations.runner import run_migrations
+from infrastructure.external_apis.http_client import http_clients
 from presentation.web_api.app import app as fastapi_app
 from presentation.telegram_handlers.router import router as telegram_router
 from shared.config import settings
@@ -14,13 +15,17 @@ from shared.config import settings
 bot = None
 dp = None
 
+# Фоновые задачи, которые нужно остановить при завершении
+background_tasks = []
+
 async def initialize_coin_cache():
     """Инициализация кэша монет при запуске"""
     try:
         from infrastructure.database.connection import AsyncSessionLocal
         from infrastructure.database.repositories import SQLAlchemyCoinCacheRepository
-        from infrastructure.external_apis.coinmarketcap_api import CoinMarketCapAPI
-        from infrastructure.external_apis.coin_gecko_api import CoinGeckoAPI
+        from infrastructure.external_apis.provider_router import get_market_router
+        
+        router = get_market_router()
         
         async with AsyncSessionLocal() as session:
             cache_repo = SQLAlchemyCoinCacheRepository(session)
@@ -31,68 +36,22 @@ async def initialize_coin_cache():
             if not is_fresh:
                 print("🔄 Инициализация кэша топ монет...")
                 
-                # Выбираем API: CoinMarketCap (приоритет) или CoinGecko (fallback)
-                use_coinmarketcap = bool(settings.COINMARKETCAP_API_KEY)
-                
-                if use_coinmarketcap:
-                    print("💎 Используем CoinMarketCap API")
-                    try:
-                        async with CoinMarketCapAPI(settings.COINMARKETCAP_API_KEY) as api:
-                            coins = await asyncio.wait_for(api.get_top_coins(100), timeout=30.0)
-                            if coins:
-                                await cache_repo.update_cache(coins, 'top_coins')
-                                print(f"✅ Кэш топ монет инициализирован ({len(coins)} монет)")
-                            else:
-                                print("⚠️ Пустой ответ от CoinMarketCap API")
-                                use_coinmarketcap = False  # Fallback на CoinGecko
-                    except Exception as e:
-                        print(f"❌ Ошибка CoinMarketCap API: {e}")
-                        use_coinmarketcap = False  # Fallback на CoinGecko
-                
-                # Fallback на CoinGecko если CoinMarketCap не сработал
-                if not use_coinmarketcap:
-                    print("🔄 Fallback на CoinGecko API")
-                    for attempt in range(3):
-                        try:
-                            if attempt > 0:
-                                delay = 10 * (attempt + 1)
-                                print(f"⏳ Ожидание {delay} секунд...")
-                                await asyncio.sleep(delay)
-                            
-                            async with CoinGeckoAPI() as api:
-                                coins = await asyncio.wait_for(api.get_top_coins(100), timeout=30.0)
-                                if coins:
-                                    await cache_repo.update_cache(coins, 'top_coins')
-                                    print(f"✅ Кэш топ монет инициализирован ({len(coins)} монет)")
-                                    break
-                        except Exception as e:
-                            print(f"❌ Попытка {attempt + 1}/3: {e}")
-                            if "429" in str(e):
-                                break
+                # Провайдеры опрашиваются роутером: CoinMarketCap (если есть ключ), при задержке - CoinGecko
+                coins, source = await router.call('get_top_coins', 100)
+                if coins:
+                    await cache_repo.update_cache(coins, 'top_coins', source)
+                    print(f"✅ Кэш топ монет инициализирован ({len(coins)} монет)")
+                else:
+                    print("⚠️ Не удалось получить топ монет ни от одного провайдера")
                 
                 # Инициализация лидеров роста
-                await asyncio.sleep(3)  # Небольшая задержка
                 print("🔄 Инициализация кэша лидеров роста...")
-                
-                if settings.COINMARKETCAP_API_KEY:
-                    try:
-                        async with CoinMarketCapAPI(settings.COINMARKETCAP_API_KEY) as api:
-                            coins = await asyncio.wait_for(api.get_growth_leaders(20), timeout=30.0)
-                            if coins:
-                                await cache_repo.update_cache(coins, 'growth_leaders')
-                                print(f"✅ Кэш лидеров роста инициализирован ({len(coins)} монет)")
-                    except Exception as e:
-                        print(f"❌ Ошибка при инициализации лидеров роста: {e}")
+                coins, source = await router.call('get_growth_leaders', 20)
+                if coins:
+                    await cache_repo.update_cache(coins, 'growth_leaders', source)
+                    print(f"✅ Кэш лидеров роста инициализирован ({len(coins)} монет)")
                 else:
-                    # Fallback на CoinGecko
-                    try:
-                        async with CoinGeckoAPI() as api:
-                            coins = await asyncio.wait_for(api.get_growth_leaders(20), timeout=30.0)
-                            if coins:
-                                await cache_repo.update_cache(coins, 'growth_leaders')
-                                print(f"✅ Кэш лидеров роста инициализирован ({len(coins)} монет)")
-                    except Exception as e:
-                        print(f"❌ Ошибка: {e}")
+                    print("⚠️ Не удалось получить лидеров роста ни от одного провайдера")
             else:
                 print("✅ Кэш монет уже актуален")
                 
@@ -105,9 +64,46 @@ async def initialize_coin_cache():
 async def lifespan(app: FastAPI):
     global bot, dp
     
-    # Инициализация базы данных
-    init_db()
-    print("✅ База данных инициализирована")
+    # Схема базы данных: неприменные версионные миграции
+    if settings.DB_MIGRATE_ON_STARTUP:
+        applied = await run_migrations()
+        print(f"✅ Схема базы данных актуальна (применено миграций: {len(applied)})")
+    
+    # Общие HTTP клиенты для CoinGecko/CoinMarketCap (пул keep-alive соединений)
+    await http_clients.start()
+    
+    # Справочник монет: загрузка в память и периодическое обновление из API
+    try:
+        from infrastructure.services.coin_directory_service import load_coin_index, run_coin_directory_refresher
+        await load_coin_index()
+        background_tasks.append(asyncio.create_task(run_coin_directory_refresher()))
+    except Exception as e:
+        print(f"⚠️ Справочник монет не загружен: {e}")
+    
+    # Фоновое обновление цен: единственный источник запросов цен для портфелей
+    from infrastructure.services.price_refresher import price_refresher
+    background_tasks.append(asyncio.create_task(price_refresher.run()))
+    print("✅ Фоновое обновление цен запущено")
+    
+    # Курсы валют котировки (EUR, RUB, BTC, ...) - один запрос на обновление
+    from infrastructure.services.fx_refresher import run_fx_refresher
+    background_tasks.append(asyncio.create_task(run_fx_refresher()))
+    
+    # Дневные снимки стоимости портфелей для истории
+    if settings.PORTFOLIO_SNAPSHOTS_ENABLED:
+        from infrastructure.services.portfolio_snapshots import portfolio_snapshotter
+        background_tasks.append(asyncio.create_task(portfolio_snapshotter.run()))
+    
+    # Поток живых цен (WebSocket или воспроизведение записи) в общую таблицу live_prices
+    if settings.PRICE_FEED_SOURCE:
+        try:
+            from infrastructure.price_feed.ingest import PriceFeedIngestor, create_feed_from_settings
+            feed = create_feed_from_settings()
+            if feed:
+                background_tasks.append(asyncio.create_task(PriceFeedIngestor(feed).run()))
+                print(f"✅ Поток цен запущен: {feed.name}")
+        except Exception as e:
+            print(f"⚠️ Поток цен не запущен: {e}")
     
     # Инициализация кэша монет - временно отключено для экономии API запросов
     # await initialize_coin_cache()
@@ -132,8 +128,13 @@ async def lifespan(app: FastAPI):
     yield
     
     # Очистка при остановке
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
     if bot:
         await bot.session.close()
+    await http_clients.close()
     print("✅ Приложение остановлено")
 
 app = FastAPI(
@@ -168,6 +169,7 @@ app.add_middleware(
         "Keep-Alive",
         "If-Modified-Since",
     ],
+    expose_headers=["X-Next-Cursor"],  # курсор следующей страницы транзакций
 )
 
 # Подключаем роутер напрямую
@@ -1,6 +1,7 @@
+from decimal import Decimal
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, WebAppInfo
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import ReplyKeyboardMarkup, KeyboardButton
@@ -9,9 +10,17 @@ from domain.use_cases.portfolio_use_cases import GetUserPortfolioUseCase, AddCoi
 from infrastructure.database.repositories import (
     SQLAlchemyUserRepository,
     SQLAlchemyPortfolioRepository,
-    SQLAlchemyTransactionRepository
+    SQLAlchemyTransactionRepository,
+    SQLAlchemyPriceRepository
 )
 from infrastructure.external_apis.coin_gecko_api import CoinGeckoAPI
+from infrastructure.services.price_refresher import price_refresher
+from infrastructure.price_feed.repository import with_live_prices
+from infrastructure.database.unit_of_work import SQLAlchemyUnitOfWork
+from infrastructure.database.read_replica import read_replica
+from infrastructure.external_apis.fx_rates import (
+    fx_rates, parse_currencies, UnsupportedCurrencyError, FXRatesUnavailableError
+)
 from shared.config import settings
 
 router = Router()
@@ -116,6 +125,33 @@ async def show_webapp_info(message: Message):
 @router.message(F.text == "📊 Портфель")
 async def show_portfolio(message: Message):
     """Показать портфель пользователя"""
+    await send_portfolio(message)
+
+@router.message(Command("portfolio"))
+async def cmd_portfolio(message: Message, command: CommandObject):
+    """Портфель в выбранной валюте: /portfolio eur"""
+    try:
+        currency = fx_rates.normalize(command.args.strip() if command.args else "usd")
+        fx_rates.rate(currency)
+    except (UnsupportedCurrencyError, FXRatesUnavailableError) as e:
+        await message.answer(f"❌ {e}")
+        return
+    await send_portfolio(message, currency)
+
+def format_extra_currencies(amount_usd, currency: str) -> str:
+    """Сумма в дополнительных валютах из BOT_EXTRA_CURRENCIES ('≈ €10.00 · ₽880.00')"""
+    parts = []
+    for extra in parse_currencies(settings.BOT_EXTRA_CURRENCIES):
+        if extra == currency:
+            continue
+        try:
+            parts.append(fx_rates.format(amount_usd, extra))
+        except (UnsupportedCurrencyError, FXRatesUnavailableError):
+            continue
+    return f"≈ {' · '.join(parts)}" if parts else ""
+
+async def send_portfolio(message: Message, currency: str = "usd"):
+    """Отправить портфель пользователя; суммы пересчитываются по курсам в памяти"""
     try:
         # Создаем репозитории и use case
         from infrastructure.database.connection import get_async_session
@@ -123,8 +159,9 @@ async def show_portfolio(message: Message):
         async for session in get_async_session():
             user_repo = SQLAlchemyUserRepository(session)
             portfolio_repo = SQLAlchemyPortfolioRepository(session)
+            price_repo = with_live_prices(SQLAlchemyPriceRepository(session))
             
-            use_case = GetUserPortfolioUseCase(user_repo, portfolio_repo)
+            use_case = GetUserPortfolioUseCase(user_repo, portfolio_repo, price_repo, price_refresher.request)
             portfolio = await use_case.execute(message.from_user.id)
             
             if not portfolio:
@@ -138,11 +175,14 @@ async def show_portfolio(message: Message):
             for item in portfolio:
                 portfolio_text += f"🪙 {item.name} ({item.symbol})\n"
                 portfolio_text += f"   Количество: {item.total_quantity}\n"
-                portfolio_text += f"   Средняя цена: ${item.avg_price:.4f}\n"
-                portfolio_text += f"   Общая стоимость: ${item.total_spent:.2f}\n\n"
+                portfolio_text += f"   Средняя цена: {fx_rates.format(item.avg_price, currency, 4)}\n"
+                portfolio_text += f"   Общая стоимость: {fx_rates.format(item.total_spent, currency)}\n\n"
                 total_value += item.total_spent
             
-            portfolio_text += f"💰 Общая стоимость портфеля: ${total_value:.2f}"
+            portfolio_text += f"💰 Общая стоимость портфеля: {fx_rates.format(total_value, currency)}"
+            extra = format_extra_currencies(total_value, currency)
+            if extra:
+                portfolio_text += f"\n   {extra}"
             
             await message.answer(portfolio_text)
             break
@@ -199,37 +239,32 @@ async def process_price(message: Message, state: FSMContext):
         price = float(message.text)
         data = await state.get_data()
         
-        # Создаем транзакцию
-        from infrastructure.database.connection import get_async_session
+        # Сделка и позиция сохраняются одной транзакцией БД
+        use_case = AddCoinToPortfolioUseCase(SQLAlchemyUnitOfWork())
         
-        async for session in get_async_session():
-            user_repo = SQLAlchemyUserRepository(session)
-            portfolio_repo = SQLAlchemyPortfolioRepository(session)
-            transaction_repo = SQLAlchemyTransactionRepository(session)
-            
-            use_case = AddCoinToPortfolioUseCase(user_repo, portfolio_repo, transaction_repo)
-            
-            success = await use_case.execute(
-                telegram_id=message.from_user.id,
-                symbol=data['symbol'],
-                name=data['name'],
-                quantity=data['quantity'],
-                price=price
+        success = await use_case.execute(
+            telegram_id=message.from_user.id,
+            symbol=data['symbol'],
+            name=data['name'],
+            quantity=Decimal(str(data['quantity'])),
+            price=Decimal(str(price))
+        )
+        
+        if success:
+            price_refresher.request([data['symbol']])
+            # Веб-приложение сразу покажет покупку, даже если реплика отстает
+            read_replica.mark_written(message.from_user.id)
+            await message.answer(
+                f"✅ Монета {data['symbol']} успешно добавлена в портфель!",
+                reply_markup=get_main_keyboard()
             )
-            
-            if success:
-                await message.answer(
-                    f"✅ Монета {data['symbol']} успешно добавлена в портфель!",
-                    reply_markup=get_main_keyboard()
-                )
-            else:
-                await message.answer(
-                    "❌ Ошибка при добавлении монеты",
-                    reply_markup=get_main_keyboard()
-                )
-            
-            await state.clear()
-            break
+        else:
+            await message.answer(
+                "❌ Ошибка при добавлении монеты",
+                reply_markup=get_main_keyboard()
+            )
+        
+        await state.clear()
         
     except ValueError:
         await message.answer("❌ Введите корректную цену")
@@ -252,7 +287,7 @@ async def show_transactions(message: Message):
                 await message.answer("❌ Пользователь не найден")
                 return
             
-            transactions = await transaction_repo.get_user_transactions(user.id)
+            transactions = await transaction_repo.get_user_transactions(user.id, limit=10)
             
             if not transactions:
                 await message.answer("📭 У вас пока нет транзакций")
@@ -260,7 +295,7 @@ async def show_transactions(message: Message):
             
             transactions_text = "📋 Ваши транзакции:\n\n"
             
-            for tx in transactions[:10]:  # Показываем последние 10
+            for tx in transactions:  # Последние 10
                 transactions_text += f"🪙 {tx.symbol} ({tx.name})\n"
                 transactions_text += f"   Количество: {tx.quantity}\n"
                 transactions_text += f"   Цена: ${tx.price:.4f}\n"
@@ -1,22 +1,42 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, APIRouter, Response
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Depends, HTTPException, Request, APIRouter, Response, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 from decimal import Decimal
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
 
-from infrastructure.database.connection import get_async_session
+from infrastructure.database.connection import get_async_session, async_engine, read_engine
+from infrastructure.database.pool import pool_stats
+from infrastructure.database.cache_generations import CacheGeneration, cache_generations
+from infrastructure.database.migrations.runner import migration_status
+from infrastructure.database.unit_of_work import SQLAlchemyUnitOfWork
+from infrastructure.database.read_replica import get_read_session, read_replica
+from infrastructure.database.pool import replica_pool_monitor
 from infrastructure.database.repositories import (
     SQLAlchemyUserRepository,
     SQLAlchemyPortfolioRepository,
     SQLAlchemyTransactionRepository,
-    SQLAlchemyCoinCacheRepository
+    SQLAlchemyCoinCacheRepository,
+    SQLAlchemyPriceRepository,
+    SQLAlchemyPortfolioSnapshotRepository
 )
 from domain.use_cases.portfolio_use_cases import GetUserPortfolioUseCase, AddCoinToPortfolioUseCase, SellCoinFromPortfolioUseCase
-from domain.entities.user import UserPortfolio, CoinTransaction, TransactionType
+from domain.entities.user import UserPortfolio, CoinTransaction, TransactionType, TransactionCursor
+from domain.repositories.user_repository import PriceRepository
 from infrastructure.external_apis.coin_gecko_api import CoinGeckoAPI
-from infrastructure.external_apis.coinmarketcap_api import CoinMarketCapAPI
+from infrastructure.external_apis.provider_router import get_market_router
+from infrastructure.external_apis.http_client import http_clients
+from infrastructure.external_apis.price_cache import price_cache
+from infrastructure.external_apis.rate_limiter import rate_limiters
+from infrastructure.external_apis.circuit_breaker import circuit_breakers
+from infrastructure.external_apis.http_cache import http_response_cache
+from infrastructure.external_apis.fx_rates import fx_rates, UnsupportedCurrencyError, FXRatesUnavailableError
+from infrastructure.services.price_refresher import price_refresher
+from infrastructure.services.portfolio_snapshots import portfolio_snapshotter
+from infrastructure.price_feed.price_table import live_prices
+from infrastructure.price_feed.repository import with_live_prices
 from shared.config import settings
+from presentation.web_api.transaction_export import EXPORT_FORMATS, encode_transactions, gzip_chunks
 from shared.types.api_schemas import (
     PortfolioResponse,
     PortfolioItemResponse,
@@ -54,246 +74,6 @@ async def test_endpoint():
     """Тестовый эндпоинт"""
     return {"message": "API router работает!"}
 
-@api_router.post("/admin/migrate-transaction-type")
-async def migrate_transaction_type():
-    """Миграция для добавления поля transaction_type"""
-    try:
-        import asyncpg
-        from shared.config import settings
-        
-        # Получаем URL базы данных
-        if settings.DATABASE_URL:
-            db_url = settings.DATABASE_URL
-        else:
-            db_url = f"postgresql://{settings.DB_USER}:{settings.DB_PASS}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
-        
-        print("Начинаем миграцию базы данных...")
-        
-        # Подключаемся к базе данных
-        conn = await asyncpg.connect(db_url)
-        
-        # Проверяем, существует ли уже колонка
-        check_column_query = """
-        SELECT column_name 
-        FROM information_schema.columns 
-        WHERE table_name = 'coin_transactions' 
-        AND column_name = 'transaction_type';
-        """
-        
-        existing_column = await conn.fetchval(check_column_query)
-        
-        if existing_column:
-            await conn.close()
-            return {"status": "success", "message": "Колонка transaction_type уже существует"}
-        
-        print("Добавляем колонку transaction_type...")
-        
-        # Сначала добавляем колонку как TEXT
-        try:
-            add_column_query = """
-            ALTER TABLE coin_transactions 
-            ADD COLUMN transaction_type TEXT DEFAULT 'buy';
-            """
-            await conn.execute(add_column_query)
-            print("✅ Колонка transaction_type добавлена как TEXT")
-        except Exception as e:
-            if "already exists" in str(e):
-                print("✅ Колонка уже существует как TEXT")
-            else:
-                raise
-        
-        # Обновляем все существующие записи на uppercase
-        update_existing_query = """
-        UPDATE coin_transactions 
-        SET transaction_type = 'BUY' 
-        WHERE transaction_type IS NULL OR transaction_type = '' OR transaction_type = 'buy';
-        """
-        result = await conn.execute(update_existing_query)
-        print(f"✅ Обновлено существующих записей: {result}")
-        
-        # Теперь создаем ENUM тип с правильными значениями
-        create_enum_query = """
-        DO $$ BEGIN
-            CREATE TYPE transactiontype AS ENUM ('BUY', 'SELL');
-        EXCEPTION
-            WHEN duplicate_object THEN 
-                -- Если тип уже существует, пересоздаем его
-                DROP TYPE IF EXISTS transactiontype CASCADE;
-                CREATE TYPE transactiontype AS ENUM ('BUY', 'SELL');
-        END $$;
-        """
-        await conn.execute(create_enum_query)
-        print("✅ ENUM тип создан с правильными значениями")
-        
-        # Убираем DEFAULT перед изменением типа
-        remove_default_query = """
-        ALTER TABLE coin_transactions 
-        ALTER COLUMN transaction_type DROP DEFAULT;
-        """
-        await conn.execute(remove_default_query)
-        print("✅ DEFAULT убран")
-        
-        # Изменяем тип колонки на ENUM
-        alter_column_query = """
-        ALTER TABLE coin_transactions 
-        ALTER COLUMN transaction_type TYPE transactiontype 
-        USING transaction_type::transactiontype;
-        """
-        await conn.execute(alter_column_query)
-        print("✅ Колонка преобразована в ENUM тип")
-        
-        # Устанавливаем новый DEFAULT для ENUM
-        set_default_query = """
-        ALTER TABLE coin_transactions 
-        ALTER COLUMN transaction_type SET DEFAULT 'BUY'::transactiontype;
-        """
-        await conn.execute(set_default_query)
-        print("✅ DEFAULT установлен для ENUM")
-        
-        await conn.close()
-        
-        return {
-            "status": "success", 
-            "message": "Миграция успешно завершена",
-            "details": "Колонка transaction_type добавлена и настроена"
-        }
-        
-    except Exception as e:
-        print(f"❌ Ошибка при миграции: {e}")
-        return {
-            "status": "error",
-            "message": f"Ошибка при миграции: {str(e)}"
-        }
-
-@api_router.post("/admin/simple-migration")
-async def simple_migration():
-    """Простая миграция - добавить transaction_type как TEXT"""
-    try:
-        import asyncpg
-        from shared.config import settings
-        
-        # Получаем URL базы данных
-        if settings.DATABASE_URL:
-            db_url = settings.DATABASE_URL
-        else:
-            db_url = f"postgresql://{settings.DB_USER}:{settings.DB_PASS}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
-        
-        print("Простая миграция...")
-        
-        # Подключаемся к базе данных
-        conn = await asyncpg.connect(db_url)
-        
-        # Проверяем, существует ли колонка
-        check_query = """
-        SELECT column_name 
-        FROM information_schema.columns 
-        WHERE table_name = 'coin_transactions' 
-        AND column_name = 'transaction_type';
-        """
-        
-        existing = await conn.fetchval(check_query)
-        
-        if not existing:
-            # Добавляем колонку как TEXT
-            add_query = """
-            ALTER TABLE coin_transactions 
-            ADD COLUMN transaction_type TEXT DEFAULT 'BUY';
-            """
-            await conn.execute(add_query)
-            print("✅ Колонка transaction_type добавлена как TEXT")
-        
-        # Обновляем все NULL значения на 'BUY'
-        update_query = """
-        UPDATE coin_transactions 
-        SET transaction_type = 'BUY' 
-        WHERE transaction_type IS NULL OR transaction_type = '';
-        """
-        result = await conn.execute(update_query)
-        print(f"✅ Обновлено записей: {result}")
-        
-        await conn.close()
-        
-        return {
-            "status": "success", 
-            "message": "Простая миграция завершена",
-            "column_exists": existing is not None,
-            "updated_records": result if not existing else "N/A"
-        }
-        
-    except Exception as e:
-        print(f"❌ Ошибка при простой миграции: {e}")
-        return {
-            "status": "error",
-            "message": f"Ошибка: {str(e)}"
-        }
-
-@api_router.post("/admin/fix-transaction-enum")
-async def fix_transaction_enum():
-    """Исправить значения ENUM в существующих записях"""
-    try:
-        import asyncpg
-        from shared.config import settings
-        
-        # Получаем URL базы данных
-        if settings.DATABASE_URL:
-            db_url = settings.DATABASE_URL
-        else:
-            db_url = f"postgresql://{settings.DB_USER}:{settings.DB_PASS}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
-        
-        print("Исправляем значения ENUM...")
-        
-        # Подключаемся к базе данных
-        conn = await asyncpg.connect(db_url)
-        
-        # Пересоздаем ENUM тип с правильными значениями
-        recreate_enum_query = """
-        -- Удаляем старый тип и создаем новый
-        DROP TYPE IF EXISTS transactiontype CASCADE;
-        CREATE TYPE transactiontype AS ENUM ('BUY', 'SELL');
-        """
-        await conn.execute(recreate_enum_query)
-        print("✅ ENUM тип пересоздан")
-        
-        # Изменяем колонку обратно на TEXT временно
-        to_text_query = """
-        ALTER TABLE coin_transactions 
-        ALTER COLUMN transaction_type TYPE TEXT;
-        """
-        await conn.execute(to_text_query)
-        print("✅ Колонка изменена на TEXT")
-        
-        # Обновляем значения на uppercase
-        update_values_query = """
-        UPDATE coin_transactions 
-        SET transaction_type = UPPER(transaction_type);
-        """
-        result = await conn.execute(update_values_query)
-        print(f"✅ Обновлено значений: {result}")
-        
-        # Изменяем обратно на ENUM
-        to_enum_query = """
-        ALTER TABLE coin_transactions 
-        ALTER COLUMN transaction_type TYPE transactiontype 
-        USING transaction_type::transactiontype;
-        """
-        await conn.execute(to_enum_query)
-        print("✅ Колонка изменена на ENUM")
-        
-        await conn.close()
-        
-        return {
-            "status": "success", 
-            "message": "ENUM значения исправлены",
-            "details": f"Обновлено записей: {result}"
-        }
-        
-    except Exception as e:
-        print(f"❌ Ошибка при исправлении ENUM: {e}")
-        return {
-            "status": "error",
-            "message": f"Ошибка при исправлении ENUM: {str(e)}"
-        }
-
 @api_router.get("/portfolio-test/{telegram_id}")
 async def test_portfolio(telegram_id: int):
     """Тестовый эндпоинт портфеля"""
@@ -331,11 +111,40 @@ async def get_transaction_repository(session: AsyncSession = Depends(get_async_s
 async def get_coin_cache_repository(session: AsyncSession = Depends(get_async_session)):
     return SQLAlchemyCoinCacheRepository(session)
 
+async def get_unit_of_work(session: AsyncSession = Depends(get_async_session)):
+    return SQLAlchemyUnitOfWork(session)
+
+async def get_price_repository(session: AsyncSession = Depends(get_async_session)):
+    return with_live_prices(SQLAlchemyPriceRepository(session))
+
+# Только чтение: реплика, если она задана и не отстает (см. read_replica)
+async def get_read_user_repository(session: AsyncSession = Depends(get_read_session)):
+    return SQLAlchemyUserRepository(session)
+
+async def get_read_portfolio_repository(session: AsyncSession = Depends(get_read_session)):
+    return SQLAlchemyPortfolioRepository(session)
+
+async def get_read_transaction_repository(session: AsyncSession = Depends(get_read_session)):
+    return SQLAlchemyTransactionRepository(session)
+
+async def get_read_coin_cache_repository(session: AsyncSession = Depends(get_read_session)):
+    return SQLAlchemyCoinCacheRepository(session)
+
+async def get_read_price_repository(session: AsyncSession = Depends(get_read_session)):
+    return with_live_prices(SQLAlchemyPriceRepository(session))
+
+async def get_read_snapshot_repository(session: AsyncSession = Depends(get_read_session)):
+    return SQLAlchemyPortfolioSnapshotRepository(session)
+
+async def get_coingecko_api() -> CoinGeckoAPI:
+    """CoinGecko API на общей сессии из пула соединений"""
+    return CoinGeckoAPI(http_clients.coingecko())
+
 # API Endpoints
 @api_router.get("/users/{telegram_id}", response_model=UserResponse)
 async def get_user(
     telegram_id: int,
-    user_repo: SQLAlchemyUserRepository = Depends(get_user_repository)
+    user_repo: SQLAlchemyUserRepository = Depends(get_read_user_repository)
 ):
     """Получить пользователя по Telegram ID"""
     try:
@@ -356,23 +165,49 @@ async def get_user(
 
 
 
+def quote_currency(currency: str) -> str:
+    """Проверить валюту котировки: 400 - не поддерживается, 503 - курс еще не загружен"""
+    try:
+        currency = fx_rates.normalize(currency)
+        fx_rates.rate(currency)
+    except UnsupportedCurrencyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FXRatesUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return currency
+
+def convert_coins(coins: List[CoinDataResponse], currency: str) -> List[CoinDataResponse]:
+    """Пересчитать рыночные данные из USD в валюту котировки"""
+    if currency == "usd":
+        return coins
+    return [
+        coin.model_copy(update={**fx_rates.convert_market_record(coin.model_dump(), currency), "currency": currency})
+        for coin in coins
+    ]
+
 @api_router.get("/portfolio/{telegram_id}")
 async def get_portfolio(
     telegram_id: int,
-    user_repo: SQLAlchemyUserRepository = Depends(get_user_repository),
-    portfolio_repo: SQLAlchemyPortfolioRepository = Depends(get_portfolio_repository)
+    currency: str = "usd",
+    user_repo: SQLAlchemyUserRepository = Depends(get_read_user_repository),
+    portfolio_repo: SQLAlchemyPortfolioRepository = Depends(get_read_portfolio_repository),
+    price_repo: PriceRepository = Depends(get_read_price_repository)
 ):
-    """Получить портфель пользователя с текущими ценами"""
+    """Получить портфель пользователя с текущими ценами (в валюте котировки currency)"""
+    currency = quote_currency(currency)
     
     try:
-        # Используем use case для получения реальных данных
-        use_case = GetUserPortfolioUseCase(user_repo, portfolio_repo)
+        # Цены читаются из общей таблицы (и живых цен потока), которую обновляет
+        # фоновая задача; GET ничего не пишет и не открывает сессию основной БД
+        use_case = GetUserPortfolioUseCase(user_repo, portfolio_repo, price_repo, price_refresher.request,
+                                           persist_prices=False)
         portfolio_items = await use_case.execute(telegram_id)
         
         if not portfolio_items:
             # Если портфель пустой, возвращаем пустую структуру
             return {
                 "telegram_id": telegram_id,
+                "currency": currency,
                 "portfolio": []
             }
         
@@ -385,14 +220,15 @@ async def get_portfolio(
                 "symbol": item.symbol,
                 "name": item.name,
                 "total_quantity": float(item.total_quantity),
-                "avg_price": float(item.avg_price),
-                "current_price": float(item.current_price) if item.current_price else 0.0,
-                "total_spent": float(item.total_spent),
+                "avg_price": float(fx_rates.convert(item.avg_price, currency)),
+                "current_price": float(fx_rates.convert(item.current_price, currency)) if item.current_price else 0.0,
+                "total_spent": float(fx_rates.convert(item.total_spent, currency)),
                 "last_updated": item.last_updated.isoformat() if item.last_updated else None
             })
         
         return {
             "telegram_id": telegram_id,
+            "currency": currency,
             "portfolio": portfolio_data
         }
         
@@ -400,12 +236,63 @@ async def get_portfolio(
         print(f"Ошибка при получении портфеля: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка при получении портфеля: {str(e)}")
 
+@api_router.get("/portfolio/{telegram_id}/history")
+async def get_portfolio_history(
+    telegram_id: int,
+    days: int = 30,
+    include_positions: bool = False,
+    user_repo: SQLAlchemyUserRepository = Depends(get_read_user_repository),
+    snapshot_repo: SQLAlchemyPortfolioSnapshotRepository = Depends(get_read_snapshot_repository)
+):
+    """История стоимости портфеля по дневным снимкам (USD, по возрастанию даты)
+
+    Значения считает фоновая задача по ценам своего дня; за сегодня -
+    последняя оценка. include_positions - разбивка по монетам.
+    """
+    days = max(1, min(days, settings.PORTFOLIO_HISTORY_MAX_DAYS))
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    
+    try:
+        user = await user_repo.get_by_telegram_id(telegram_id)
+        snapshots = await snapshot_repo.get_history(
+            user.id, since=since, with_positions=include_positions
+        ) if user else []
+    except Exception as e:
+        print(f"Ошибка при получении истории портфеля: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении истории портфеля: {str(e)}")
+    
+    history = []
+    for snapshot in snapshots:
+        point = {
+            "date": snapshot.snapshot_date.isoformat(),
+            "total_value": float(snapshot.total_value),
+            "cost_basis": float(snapshot.cost_basis),
+            "pnl": float(snapshot.pnl),
+        }
+        if include_positions:
+            point["positions"] = [
+                {
+                    "symbol": position.symbol,
+                    "quantity": float(position.quantity),
+                    "price": float(position.price) if position.price is not None else None,
+                    "value": float(position.value),
+                    "cost_basis": float(position.cost_basis),
+                }
+                for position in snapshot.positions
+            ]
+        history.append(point)
+    
+    return {
+        "telegram_id": telegram_id,
+        "currency": "usd",
+        "days": days,
+        "history": history
+    }
+
 @api_router.post("/portfolio/add-coin", response_model=TransactionResponse)
 async def add_coin_to_portfolio(
     request: AddCoinRequest,
-    user_repo: SQLAlchemyUserRepository = Depends(get_user_repository),
-    portfolio_repo: SQLAlchemyPortfolioRepository = Depends(get_portfolio_repository),
-    transaction_repo: SQLAlchemyTransactionRepository = Depends(get_transaction_repository)
+    uow: SQLAlchemyUnitOfWork = Depends(get_unit_of_work)
 ):
     """Добавить монету в портфель"""
     
@@ -413,21 +300,8 @@ async def add_coin_to_portfolio(
         # Логируем запрос для отладки
         print(f"Получен запрос на добавление монеты: {request}")
         
-        # Проверяем, существует ли пользователь, если нет - создаем
-        user = await user_repo.get_by_telegram_id(request.telegram_id)
-        if not user:
-            print(f"Создаем нового пользователя с telegram_id: {request.telegram_id}")
-            from domain.entities.user import User
-            from decimal import Decimal
-            new_user = User(
-                id=None,  # Явно указываем None для нового пользователя
-                telegram_id=request.telegram_id,
-                balance=Decimal('10000.00')
-            )
-            user = await user_repo.create(new_user)
-            print(f"Создан пользователь с ID: {user.id}")
-        
-        use_case = AddCoinToPortfolioUseCase(user_repo, portfolio_repo, transaction_repo)
+        # Отсутствующий пользователь создается в той же транзакции, что и сделка
+        use_case = AddCoinToPortfolioUseCase(uow, new_user_balance=Decimal('10000.00'))
         
         success = await use_case.execute(
             telegram_id=request.telegram_id,
@@ -439,6 +313,10 @@ async def add_coin_to_portfolio(
         
         if not success:
             raise HTTPException(status_code=400, detail="Ошибка при добавлении монеты")
+        read_replica.mark_written(request.telegram_id)
+        
+        # Цена новой монеты появится в общей таблице при ближайшем фоновом обновлении
+        price_refresher.request([request.symbol])
         
         return TransactionResponse(
             symbol=request.symbol,
@@ -459,9 +337,7 @@ async def add_coin_to_portfolio(
 @api_router.post("/portfolio/sell-coin", response_model=TransactionResponse)
 async def sell_coin_from_portfolio(
     request: SellCoinRequest,
-    user_repo: SQLAlchemyUserRepository = Depends(get_user_repository),
-    portfolio_repo: SQLAlchemyPortfolioRepository = Depends(get_portfolio_repository),
-    transaction_repo: SQLAlchemyTransactionRepository = Depends(get_transaction_repository)
+    uow: SQLAlchemyUnitOfWork = Depends(get_unit_of_work)
 ):
     """Продать монету из портфеля"""
     
@@ -469,7 +345,7 @@ async def sell_coin_from_portfolio(
         # Логируем запрос для отладки
         print(f"Получен запрос на продажу монеты: {request}")
         
-        use_case = SellCoinFromPortfolioUseCase(user_repo, portfolio_repo, transaction_repo)
+        use_case = SellCoinFromPortfolioUseCase(uow)
         
         success = await use_case.execute(
             telegram_id=request.telegram_id,
@@ -480,6 +356,7 @@ async def sell_coin_from_portfolio(
         
         if not success:
             raise HTTPException(status_code=400, detail="Ошибка при продаже монеты: недостаточно монет или монета не найдена")
+        read_replica.mark_written(request.telegram_id)
         
         return TransactionResponse(
             symbol=request.symbol,
@@ -497,13 +374,40 @@ async def sell_coin_from_portfolio(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Ошибка при продаже монеты: {str(e)}")
 
+def date_range(date_from: Optional[date], date_to: Optional[date]) -> dict:
+    """Даты из запроса (включительно) -> полуинтервал since/until репозитория"""
+    return {
+        "since": datetime.combine(date_from, time.min) if date_from else None,
+        "until": datetime.combine(date_to + timedelta(days=1), time.min) if date_to else None,
+    }
+
 @api_router.get("/transactions/{telegram_id}", response_model=List[TransactionResponse])
 async def get_transactions(
     telegram_id: int,
-    user_repo: SQLAlchemyUserRepository = Depends(get_user_repository),
-    transaction_repo: SQLAlchemyTransactionRepository = Depends(get_transaction_repository)
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    symbol: Optional[str] = None,
+    transaction_type: Optional[APITransactionType] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    user_repo: SQLAlchemyUserRepository = Depends(get_read_user_repository),
+    transaction_repo: SQLAlchemyTransactionRepository = Depends(get_read_transaction_repository)
 ):
-    """Получить транзакции пользователя"""
+    """Получить транзакции пользователя (новые первыми)
+
+    Без limit и cursor возвращается весь список (как раньше). С limit или
+    cursor - страница: следующая - тот же запрос с cursor из заголовка
+    X-Next-Cursor; заголовка нет, если страница последняя.
+    date_from/date_to включительно.
+    """
+    paged = limit is not None or cursor is not None
+    if paged:
+        limit = max(1, min(limit or settings.TRANSACTIONS_PAGE_SIZE, settings.TRANSACTIONS_MAX_PAGE_SIZE))
+    try:
+        after = TransactionCursor.decode(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     try:
         user = await user_repo.get_by_telegram_id(telegram_id)
@@ -511,7 +415,18 @@ async def get_transactions(
             # Если пользователя нет, возвращаем пустой список вместо 404
             return []
         
-        transactions = await transaction_repo.get_user_transactions(user.id)
+        # Лишняя строка показывает, есть ли следующая страница
+        transactions = await transaction_repo.get_user_transactions(
+            user.id,
+            limit=limit + 1 if paged else None,
+            cursor=after,
+            symbol=symbol,
+            transaction_type=TransactionType(transaction_type.value) if transaction_type else None,
+            **date_range(date_from, date_to),
+        )
+        if paged and len(transactions) > limit:
+            transactions = transactions[:limit]
+            response.headers["X-Next-Cursor"] = TransactionCursor.after(transactions[-1]).encode()
         return [
             TransactionResponse(
                 id=tx.id,
@@ -530,13 +445,109 @@ async def get_transactions(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при получении транзакций: {str(e)}")
 
+def export_response(name: str, export_format: str, compress: bool, user_id: Optional[int] = None,
+                    date_from: Optional[date] = None, date_to: Optional[date] = None,
+                    telegram_id: Optional[int] = None) -> StreamingResponse:
+    """Потоковая выгрузка транзакций: серверный курсор -> CSV/NDJSON -> (gzip)"""
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Формат выгрузки: {', '.join(EXPORT_FORMATS)}")
+    media_type, extension = EXPORT_FORMATS[export_format]
+
+    async def body():
+        # Своя сессия: курсор должен жить, пока отправляется ответ
+        factory, _ = await read_replica.choose(telegram_id)
+        async with factory() as session:
+            transactions = SQLAlchemyTransactionRepository(session).stream_transactions(
+                user_id, batch_size=settings.TRANSACTIONS_EXPORT_BATCH_SIZE, **date_range(date_from, date_to)
+            )
+            chunks = encode_transactions(transactions, export_format)
+            if compress:
+                chunks = gzip_chunks(chunks)
+            async for chunk in chunks:
+                yield chunk
+
+    filename = f"{name}.{extension}" + (".gz" if compress else "")
+    return StreamingResponse(
+        body(),
+        media_type="application/gzip" if compress else media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@api_router.get("/transactions/{telegram_id}/export")
+async def export_transactions(
+    telegram_id: int,
+    export_format: str = Query("csv", alias="format"),
+    gzip: bool = False,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    user_repo: SQLAlchemyUserRepository = Depends(get_read_user_repository)
+):
+    """Выгрузить всю историю транзакций пользователя (CSV/NDJSON, по желанию gzip)"""
+    user = await user_repo.get_by_telegram_id(telegram_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    return export_response(f"transactions_{telegram_id}", export_format, gzip, user.id, date_from, date_to, telegram_id)
+
+@api_router.get("/admin/transactions/export")
+async def export_all_transactions(
+    export_format: str = Query("csv", alias="format"),
+    gzip: bool = False,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+):
+    """Выгрузить транзакции всех пользователей"""
+    return export_response("transactions_all", export_format, gzip, None, date_from, date_to)
+
+# Кэш рыночных списков обновляется из провайдеров не чаще раза в 30 минут (rate limit)
+MARKET_CACHE_MAX_AGE_MINUTES = 30
+
+def market_etag(meta: Optional[CacheGeneration], limit: int, currency: str) -> Optional[str]:
+    """ETag рыночного списка по поколению кэша; None, если кэш не свежий"""
+    if meta is None or meta.age_seconds() >= MARKET_CACHE_MAX_AGE_MINUTES * 60:
+        return None
+    # Пересчет в другую валюту зависит еще и от курсов
+    fx_version = () if currency == "usd" else (fx_rates.refreshes,)
+    return meta.etag(limit, currency, *fx_version)
+
+async def current_generation(cache_repo: SQLAlchemyCoinCacheRepository, cache_type: str) -> Optional[CacheGeneration]:
+    """Поколение списка из coin_cache_meta (один запрос по ключу)
+
+    Зеркало в памяти могло не увидеть обновление другим процессом, и 304
+    по нему оставил бы клиенту устаревший список.
+    """
+    try:
+        return await cache_repo.get_generation(cache_type, reload=True)
+    except Exception as e:
+        print(f"⚠️ Не удалось прочитать поколение кэша {cache_type}: {e}")
+        return None
+
 @api_router.get("/market/top-coins", response_model=List[CoinDataResponse])
 async def get_top_coins(
+    request: Request,
     limit: int = 100, 
+    currency: str = "usd",
     response: Response = None,
-    cache_repo: SQLAlchemyCoinCacheRepository = Depends(get_coin_cache_repository)
+    cache_repo: SQLAlchemyCoinCacheRepository = Depends(get_read_coin_cache_repository),
+    cache_writer: SQLAlchemyCoinCacheRepository = Depends(get_coin_cache_repository)
 ):
     """Получить топ монет по рыночной капитализации (с кэшированием)"""
+    currency = quote_currency(currency)
+    etag = market_etag(await current_generation(cache_repo, 'top_coins'), limit, currency)
+    if etag and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    coins = await _get_top_coins_usd(limit, response, cache_repo, cache_writer)
+    etag = market_etag(cache_generations.get('top_coins'), limit, currency)
+    if etag and response:
+        response.headers["ETag"] = etag
+    return convert_coins(coins, currency)
+
+async def _get_top_coins_usd(
+    limit: int,
+    response: Response,
+    cache_repo: SQLAlchemyCoinCacheRepository,
+    cache_writer: SQLAlchemyCoinCacheRepository
+) -> List[CoinDataResponse]:
+    """Топ монет в USD: кэш, провайдеры, устаревший кэш, статический fallback"""
     
     # Добавляем CORS заголовки
     if response:
@@ -546,7 +557,7 @@ async def get_top_coins(
     
     try:
         # Проверяем, актуален ли кэш (обновляем каждые 30 минут для избежания rate limit)
-        is_fresh = await cache_repo.is_cache_fresh('top_coins', max_age_minutes=30)
+        is_fresh = await cache_repo.is_cache_fresh('top_coins', max_age_minutes=MARKET_CACHE_MAX_AGE_MINUTES)
         
         print(f"🔍 Проверка кэша топ монет: свежий={is_fresh}")
         
@@ -575,53 +586,32 @@ async def get_top_coins(
         
         # Если кэш устарел, обновляем данные из API
         print("🔄 Обновляем кэш топ монет из API")
-        import asyncio
-        
-        # Пробуем CoinMarketCap сначала
-        coins = None
-        if settings.COINMARKETCAP_API_KEY:
-            try:
-                print("💎 Используем CoinMarketCap API")
-                async with CoinMarketCapAPI(settings.COINMARKETCAP_API_KEY) as api:
-                    coins = await asyncio.wait_for(
-                        api.get_top_coins(limit),
-                        timeout=20.0
-                    )
-            except Exception as e:
-                print(f"❌ Ошибка CoinMarketCap API: {e}, переключаемся на CoinGecko")
-        
-        # Fallback на CoinGecko
-        if not coins:
-            print("🔄 Используем CoinGecko API")
-            async with CoinGeckoAPI() as api:
-                coins = await asyncio.wait_for(
-                    api.get_top_coins(limit),
-                    timeout=15.0
-                )
+        # Хеджированный запрос: если основной провайдер не ответил за свой p90,
+        # параллельно запрашивается резервный и берется первый ответ
+        coins, source = await get_market_router().call('get_top_coins', limit)
+        
+        if coins:
+            # Сохраняем в кэш
+            await cache_writer.update_cache(coins, 'top_coins', source)
+            print("✅ Кэш топ монет обновлен")
             
-            if coins:
-                # Сохраняем в кэш
-                await cache_repo.update_cache(coins, 'top_coins')
-                print("✅ Кэш топ монет обновлен")
-                
-                return [
-                    CoinDataResponse(
-                        id=coin['id'],
-                        symbol=coin['symbol'],
-                        name=coin['name'],
-                        current_price=coin['current_price'],
-                        market_cap=coin['market_cap'],
-                        market_cap_rank=coin['market_cap_rank'],
-                        price_change_percentage_24h=coin['price_change_percentage_24h'],
-                        image=coin['image'],
-                        total_volume=coin['total_volume']
-                    )
-                    for coin in coins
-                ]
-    
-    except asyncio.TimeoutError:
-        print("⏱️ Timeout при получении топ монет из API, пытаемся вернуть устаревший кэш")
-        # Если API не отвечает, возвращаем устаревший кэш
+            return [
+                CoinDataResponse(
+                    id=coin['id'],
+                    symbol=coin['symbol'],
+                    name=coin['name'],
+                    current_price=coin['current_price'],
+                    market_cap=coin['market_cap'],
+                    market_cap_rank=coin['market_cap_rank'],
+                    price_change_percentage_24h=coin['price_change_percentage_24h'],
+                    image=coin['image'],
+                    total_volume=coin['total_volume']
+                )
+                for coin in coins
+            ]
+        
+        # Провайдеры не ответили - возвращаем устаревший кэш
+        print("⏱️ Провайдеры не вернули топ монет, пытаемся вернуть устаревший кэш")
         cached_coins = await cache_repo.get_cached_coins('top_coins', limit)
         if cached_coins:
             return [
@@ -638,6 +628,7 @@ async def get_top_coins(
                 )
                 for coin in cached_coins
             ]
+    
     except Exception as e:
         print(f"❌ Ошибка при получении топ монет: {e}")
         # В случае ошибки пытаемся вернуть кэш
@@ -689,11 +680,31 @@ async def get_top_coins(
 
 @api_router.get("/market/growth-leaders", response_model=List[CoinDataResponse])
 async def get_growth_leaders(
+    request: Request,
     limit: int = 5, 
+    currency: str = "usd",
     response: Response = None,
-    cache_repo: SQLAlchemyCoinCacheRepository = Depends(get_coin_cache_repository)
+    cache_repo: SQLAlchemyCoinCacheRepository = Depends(get_read_coin_cache_repository),
+    cache_writer: SQLAlchemyCoinCacheRepository = Depends(get_coin_cache_repository)
 ):
     """Получить лидеров роста за 24 часа (с кэшированием)"""
+    currency = quote_currency(currency)
+    etag = market_etag(await current_generation(cache_repo, 'growth_leaders'), limit, currency)
+    if etag and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    coins = await _get_growth_leaders_usd(limit, response, cache_repo, cache_writer)
+    etag = market_etag(cache_generations.get('growth_leaders'), limit, currency)
+    if etag and response:
+        response.headers["ETag"] = etag
+    return convert_coins(coins, currency)
+
+async def _get_growth_leaders_usd(
+    limit: int,
+    response: Response,
+    cache_repo: SQLAlchemyCoinCacheRepository,
+    cache_writer: SQLAlchemyCoinCacheRepository
+) -> List[CoinDataResponse]:
+    """Лидеры роста в USD: кэш, провайдеры, устаревший кэш, статический fallback"""
     
     # Добавляем CORS заголовки
     if response:
@@ -703,7 +714,7 @@ async def get_growth_leaders(
     
     try:
         # Проверяем, актуален ли кэш (обновляем каждые 30 минут для избежания rate limit)
-        is_fresh = await cache_repo.is_cache_fresh('growth_leaders', max_age_minutes=30)
+        is_fresh = await cache_repo.is_cache_fresh('growth_leaders', max_age_minutes=MARKET_CACHE_MAX_AGE_MINUTES)
         
         if is_fresh:
             print("📦 Используем кэшированные данные лидеров роста")
@@ -726,52 +737,32 @@ async def get_growth_leaders(
         
         # Если кэш устарел, обновляем данные из API
         print("🔄 Обновляем кэш лидеров роста из API")
-        import asyncio
-        
-        # Пробуем CoinMarketCap сначала
-        coins = None
-        if settings.COINMARKETCAP_API_KEY:
-            try:
-                print("💎 Используем CoinMarketCap API")
-                async with CoinMarketCapAPI(settings.COINMARKETCAP_API_KEY) as api:
-                    coins = await asyncio.wait_for(
-                        api.get_growth_leaders(limit),
-                        timeout=20.0
-                    )
-            except Exception as e:
-                print(f"❌ Ошибка CoinMarketCap API: {e}, переключаемся на CoinGecko")
-        
-        # Fallback на CoinGecko
-        if not coins:
-            print("🔄 Используем CoinGecko API")
-            async with CoinGeckoAPI() as api:
-                coins = await asyncio.wait_for(
-                    api.get_growth_leaders(limit),
-                    timeout=15.0
-                )
+        # Хеджированный запрос: если основной провайдер не ответил за свой p90,
+        # параллельно запрашивается резервный и берется первый ответ
+        coins, source = await get_market_router().call('get_growth_leaders', limit)
+        
+        if coins:
+            # Сохраняем в кэш
+            await cache_writer.update_cache(coins, 'growth_leaders', source)
+            print("✅ Кэш лидеров роста обновлен")
             
-            if coins:
-                # Сохраняем в кэш
-                await cache_repo.update_cache(coins, 'growth_leaders')
-                print("✅ Кэш лидеров роста обновлен")
-                
-                return [
-                    CoinDataResponse(
-                        id=coin['id'],
-                        symbol=coin['symbol'],
-                        name=coin['name'],
-                        current_price=coin['current_price'],
-                        market_cap=coin['market_cap'],
-                        market_cap_rank=coin['market_cap_rank'],
-                        price_change_percentage_24h=coin['price_change_percentage_24h'],
-                        image=coin['image'],
-                        total_volume=coin['total_volume']
-                    )
-                    for coin in coins
-                ]
-    
-    except asyncio.TimeoutError:
-        print("⏱️ Timeout при получении лидеров роста из API")
+            return [
+                CoinDataResponse(
+                    id=coin['id'],
+                    symbol=coin['symbol'],
+                    name=coin['name'],
+                    current_price=coin['current_price'],
+                    market_cap=coin['market_cap'],
+                    market_cap_rank=coin['market_cap_rank'],
+                    price_change_percentage_24h=coin['price_change_percentage_24h'],
+                    image=coin['image'],
+                    total_volume=coin['total_volume']
+                )
+                for coin in coins
+            ]
+        
+        # Провайдеры не ответили - возвращаем устаревший кэш
+        print("⏱️ Провайдеры не вернули лидеров роста, пытаемся вернуть устаревший кэш")
         cached_coins = await cache_repo.get_cached_coins('growth_leaders', limit)
         if cached_coins:
             return [
@@ -788,6 +779,7 @@ async def get_growth_leaders(
                 )
                 for coin in cached_coins
             ]
+    
     except Exception as e:
         print(f"❌ Ошибка при получении лидеров роста: {e}")
         try:
@@ -870,8 +862,13 @@ async def get_growth_leaders(
     ][:limit]
 
 @api_router.get("/prices/{coin_names}")
-async def get_current_prices(coin_names: str):
+async def get_current_prices(
+    coin_names: str,
+    currency: str = "usd",
+    coin_api: CoinGeckoAPI = Depends(get_coingecko_api)
+):
     """Получить текущие цены для списка монет"""
+    currency = quote_currency(currency)
     try:
         # Разделяем имена монет по запятой
         names = [name.strip() for name in coin_names.split(',') if name.strip()]
@@ -879,28 +876,112 @@ async def get_current_prices(coin_names: str):
         if not names:
             raise HTTPException(status_code=400, detail="Не указаны имена монет")
         
-        async with CoinGeckoAPI() as api:
-            prices = await api.get_prices_batch(names)
-            
-            # Преобразуем Decimal в float для JSON сериализации
-            return {
-                "prices": {name: float(price) for name, price in prices.items()},
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
+        prices = await coin_api.get_prices_batch(names)
+        
+        # Преобразуем Decimal в float для JSON сериализации
+        return {
+            "prices": {name: float(fx_rates.convert(price, currency)) for name, price in prices.items()},
+            "currency": currency,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при получении цен: {str(e)}")
 
+@api_router.get("/admin/price-cache")
+async def get_price_cache_stats():
+    """Статистика in-memory кэша цен (попадания/промахи)"""
+    return {
+        "status": "success",
+        "price_cache": price_cache.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@api_router.get("/admin/db-pool")
+async def get_db_pool_stats():
+    """Состояние пула соединений с БД: занятые, переполнение, ожидание выдачи"""
+    return {
+        "status": "success",
+        "pool": pool_stats(async_engine.sync_engine),
+        "replica": {
+            **read_replica.stats(),
+            "pool": pool_stats(read_engine.sync_engine, replica_pool_monitor) if read_engine is not None else None,
+        },
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@api_router.get("/admin/migrations")
+async def get_migrations():
+    """Версии схемы БД: какие миграции применены и когда"""
+    try:
+        migrations = await migration_status()
+    except Exception as e:
+        print(f"❌ Ошибка при чтении версий схемы: {e}")
+        raise HTTPException(status_code=503, detail="Не удалось прочитать версии схемы БД")
+    return {
+        "status": "success",
+        "migrations": migrations,
+        "pending": [m["version"] for m in migrations if m["applied_at"] is None],
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@api_router.get("/admin/portfolio-snapshots")
+async def get_portfolio_snapshot_stats():
+    """Состояние фоновой задачи снимков портфелей"""
+    return {
+        "status": "success",
+        "enabled": settings.PORTFOLIO_SNAPSHOTS_ENABLED,
+        "snapshots": portfolio_snapshotter.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@api_router.post("/admin/portfolio-snapshots")
+async def take_portfolio_snapshots():
+    """Сохранить снимки всех портфелей за сегодня по текущим ценам"""
+    try:
+        saved = await portfolio_snapshotter.take_snapshots()
+    except Exception as e:
+        print(f"❌ Ошибка при сохранении снимков портфелей: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при сохранении снимков: {str(e)}")
+    return {
+        "status": "success",
+        "saved": saved,
+        "snapshots": portfolio_snapshotter.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@api_router.get("/admin/price-feed")
+async def get_price_feed_stats():
+    """Состояние потока живых цен (таблица live_prices и подписчики)"""
+    return {
+        "status": "success",
+        "source": settings.PRICE_FEED_SOURCE or None,
+        "live_prices": live_prices.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@api_router.get("/admin/upstream")
+async def get_upstream_stats():
+    """Состояние внешних API: лимитеры, выключатели, HTTP-кэш и задержки провайдеров"""
+    return {
+        "status": "success",
+        "rate_limiters": {name: limiter.stats() for name, limiter in rate_limiters.items()},
+        "circuit_breakers": {name: breaker.stats() for name, breaker in circuit_breakers.items()},
+        "http_cache": http_response_cache.stats(),
+        "fx_rates": fx_rates.stats(),
+        "coin_cache": cache_generations.stats(),
+        "providers": get_market_router().stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
 @api_router.post("/admin/refresh-coin-cache")
 async def refresh_coin_cache(
     cache_repo: SQLAlchemyCoinCacheRepository = Depends(get_coin_cache_repository)
 ):
     """Принудительно обновить кэш монет из API (админ endpoint)"""
     try:
-        import asyncio
-        
         results = {
             "top_coins": False,
             "growth_leaders": False,
@@ -910,23 +991,10 @@ async def refresh_coin_cache(
         # Обновляем топ монеты
         try:
             print("🔄 Обновляем кэш топ монет...")
-            coins = None
-            
-            # Пробуем CoinMarketCap
-            if settings.COINMARKETCAP_API_KEY:
-                try:
-                    async with CoinMarketCapAPI(settings.COINMARKETCAP_API_KEY) as api:
-                        coins = await asyncio.wait_for(api.get_top_coins(100), timeout=20.0)
-                except Exception as cmc_error:
-                    print(f"⚠️ CoinMarketCap не сработал: {cmc_error}")
-            
-            # Fallback на CoinGecko
-            if not coins:
-                async with CoinGeckoAPI() as api:
-                    coins = await asyncio.wait_for(api.get_top_coins(100), timeout=20.0)
+            coins, source = await get_market_router().call('get_top_coins', 100)
             
             if coins:
-                await cache_repo.update_cache(coins, 'top_coins')
+                await cache_repo.update_cache(coins, 'top_coins', source)
                 results["top_coins"] = True
                 print("✅ Кэш топ монет обновлен")
         except Exception as e:
@@ -937,23 +1005,10 @@ async def refresh_coin_cache(
         # Обновляем лидеров роста
         try:
             print("🔄 Обновляем кэш лидеров роста...")
-            coins = None
-            
-            # Пробуем CoinMarketCap
-            if settings.COINMARKETCAP_API_KEY:
-                try:
-                    async with CoinMarketCapAPI(settings.COINMARKETCAP_API_KEY) as api:
-                        coins = await asyncio.wait_for(api.get_growth_leaders(20), timeout=20.0)
-                except Exception as cmc_error:
-                    print(f"⚠️ CoinMarketCap не сработал: {cmc_error}")
-            
-            # Fallback на CoinGecko
-            if not coins:
-                async with CoinGeckoAPI() as api:
-                    coins = await asyncio.wait_for(api.get_growth_leaders(20), timeout=20.0)
+            coins, source = await get_market_router().call('get_growth_leaders', 20)
             
             if coins:
-                await cache_repo.update_cache(coins, 'growth_leaders')
+                await cache_repo.update_cache(coins, 'growth_leaders', source)
                 results["growth_leaders"] = True
                 print("✅ Кэш лидеров роста обновлен")
         except Exception as e:
@@ -0,0 +1,82 @@
+"""
+Потоковая выгрузка транзакций в CSV / NDJSON
+
+Строки приходят из серверного курсора порциями и сразу кодируются в
+чанки ответа - в памяти держится одна порция, сколько бы ни было истории.
+Сжатие gzip выполняется на лету тем же потоком.
+"""
+import csv
+import io
+import json
+import zlib
+from typing import AsyncIterator, Dict, Iterable
+
+from domain.entities.user import CoinTransaction
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+EXPORT_FIELDS = ("id", "user_id", "symbol", "name", "quantity", "price", "total_spent", "transaction_type", "timestamp")
+
+# Сколько строк копить перед отправкой чанка
+ROWS_PER_CHUNK = 500
+
+
+def transaction_row(tx: CoinTransaction) -> Dict[str, object]:
+    return {
+        "id": tx.id,
+        "user_id": tx.user_id,
+        "symbol": tx.symbol,
+        "name": tx.name,
+        "quantity": str(tx.quantity),
+        "price": str(tx.price),
+        "total_spent": str(tx.total_spent),
+        "transaction_type": tx.transaction_type.value,
+        "timestamp": tx.timestamp.isoformat() if tx.timestamp else None,
+    }
+
+
+def _encode_csv(rows: Iterable[Dict[str, object]], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def _encode_ndjson(rows: Iterable[Dict[str, object]]) -> bytes:
+    return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode()
+
+
+async def encode_transactions(transactions: AsyncIterator[CoinTransaction], export_format: str,
+                              rows_per_chunk: int = ROWS_PER_CHUNK) -> AsyncIterator[bytes]:
+    """Транзакции -> чанки CSV (с заголовком) или NDJSON"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {export_format}")
+
+    def encode(rows, first: bool) -> bytes:
+        return _encode_csv(rows, header=first) if export_format == "csv" else _encode_ndjson(rows)
+
+    rows = []
+    first = True
+    async for tx in transactions:
+        rows.append(transaction_row(tx))
+        if len(rows) >= rows_per_chunk:
+            yield encode(rows, first)
+            rows = []
+            first = False
+    if rows or (first and export_format == "csv"):
+        yield encode(rows, first)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Сжать поток чанков в один gzip-файл"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Локальный заменитель CoinGecko и CoinMarketCap для тестов и нагрузочных замеров
+
+Отдает /coins/markets, /simple/price, /search, /coins/list, /exchange_rates
+(CoinGecko, префикс /api/v3) и listings/latest, quotes/latest, map
+(CoinMarketCap, префикс /v1) из детерминированных фикстур. Задержка, доля
+ошибок 5xx и ответов 429 задаются при запуске и меняются на лету через
+POST /__config. Ответы содержат ETag и Cache-Control: max-age, условные
+запросы (If-None-Match) получают 304.
+
+Запуск:
+    python scripts/fake_market_server.py --port 8090 --coins 1000 --latency-ms 150 --rate-limit-rate 0.05
+
+Backend направляется на него переменными окружения:
+    COINGECKO_API_URL=http://127.0.0.1:8090/api/v3
+    COINMARKETCAP_API_URL=http://127.0.0.1:8090/v1
+"""
+
+import argparse
+import asyncio
+import hashlib
+import random
+from collections import Counter
+from dataclasses import dataclass, asdict, fields
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+
+# Реальные монеты в начале рейтинга, остальные генерируются (coin-N)
+SEED_COINS = [
+    ("bitcoin", "btc", "Bitcoin", 112000.0),
+    ("ethereum", "eth", "Ethereum", 4600.0),
+    ("tether", "usdt", "Tether", 1.0),
+    ("ripple", "xrp", "XRP", 2.9),
+    ("binancecoin", "bnb", "BNB", 850.0),
+    ("solana", "sol", "Solana", 210.0),
+    ("usd-coin", "usdc", "USDC", 1.0),
+    ("dogecoin", "doge", "Dogecoin", 0.23),
+    ("tron", "trx", "TRON", 0.35),
+    ("cardano", "ada", "Cardano", 0.85),
+    ("chainlink", "link", "Chainlink", 23.0),
+    ("the-open-network", "ton", "Toncoin", 3.2),
+]
+
+# Курсы фиатных валют к USD для /simple/price?vs_currencies=...
+FIAT_PER_USD = {"usd": 1.0, "eur": 0.92, "rub": 81.5}
+
+
+@dataclass
+class FakeMarketConfig:
+    """Параметры поведения фейкового провайдера"""
+    coins: int = 500
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after_seconds: int = 5
+    cache_max_age: int = 0
+    seed: int = 42
+
+
+def build_fixtures(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Детерминированный список монет, отсортированный по капитализации"""
+    rng = random.Random(seed)
+    coins = []
+    for rank in range(1, count + 1):
+        if rank <= len(SEED_COINS):
+            coin_id, symbol, name, price = SEED_COINS[rank - 1]
+        else:
+            coin_id, symbol, name = f"coin-{rank}", f"c{rank}", f"Coin {rank}"
+            price = round(rng.uniform(0.0001, 50.0), 6)
+        market_cap = round(2.2e12 / rank ** 1.3, 2)
+        coins.append({
+            "id": coin_id,
+            "cmc_id": rank,
+            "symbol": symbol,
+            "name": name,
+            "current_price": price,
+            "market_cap": market_cap,
+            "market_cap_rank": rank,
+            "price_change_percentage_24h": round(rng.uniform(-15.0, 25.0), 2),
+            "total_volume": round(market_cap * rng.uniform(0.01, 0.2), 2),
+            "image": f"https://example.invalid/coins/{coin_id}.png",
+        })
+    return coins
+
+
+class FakeMarketServer:
+    """Состояние фейкового сервера: фикстуры, параметры и счетчики запросов"""
+
+    def __init__(self, config: Optional[FakeMarketConfig] = None):
+        self.config = config or FakeMarketConfig()
+        self.rng = random.Random(self.config.seed)
+        self.requests: Counter = Counter()
+        self.statuses: Counter = Counter()
+        self.load_fixtures()
+
+    def load_fixtures(self):
+        self.coins = build_fixtures(self.config.coins, self.config.seed)
+        self.by_id = {coin["id"]: coin for coin in self.coins}
+        self.by_symbol: Dict[str, Dict[str, Any]] = {}
+        for coin in self.coins:
+            self.by_symbol.setdefault(coin["symbol"], coin)
+
+    # --- Инфраструктура ---------------------------------------------------
+
+    @web.middleware
+    async def faults(self, request: web.Request, handler):
+        """Задержка и внедрение ошибок для всех не служебных путей"""
+        if request.path.startswith("/__"):
+            return await handler(request)
+
+        self.requests[request.path] += 1
+        delay_ms = self.config.latency_ms + self.rng.uniform(0, self.config.jitter_ms)
+        if delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000)
+
+        roll = self.rng.random()
+        if roll < self.config.rate_limit_rate:
+            response = web.json_response(
+                {"status": {"error_code": 429, "error_message": "rate limited"}},
+                status=429,
+                headers={"Retry-After": str(self.config.retry_after_seconds)},
+            )
+        elif roll < self.config.rate_limit_rate + self.config.error_rate:
+            response = web.json_response({"error": "internal error"}, status=500)
+        else:
+            response = self.conditional(request, await handler(request))
+        self.statuses[response.status] += 1
+        return response
+
+    def conditional(self, request: web.Request, response: web.Response) -> web.Response:
+        """ETag/Cache-Control для успешных ответов и 304 на совпадающий If-None-Match"""
+        if response.status != 200 or not isinstance(response.body, bytes):
+            return response
+        etag = f'"{hashlib.sha1(response.body).hexdigest()[:16]}"'
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={self.config.cache_max_age}"}
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers=headers)
+        response.headers.update(headers)
+        return response
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.faults])
+        app.router.add_get("/api/v3/coins/markets", self.coingecko_markets)
+        app.router.add_get("/api/v3/simple/price", self.coingecko_simple_price)
+        app.router.add_get("/api/v3/search", self.coingecko_search)
+        app.router.add_get("/api/v3/coins/list", self.coingecko_coins_list)
+        app.router.add_get("/api/v3/exchange_rates", self.coingecko_exchange_rates)
+        app.router.add_get("/v1/cryptocurrency/listings/latest", self.cmc_listings)
+        app.router.add_get("/v1/cryptocurrency/quotes/latest", self.cmc_quotes)
+        app.router.add_get("/v1/cryptocurrency/map", self.cmc_map)
+        app.router.add_get("/__stats", self.stats)
+        app.router.add_post("/__config", self.update_config)
+        return app
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "config": asdict(self.config),
+            "requests": dict(self.requests),
+            "statuses": {str(status): count for status, count in self.statuses.items()},
+        })
+
+    async def update_config(self, request: web.Request) -> web.Response:
+        """Изменить задержку/ошибки без перезапуска (сбрасывает счетчики)"""
+        payload = await request.json()
+        names = {field.name for field in fields(FakeMarketConfig)}
+        for key, value in payload.items():
+            if key in names:
+                setattr(self.config, key, type(getattr(self.config, key))(value))
+        if "coins" in payload or "seed" in payload:
+            self.rng = random.Random(self.config.seed)
+            self.load_fixtures()
+        self.requests.clear()
+        self.statuses.clear()
+        return web.json_response(asdict(self.config))
+
+    # --- CoinGecko --------------------------------------------------------
+
+    async def coingecko_markets(self, request: web.Request) -> web.Response:
+        per_page = min(int(request.query.get("per_page", 100)), 250)
+        page = max(int(request.query.get("page", 1)), 1)
+        order = request.query.get("order", "market_cap_desc")
+
+        coins = self.coins
+        if order == "price_change_percentage_24h_desc":
+            coins = sorted(coins, key=lambda coin: coin["price_change_percentage_24h"], reverse=True)
+
+        start = (page - 1) * per_page
+        return web.json_response([
+            {key: value for key, value in coin.items() if key != "cmc_id"}
+            for coin in coins[start:start + per_page]
+        ])
+
+    async def coingecko_simple_price(self, request: web.Request) -> web.Response:
+        ids = [coin_id for coin_id in request.query.get("ids", "").split(",") if coin_id]
+        currencies = [currency for currency in request.query.get("vs_currencies", "usd").split(",") if currency]
+        result = {}
+        for coin_id in ids:
+            coin = self.by_id.get(coin_id)
+            if coin:
+                result[coin_id] = {
+                    currency: coin["current_price"] * FIAT_PER_USD[currency]
+                    for currency in currencies
+                    if currency in FIAT_PER_USD
+                }
+        return web.json_response(result)
+
+    async def coingecko_exchange_rates(self, request: web.Request) -> web.Response:
+        usd_per_btc = self.by_id["bitcoin"]["current_price"]
+        rates = {
+            "btc": {"name": "Bitcoin", "unit": "BTC", "value": 1.0, "type": "crypto"},
+            "eth": {
+                "name": "Ether", "unit": "ETH", "type": "crypto",
+                "value": usd_per_btc / self.by_id["ethereum"]["current_price"],
+            },
+        }
+        for currency, per_usd in FIAT_PER_USD.items():
+            rates[currency] = {
+                "name": currency.upper(), "unit": currency.upper(), "type": "fiat",
+                "value": usd_per_btc * per_usd,
+            }
+        return web.json_response({"rates": rates})
+
+    async def coingecko_search(self, request: web.Request) -> web.Response:
+        query = request.query.get("query", "").lower().strip()
+        matches = [
+            coin for coin in self.coins
+            if query and (query == coin["id"] or query == coin["symbol"] or query in coin["name"].lower())
+        ][:25]
+        return web.json_response({
+            "coins": [
+                {
+                    "id": coin["id"],
+                    "name": coin["name"],
+                    "symbol": coin["symbol"].upper(),
+                    "market_cap_rank": coin["market_cap_rank"],
+                }
+                for coin in matches
+            ]
+        })
+
+    async def coingecko_coins_list(self, request: web.Request) -> web.Response:
+        return web.json_response([
+            {"id": coin["id"], "symbol": coin["symbol"], "name": coin["name"]}
+            for coin in self.coins
+        ])
+
+    # --- CoinMarketCap ----------------------------------------------------
+
+    def _cmc_coin(self, coin: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": coin["cmc_id"],
+            "name": coin["name"],
+            "symbol": coin["symbol"].upper(),
+            "slug": coin["id"],
+            "cmc_rank": coin["market_cap_rank"],
+            "quote": {
+                "USD": {
+                    "price": coin["current_price"],
+                    "volume_24h": coin["total_volume"],
+                    "percent_change_24h": coin["price_change_percentage_24h"],
+                    "market_cap": coin["market_cap"],
+                }
+            },
+        }
+
+    async def cmc_listings(self, request: web.Request) -> web.Response:
+        start = max(int(request.query.get("start", 1)), 1)
+        limit = min(int(request.query.get("limit", 100)), 5000)
+        sort = request.query.get("sort", "market_cap")
+        reverse = request.query.get("sort_dir", "desc") == "desc"
+
+        coins = self.coins
+        if sort == "percent_change_24h":
+            coins = sorted(coins, key=lambda coin: coin["price_change_percentage_24h"], reverse=reverse)
+        elif not reverse:
+            coins = list(reversed(coins))
+
+        return web.json_response({
+            "status": {"error_code": 0},
+            "data": [self._cmc_coin(coin) for coin in coins[start - 1:start - 1 + limit]],
+        })
+
+    async def cmc_quotes(self, request: web.Request) -> web.Response:
+        data = {}
+        if "id" in request.query:
+            # По id ответ ключуется id, как в настоящем API
+            by_cmc_id = {str(coin["cmc_id"]): coin for coin in self.coins}
+            for cmc_id in request.query["id"].split(","):
+                coin = by_cmc_id.get(cmc_id)
+                if coin:
+                    data[cmc_id] = self._cmc_coin(coin)
+        symbols = [symbol.lower() for symbol in request.query.get("symbol", "").split(",") if symbol]
+        for symbol in symbols:
+            coin = self.by_symbol.get(symbol)
+            if coin:
+                data[symbol.upper()] = self._cmc_coin(coin)
+        return web.json_response({"status": {"error_code": 0}, "data": data})
+
+    async def cmc_map(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": {"error_code": 0},
+            "data": [
+                {
+                    "id": coin["cmc_id"],
+                    "name": coin["name"],
+                    "symbol": coin["symbol"].upper(),
+                    "slug": coin["id"],
+                    "rank": coin["market_cap_rank"],
+                }
+                for coin in self.coins
+            ],
+        })
+
+
+SERVER_KEY = web.AppKey("server", FakeMarketServer)
+
+
+def create_app(config: Optional[FakeMarketConfig] = None) -> web.Application:
+    """Создать aiohttp-приложение фейкового провайдера (состояние - app[SERVER_KEY])"""
+    server = FakeMarketServer(config)
+    app = server.create_app()
+    app[SERVER_KEY] = server
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Фейковый сервер рыночных данных (CoinGecko/CoinMarketCap)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--coins", type=int, default=FakeMarketConfig.coins, help="Количество монет в фикстурах")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Задержка каждого ответа")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Случайная добавка к задержке (0..jitter)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=5, help="Значение Retry-After для 429")
+    parser.add_argument("--cache-max-age", type=int, default=0, help="max-age в Cache-Control ответов")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    config = FakeMarketConfig(
+        coins=args.coins,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after_seconds=args.retry_after,
+        cache_max_age=args.cache_max_age,
+        seed=args.seed,
+    )
+    print(f"🧪 Фейковый сервер рыночных данных: http://{args.host}:{args.port}")
+    print(f"   COINGECKO_API_URL=http://{args.host}:{args.port}/api/v3")
+    print(f"   COINMARKETCAP_API_URL=http://{args.host}:{args.port}/v1")
+    web.run_app(create_app(config), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Версионные миграции схемы БД
+
+Запуск:
+    python scripts/migrate.py status
+    python scripts/migrate.py upgrade
+    python scripts/migrate.py upgrade --to 3
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from infrastructure.database.migrations.runner import migration_status, run_migrations
+
+
+async def show_status():
+    for migration in await migration_status():
+        mark = "✅" if migration["applied_at"] else "⏳"
+        applied_at = migration["applied_at"] or "не применена"
+        mode = "" if migration["transactional"] else " (CONCURRENTLY)"
+        print(f"{mark} {migration['version']:04d} {migration['name']}{mode} - {applied_at}")
+
+
+async def upgrade(target):
+    applied = await run_migrations(target)
+    if applied:
+        print(f"🎉 Применено миграций: {len(applied)}")
+    else:
+        print("✅ Схема уже актуальна")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="Показать примененные и ожидающие миграции")
+    upgrade_parser = subparsers.add_parser("upgrade", help="Применить ожидающие миграции")
+    upgrade_parser.add_argument("--to", type=int, help="Остановиться на этой версии")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        asyncio.run(show_status())
+    else:
+        asyncio.run(upgrade(args.to))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Воспроизведение записанного потока цен и замер пропускной способности
+
+Читает NDJSON-запись тиков, прогоняет ее через LivePriceTable с заданным
+числом подписчиков и печатает тиков/с, обновления и потери подписчиков.
+С --record генерирует синтетическую запись (случайное блуждание цен).
+
+Запуск:
+    python scripts/replay_price_feed.py --path scripts/fixtures/price_ticks.ndjson --speed 0 --repeat 100 --subscribers 4
+    python scripts/replay_price_feed.py --record scripts/fixtures/price_ticks.ndjson --ticks 600
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from infrastructure.price_feed.base import PriceTick
+from infrastructure.price_feed.price_table import LivePriceTable
+from infrastructure.price_feed.replay import ReplayFeed, load_ticks, save_ticks
+
+
+# Стартовые цены синтетической записи
+START_PRICES = {
+    "btc": 112000.0,
+    "eth": 4600.0,
+    "usdt": 1.0,
+    "xrp": 2.9,
+    "bnb": 850.0,
+    "sol": 210.0,
+    "doge": 0.23,
+    "trx": 0.35,
+    "ada": 0.85,
+    "ton": 3.2,
+}
+
+
+def generate_ticks(count: int, seed: int = 42, start_ts: float = 1760000000.0):
+    """Синтетические тики: ~10 в секунду, случайное блуждание цены"""
+    rng = random.Random(seed)
+    prices = dict(START_PRICES)
+    symbols = list(prices)
+    ticks = []
+    ts = start_ts
+    for _ in range(count):
+        ts += rng.uniform(0.05, 0.15)
+        symbol = rng.choice(symbols)
+        if symbol != "usdt":
+            prices[symbol] *= 1 + rng.gauss(0, 0.0005)
+        ticks.append(PriceTick(symbol, round(prices[symbol], 8), round(ts, 3), "binance"))
+    return ticks
+
+
+async def consume(subscription, counter):
+    async for _ in subscription:
+        counter[0] += 1
+
+
+async def benchmark(path: str, speed: float, repeat: int, subscribers: int):
+    recorded = load_ticks(path)
+    table = LivePriceTable()
+    counters = [[0] for _ in range(subscribers)]
+    subscriptions = [table.subscribe() for _ in range(subscribers)]
+    consumers = [asyncio.create_task(consume(s, c)) for s, c in zip(subscriptions, counters)]
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        async for tick in ReplayFeed(ticks=recorded, speed=speed).ticks():
+            table.update(tick)
+    elapsed = time.perf_counter() - started
+
+    stats = table.stats()
+    for subscription in subscriptions:
+        subscription.close()
+    await asyncio.gather(*consumers)
+
+    total = len(recorded) * repeat
+    print(f"📈 {total} тиков за {elapsed:.3f}с: {total / elapsed:,.0f} тиков/с")
+    print(f"   символов: {stats['symbols']}, обновлений: {stats['updates']}, вне порядка: {stats['out_of_order']}")
+    for index, (subscription, counter) in enumerate(zip(subscriptions, counters)):
+        print(f"   подписчик {index}: получено {counter[0]}, потеряно {subscription.dropped}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записи потока цен")
+    parser.add_argument("--path", default="scripts/fixtures/price_ticks.ndjson", help="NDJSON-запись тиков")
+    parser.add_argument("--speed", type=float, default=0, help="Ускорение (0 - без пауз)")
+    parser.add_argument("--repeat", type=int, default=1, help="Сколько раз прогнать запись")
+    parser.add_argument("--subscribers", type=int, default=1)
+    parser.add_argument("--record", help="Сгенерировать синтетическую запись в указанный файл")
+    parser.add_argument("--ticks", type=int, default=600, help="Размер синтетической записи")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.record:
+        save_ticks(args.record, generate_ticks(args.ticks, args.seed))
+        print(f"✅ Записано {args.ticks} тиков в {args.record}")
+        return
+
+    asyncio.run(benchmark(args.path, args.speed, args.repeat, args.subscribers))
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,40 @@ class Settings(BaseSettings):
     DB_USER: str = os.getenv("DB_USER", "postgres")
     DB_PASS: str = os.getenv("DB_PASS", "user123")
     
+    # Пул соединений приложения (asyncpg)
+    DB_POOL_MODE: str = os.getenv("DB_POOL_MODE", "queue")  # queue | null (без пула, за pgbouncer)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+    DB_POOL_RECYCLE_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_POOL_USE_LIFO: bool = os.getenv("DB_POOL_USE_LIFO", "false").lower() == "true"
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+    DB_PGBOUNCER_MODE: str = os.getenv("DB_PGBOUNCER_MODE", "")  # "" | session | transaction
+
+    # Миграции схемы: при старте и/или через scripts/migrate.py
+    DB_MIGRATE_ON_STARTUP: bool = os.getenv("DB_MIGRATE_ON_STARTUP", "true").lower() == "true"
+    DB_MIGRATION_URL: str = os.getenv("DB_MIGRATION_URL", "")  # напрямую к PostgreSQL, в обход pgbouncer
+
+    # Реплика для чтения (необязательно): при отставании или ошибках чтение идет в основную БД
+    READ_DATABASE_URL: str = os.getenv("READ_DATABASE_URL", "")
+    READ_REPLICA_MAX_LAG_SECONDS: float = float(os.getenv("READ_REPLICA_MAX_LAG_SECONDS", "5"))
+    READ_REPLICA_CHECK_INTERVAL_SECONDS: float = float(os.getenv("READ_REPLICA_CHECK_INTERVAL_SECONDS", "5"))
+
+    # Как часто перечитывать coin_cache_meta (поколения кэша монет других экземпляров)
+    CACHE_GENERATION_TTL_SECONDS: float = float(os.getenv("CACHE_GENERATION_TTL_SECONDS", "30"))
+
+    # История транзакций: размер страницы для запроса с cursor без limit и верхняя граница limit
+    TRANSACTIONS_PAGE_SIZE: int = int(os.getenv("TRANSACTIONS_PAGE_SIZE", "50"))
+    TRANSACTIONS_MAX_PAGE_SIZE: int = int(os.getenv("TRANSACTIONS_MAX_PAGE_SIZE", "500"))
+    TRANSACTIONS_EXPORT_BATCH_SIZE: int = int(os.getenv("TRANSACTIONS_EXPORT_BATCH_SIZE", "1000"))  # строк за выборку курсора
+
+    # Дневные снимки стоимости портфелей (история для графиков)
+    PORTFOLIO_SNAPSHOTS_ENABLED: bool = os.getenv("PORTFOLIO_SNAPSHOTS_ENABLED", "true").lower() == "true"
+    PORTFOLIO_SNAPSHOT_INTERVAL_SECONDS: float = float(os.getenv("PORTFOLIO_SNAPSHOT_INTERVAL_SECONDS", "3600"))
+    PORTFOLIO_SNAPSHOT_BATCH_SIZE: int = int(os.getenv("PORTFOLIO_SNAPSHOT_BATCH_SIZE", "500"))  # пользователей в пакете
+    PORTFOLIO_HISTORY_MAX_DAYS: int = int(os.getenv("PORTFOLIO_HISTORY_MAX_DAYS", "365"))
+    
     # Дополнительные настройки из .env
     CHAT_IDS: str = os.getenv("CHAT_IDS", "")
     
@@ -33,6 +67,10 @@ class Settings(BaseSettings):
             return self.DATABASE_URL.replace("postgresql://", "postgresql://", 1)
         return f"postgresql://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
     
+    @property
+    def READ_ASYNC_DB_URL(self) -> str:
+        return self.READ_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+    
     @property
     def ASYNC_DB_URL(self) -> str:
         if self.DATABASE_URL:
@@ -44,9 +82,63 @@ class Settings(BaseSettings):
     API_PORT: int = int(os.getenv("API_PORT", "8001"))
     
     # External APIs
-    COINGECKO_API_URL: str = "https://api.coingecko.com/api/v3"
+    # Базовые URL можно переопределить, например на локальный scripts/fake_market_server.py
+    COINGECKO_API_URL: str = os.getenv("COINGECKO_API_URL", "https://api.coingecko.com/api/v3")
+    COINMARKETCAP_API_URL: str = os.getenv("COINMARKETCAP_API_URL", "https://pro-api.coinmarketcap.com/v1")
     COINMARKETCAP_API_KEY: str = os.getenv("COINMARKETCAP_API_KEY", "")
-    
+
+    # HTTP клиенты внешних API (общий пул соединений)
+    HTTP_POOL_LIMIT: int = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+    HTTP_POOL_LIMIT_PER_HOST: int = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+    HTTP_DNS_CACHE_TTL: int = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+    HTTP_KEEPALIVE_TIMEOUT: float = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))
+    HTTP_REQUEST_TIMEOUT: float = float(os.getenv("HTTP_REQUEST_TIMEOUT", "30"))
+
+    # HTTP-кэш ответов внешних API (Cache-Control, ETag/Last-Modified)
+    HTTP_CACHE_ENABLED: bool = os.getenv("HTTP_CACHE_ENABLED", "true").lower() == "true"
+    HTTP_CACHE_MAX_BYTES: int = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))  # сумма сырых тел ответов
+
+    # Лимиты запросов к провайдерам (token bucket)
+    COINGECKO_RATE_LIMIT_PER_MINUTE: float = float(os.getenv("COINGECKO_RATE_LIMIT_PER_MINUTE", "30"))
+    COINMARKETCAP_RATE_LIMIT_PER_MINUTE: float = float(os.getenv("COINMARKETCAP_RATE_LIMIT_PER_MINUTE", "30"))
+    COINMARKETCAP_MONTHLY_CREDITS: int = int(os.getenv("COINMARKETCAP_MONTHLY_CREDITS", "10000"))
+
+    # Circuit breaker провайдеров (429/5xx/таймауты)
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_BREAKER_BASE_BACKOFF_SECONDS: float = float(os.getenv("CIRCUIT_BREAKER_BASE_BACKOFF_SECONDS", "5"))
+    CIRCUIT_BREAKER_MAX_BACKOFF_SECONDS: float = float(os.getenv("CIRCUIT_BREAKER_MAX_BACKOFF_SECONDS", "300"))
+
+    # Маршрутизация между провайдерами (хеджированные запросы)
+    MARKET_DATA_TIMEOUT_SECONDS: float = float(os.getenv("MARKET_DATA_TIMEOUT_SECONDS", "20"))
+    HEDGE_DEFAULT_DELAY_SECONDS: float = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS", "2"))
+
+    # In-memory кэш цен
+    PRICE_CACHE_TTL_SECONDS: float = float(os.getenv("PRICE_CACHE_TTL_SECONDS", "60"))
+    PRICE_CACHE_STALE_SECONDS: float = float(os.getenv("PRICE_CACHE_STALE_SECONDS", "600"))
+    PRICE_CACHE_MAX_SIZE: int = int(os.getenv("PRICE_CACHE_MAX_SIZE", "5000"))
+    PRICE_CACHE_SERVE_STALE: bool = os.getenv("PRICE_CACHE_SERVE_STALE", "true").lower() == "true"
+
+    # Справочник монет (символ -> id CoinGecko/CoinMarketCap)
+    COIN_DIRECTORY_REFRESH_HOURS: float = float(os.getenv("COIN_DIRECTORY_REFRESH_HOURS", "24"))
+    COIN_DIRECTORY_RANKED_PAGES: int = int(os.getenv("COIN_DIRECTORY_RANKED_PAGES", "4"))
+
+    # Фоновое обновление цен (таблица coin_prices)
+    PRICE_REFRESH_INTERVAL_SECONDS: float = float(os.getenv("PRICE_REFRESH_INTERVAL_SECONDS", "60"))
+    PRICE_REFRESH_CHUNK_SIZE: int = int(os.getenv("PRICE_REFRESH_CHUNK_SIZE", "100"))
+
+    # Поток живых цен: "" (отключен), "replay" (запись NDJSON) или "websocket"
+    PRICE_FEED_SOURCE: str = os.getenv("PRICE_FEED_SOURCE", "")
+    PRICE_FEED_REPLAY_PATH: str = os.getenv("PRICE_FEED_REPLAY_PATH", "scripts/fixtures/price_ticks.ndjson")
+    PRICE_FEED_REPLAY_SPEED: float = float(os.getenv("PRICE_FEED_REPLAY_SPEED", "1"))
+    PRICE_FEED_REPLAY_LOOP: bool = os.getenv("PRICE_FEED_REPLAY_LOOP", "true").lower() == "true"
+    PRICE_FEED_WS_URL: str = os.getenv("PRICE_FEED_WS_URL", "")
+    PRICE_FEED_MAX_AGE_SECONDS: float = float(os.getenv("PRICE_FEED_MAX_AGE_SECONDS", "60"))
+
+    # Валюты котировки: цены запрашиваются в USD и пересчитываются по курсам в памяти
+    QUOTE_CURRENCIES: str = os.getenv("QUOTE_CURRENCIES", "usd,eur,rub,btc,eth")
+    FX_REFRESH_INTERVAL_SECONDS: float = float(os.getenv("FX_REFRESH_INTERVAL_SECONDS", "600"))
+    BOT_EXTRA_CURRENCIES: str = os.getenv("BOT_EXTRA_CURRENCIES", "eur,rub")
+
     class Config:
         env_file = ".env"
         extra = "ignore"  # Игнорируем дополнительные поля
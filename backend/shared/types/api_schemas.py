@@ -116,6 +116,7 @@ class CoinDataResponse(BaseModel):
     price_change_percentage_24h: Optional[float] = None
     image: Optional[str] = None
     total_volume: Optional[float] = None
+    currency: str = "usd"
     
     model_config = ConfigDict(
         json_encoders={
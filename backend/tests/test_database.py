@@ -0,0 +1,526 @@
+import pytest
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from sqlalchemy import exc
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import NullPool
+from sqlalchemy.util import greenlet_spawn
+
+from infrastructure.database import pool as db_pool
+from infrastructure.database.cache_generations import CacheGeneration, CacheGenerations, cache_generations
+from infrastructure.database.read_replica import ReadReplica
+from infrastructure.database.pool import InstrumentedAsyncQueuePool, PoolMonitor, async_engine_options, pool_stats
+from domain.entities.user import PortfolioSnapshot, SnapshotPosition, TransactionCursor, TransactionType
+from infrastructure.database.repositories import (
+    SQLAlchemyCoinCacheRepository, SQLAlchemyPortfolioRepository, SQLAlchemyPortfolioSnapshotRepository,
+    SQLAlchemyTransactionRepository,
+)
+
+
+class FakeDBAPIConnection:
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RecordingSession:
+    """Сессия, которая запоминает SQL и возвращает заданные строки"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.statements = []
+        self.flushes = 0
+
+    async def execute(self, statement):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        row = self.rows.pop(0) if self.rows else None
+        return SimpleNamespace(one=lambda: row, one_or_none=lambda: row,
+                               scalar_one=lambda: row, scalar_one_or_none=lambda: row,
+                               all=lambda: row or [],
+                               scalars=lambda: SimpleNamespace(all=lambda: row or []))
+
+    async def flush(self):
+        self.flushes += 1
+
+    async def commit(self):
+        self.commits = getattr(self, "commits", 0) + 1
+
+    async def stream_scalars(self, statement):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        self.execution_options = statement.get_execution_options()
+        rows = self.rows
+
+        async def partitions():
+            for index in range(0, len(rows), 2):
+                yield rows[index:index + 2]
+
+        async def close():
+            self.closed = True
+
+        return SimpleNamespace(partitions=partitions, close=close)
+
+
+def position_row(quantity):
+    return SimpleNamespace(id=7, user_id=1, symbol='BTC', name='Bitcoin', total_quantity=Decimal(quantity),
+                           avg_price=Decimal('100'), current_price=None, total_spent=Decimal('100'),
+                           last_updated=datetime(2025, 1, 1))
+
+
+class TestPositionUpsert:
+    """Тесты для атомарного изменения позиции одним запросом"""
+
+    @pytest.mark.asyncio
+    async def test_buy_is_single_upsert(self):
+        """Тест: покупка - один INSERT ... ON CONFLICT с пересчетом средней цены в SQL"""
+        session = RecordingSession([position_row('1')])
+        repo = SQLAlchemyPortfolioRepository(session, autocommit=False)
+
+        position = await repo.apply_buy(1, 'BTC', 'Bitcoin', Decimal('1'), Decimal('100'))
+
+        assert len(session.statements) == 1
+        sql = session.statements[0]
+        assert "ON CONFLICT ON CONSTRAINT uq_user_portfolio_user_symbol DO UPDATE" in sql
+        assert "user_portfolio.avg_price * user_portfolio.total_quantity + excluded.total_spent" in sql
+        assert "RETURNING" in sql
+        assert position.current_price == Decimal('0')
+        assert session.flushes == 1
+
+    @pytest.mark.asyncio
+    async def test_sell_all_deletes_position(self):
+        """Тест: продажа - условный UPDATE, позиция с нулевым количеством удаляется"""
+        session = RecordingSession([position_row('0')])
+        repo = SQLAlchemyPortfolioRepository(session, autocommit=False)
+
+        position = await repo.apply_sell(1, 'BTC', Decimal('1'))
+
+        assert position.total_quantity == 0
+        assert "user_portfolio.total_quantity >= " in session.statements[0]
+        assert session.statements[1].startswith("DELETE FROM user_portfolio")
+
+    @pytest.mark.asyncio
+    async def test_sell_insufficient(self):
+        """Тест: если монет недостаточно, UPDATE не затрагивает строк и продажа отклоняется"""
+        session = RecordingSession([])
+        repo = SQLAlchemyPortfolioRepository(session, autocommit=False)
+
+        assert await repo.apply_sell(1, 'BTC', Decimal('5')) is None
+        assert len(session.statements) == 1
+
+
+class TestPriceWriteBack:
+    """Тесты для пакетной записи цен позиций"""
+
+    @pytest.mark.asyncio
+    async def test_one_update_from_values(self):
+        """Тест: цены всех позиций пишутся одним UPDATE ... FROM (VALUES ...)"""
+        session = RecordingSession([])
+        repo = SQLAlchemyPortfolioRepository(session, autocommit=False)
+        items = [
+            SimpleNamespace(id=index, current_price=Decimal('1'), last_updated=datetime(2025, 1, 1))
+            for index in range(1, 31)
+        ]
+
+        assert await repo.update_current_prices(items) == 30
+
+        assert len(session.statements) == 1
+        assert "FROM (VALUES" in session.statements[0]
+        assert "WHERE user_portfolio.id = prices.id" in session.statements[0]
+        assert session.flushes == 1
+
+
+class TestTransactionHistory:
+    """Тесты для постраничной истории транзакций"""
+
+    @pytest.mark.asyncio
+    async def test_keyset_page_with_filters(self):
+        """Тест: курсор - сравнение строк (timestamp, id), фильтры и LIMIT в SQL"""
+        session = RecordingSession([])
+        repo = SQLAlchemyTransactionRepository(session)
+
+        await repo.get_user_transactions(
+            1, limit=51, cursor=TransactionCursor(datetime(2025, 1, 1), 99),
+            symbol='btc', transaction_type=TransactionType.SELL,
+            since=datetime(2024, 1, 1), until=datetime(2025, 1, 1),
+        )
+
+        sql = session.statements[0]
+        assert "(coin_transactions.timestamp, coin_transactions.id) < (" in sql
+        assert "coin_transactions.symbol = " in sql
+        assert "coin_transactions.transaction_type = " in sql
+        assert "coin_transactions.timestamp >= " in sql and "coin_transactions.timestamp < " in sql
+        assert "ORDER BY coin_transactions.timestamp DESC, coin_transactions.id DESC" in sql
+        assert "LIMIT" in sql
+
+    @pytest.mark.asyncio
+    async def test_without_arguments_reads_all(self):
+        """Тест: без курсора и лимита - вся история пользователя"""
+        session = RecordingSession([])
+        repo = SQLAlchemyTransactionRepository(session)
+
+        assert await repo.get_user_transactions(1) == []
+        assert "LIMIT" not in session.statements[0]
+        assert "<" not in session.statements[0]
+
+
+class TestTransactionStream:
+    """Тесты для потокового чтения транзакций"""
+
+    @pytest.mark.asyncio
+    async def test_server_side_cursor(self):
+        """Тест: выборка через yield_per, строки отдаются по порциям, курсор закрывается"""
+        rows = [
+            SimpleNamespace(id=index, user_id=1, symbol='BTC', name='Bitcoin', quantity=Decimal('1'),
+                            price=Decimal('1'), total_spent=Decimal('1'), transaction_type='BUY',
+                            timestamp=datetime(2025, 1, 1))
+            for index in range(1, 6)
+        ]
+        session = RecordingSession(rows)
+        repo = SQLAlchemyTransactionRepository(session)
+
+        streamed = [tx.id async for tx in repo.stream_transactions(1, batch_size=2)]
+
+        assert streamed == [1, 2, 3, 4, 5]
+        assert session.execution_options["yield_per"] == 2
+        assert "ORDER BY coin_transactions.timestamp, coin_transactions.id" in session.statements[0]
+        assert session.closed
+
+
+class TestPortfolioSnapshots:
+    """Тесты для дневных снимков портфелей"""
+
+    @pytest.mark.asyncio
+    async def test_positions_streamed_by_user(self):
+        """Тест: позиции всех пользователей идут курсором, сгруппированными по user_id"""
+        session = RecordingSession([position_row('1'), position_row('2'), position_row('3')])
+
+        positions = [item async for item in SQLAlchemyPortfolioRepository(session).stream_positions(batch_size=2)]
+
+        assert len(positions) == 3
+        assert session.execution_options["yield_per"] == 2
+        assert "ORDER BY user_portfolio.user_id, user_portfolio.id" in session.statements[0]
+        assert session.closed
+
+    @pytest.mark.asyncio
+    async def test_upsert_by_user_and_date(self):
+        """Тест: снимки пишутся порциями с перезаписью за ту же дату, один commit"""
+        session = RecordingSession([])
+        repo = SQLAlchemyPortfolioSnapshotRepository(session)
+        repo.CHUNK_SIZE = 2
+        snapshots = [
+            PortfolioSnapshot.from_positions(user_id, date(2025, 1, 1), [
+                SnapshotPosition(symbol='BTC', quantity=Decimal('1'), cost_basis=Decimal('100'), price=Decimal('150')),
+            ])
+            for user_id in (1, 2, 3)
+        ]
+
+        assert await repo.upsert_snapshots(snapshots) == 3
+
+        assert len(session.statements) == 2
+        assert all("ON CONFLICT (user_id, snapshot_date) DO UPDATE" in sql for sql in session.statements)
+        assert "positions = excluded.positions" in session.statements[0]
+        assert session.commits == 1
+
+    @pytest.mark.asyncio
+    async def test_user_ids_with_positions(self):
+        """Тест: для нулевых снимков берутся пользователи с непустым снимком за период"""
+        session = RecordingSession([[2, 5]])
+
+        user_ids = await SQLAlchemyPortfolioSnapshotRepository(session).get_user_ids(date(2024, 12, 31), date(2025, 1, 1))
+
+        assert user_ids == [2, 5]
+        assert "SELECT DISTINCT portfolio_snapshots.user_id" in session.statements[0]
+        assert "jsonb_array_length(portfolio_snapshots.positions) > " in session.statements[0]
+
+    @pytest.mark.asyncio
+    async def test_history_without_positions(self):
+        """Тест: история без разбивки не читает колонку positions"""
+        row = SimpleNamespace(user_id=1, snapshot_date=date(2025, 1, 1), total_value=Decimal('150'),
+                              cost_basis=Decimal('100'), created_at=None)
+        session = RecordingSession([[row]])
+
+        history = await SQLAlchemyPortfolioSnapshotRepository(session).get_history(
+            1, since=date(2025, 1, 1), with_positions=False
+        )
+
+        assert "positions" not in session.statements[0]
+        assert "ORDER BY portfolio_snapshots.snapshot_date" in session.statements[0]
+        assert history[0].pnl == Decimal('50')
+        assert history[0].positions == []
+
+    @pytest.mark.asyncio
+    async def test_history_positions_from_json(self):
+        """Тест: разбивка по монетам читается из JSON без потери точности"""
+        row = SimpleNamespace(user_id=1, snapshot_date=date(2025, 1, 1), total_value=Decimal('0.3'),
+                              cost_basis=Decimal('0.2'), created_at=None,
+                              positions=[{'symbol': 'BTC', 'quantity': '0.1', 'price': '3', 'value': '0.3',
+                                          'cost_basis': '0.2'},
+                                         {'symbol': 'XYZ', 'quantity': '5', 'price': None, 'value': '0',
+                                          'cost_basis': '0'}])
+        session = RecordingSession([[row]])
+
+        history = await SQLAlchemyPortfolioSnapshotRepository(session).get_history(1)
+
+        btc, xyz = history[0].positions
+        assert btc.value == Decimal('0.3')
+        assert xyz.price is None and xyz.value == Decimal('0')
+
+
+class TestCoinCacheRefresh:
+    """Тесты для пакетного обновления кэша монет"""
+
+    @pytest.mark.asyncio
+    async def test_upsert_chunks_and_stale_delete(self):
+        """Тест: upsert по (id, cache_type) порциями, затем удаление выпавших монет, один commit"""
+        cache_generations.clear()
+        session = RecordingSession([None, None, None, None, 4])
+        repo = SQLAlchemyCoinCacheRepository(session)
+        repo.CHUNK_SIZE = 2
+        coins = [
+            {'id': f'coin-{index}', 'symbol': f'c{index}', 'name': f'Coin {index}', 'current_price': 1.0}
+            for index in range(5)
+        ] + [{'id': 'coin-0', 'symbol': 'c0', 'name': 'Coin 0', 'current_price': 2.0}]
+
+        meta = await repo.update_cache(coins, 'growth_leaders', 'coingecko')
+
+        inserts, stale, generation = session.statements[:3], session.statements[3], session.statements[4]
+        assert len(session.statements) == 5
+        assert all("ON CONFLICT (id, cache_type) DO UPDATE" in sql for sql in inserts)
+        assert "current_price = excluded.current_price" in inserts[0]
+        assert stale.startswith("DELETE FROM coin_cache")
+        assert "coin_cache.last_updated < " in stale
+        assert "generation = (coin_cache_meta.generation + " in generation
+        assert session.commits == 1
+        assert (meta.generation, meta.row_count, meta.source) == (4, 5, 'coingecko')
+        assert cache_generations.get('growth_leaders') == meta
+        cache_generations.clear()
+
+    @pytest.mark.asyncio
+    async def test_empty_refresh_keeps_cache(self):
+        """Тест: пустой ответ провайдера не очищает кэш"""
+        session = RecordingSession([])
+
+        await SQLAlchemyCoinCacheRepository(session).update_cache([], 'top_coins')
+
+        assert session.statements == []
+
+
+class TestCacheGenerations:
+    """Тесты для поколений кэша монет"""
+
+    def test_newer_generation_wins(self):
+        """Тест: перечитанное старое поколение не вытесняет записанное новое"""
+        registry = CacheGenerations()
+        now = datetime.utcnow()
+
+        registry.update(CacheGeneration('top_coins', 5, now))
+        registry.update(CacheGeneration('top_coins', 4, now))
+
+        assert registry.get('top_coins').generation == 5
+        assert registry.get('top_coins').etag(100, 'usd') == '"top_coins-5-100-usd"'
+
+    @pytest.mark.asyncio
+    async def test_freshness_without_coin_cache(self, monkeypatch):
+        """Тест: свежесть отвечается из памяти, coin_cache_meta перечитывается раз в ttl"""
+        clock = [0.0]
+        registry = CacheGenerations(ttl_seconds=30, clock=lambda: clock[0])
+        monkeypatch.setattr("infrastructure.database.repositories.cache_generations", registry)
+        row = SimpleNamespace(cache_type='top_coins', generation=3, refreshed_at=datetime.utcnow(),
+                              source='coingecko', row_count=100)
+        session = RecordingSession([row, row])
+        repo = SQLAlchemyCoinCacheRepository(session)
+
+        assert await repo.is_cache_fresh('top_coins', max_age_minutes=30)
+        assert await repo.is_cache_fresh('top_coins', max_age_minutes=30)
+        assert len(session.statements) == 1
+        assert "FROM coin_cache_meta" in session.statements[0]
+
+        clock[0] = 31
+        assert await repo.is_cache_fresh('top_coins', max_age_minutes=30)
+        assert len(session.statements) == 2
+        assert registry.reloads == 2
+
+    @pytest.mark.asyncio
+    async def test_reload_reads_generation_row(self, monkeypatch):
+        """Тест: для ETag поколение читается из coin_cache_meta, даже если зеркало не устарело"""
+        registry = CacheGenerations(ttl_seconds=30, clock=lambda: 0.0)
+        monkeypatch.setattr("infrastructure.database.repositories.cache_generations", registry)
+        now = datetime.utcnow()
+        registry.update(CacheGeneration('top_coins', 3, now))
+        # Другой экземпляр уже обновил список
+        row = SimpleNamespace(cache_type='top_coins', generation=4, refreshed_at=now,
+                              source='coingecko', row_count=100)
+        repo = SQLAlchemyCoinCacheRepository(RecordingSession([row]))
+
+        meta = await repo.get_generation('top_coins', reload=True)
+
+        assert meta.generation == 4
+        assert registry.get('top_coins').generation == 4
+
+
+class FakeReplicaSession:
+    """Сессия реплики, отвечающая на запрос отставания"""
+
+    def __init__(self, lag):
+        self.lag = lag
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def execute(self, statement):
+        if isinstance(self.lag, Exception):
+            raise self.lag
+        return SimpleNamespace(scalar=lambda: self.lag)
+
+
+class TestReadReplica:
+    """Тесты для маршрутизации чтения на реплику"""
+
+    def make_replica(self, lag, clock):
+        state = {"lag": lag}
+        replica = ReadReplica(lambda: FakeReplicaSession(state["lag"]), lambda: "primary",
+                              max_lag_seconds=5, check_interval_seconds=10, clock=lambda: clock[0])
+        return replica, state
+
+    @pytest.mark.asyncio
+    async def test_lagging_replica_falls_back(self):
+        """Тест: отстающая реплика не используется, после проверки с малым отставанием - снова используется"""
+        clock = [0.0]
+        replica, state = self.make_replica(30, clock)
+
+        assert (await replica.choose())[1] is False
+        state["lag"] = 1
+        assert (await replica.choose())[1] is False  # до следующей проверки решение не меняется
+        clock[0] = 10
+        assert (await replica.choose())[1] is True
+        assert replica.lag_seconds == 1
+
+    @pytest.mark.asyncio
+    async def test_error_falls_back(self):
+        """Тест: ошибка соединения с репликой переключает чтение на основную БД"""
+        clock = [0.0]
+        replica, _ = self.make_replica(ConnectionRefusedError("replica down"), clock)
+
+        factory, is_replica = await replica.choose()
+
+        assert (factory(), is_replica) == ("primary", False)
+        assert replica.failures == 1
+        assert "replica down" in replica.last_error
+
+    @pytest.mark.asyncio
+    async def test_connect_error_retried_on_primary(self):
+        """Тест: запрос, на котором реплика не ответила, получает сессию основной БД"""
+        clock = [0.0]
+        replica, _ = self.make_replica(0, clock)
+        closed = []
+
+        class DeadReplicaSession(FakeReplicaSession):
+            async def connection(self):
+                raise ConnectionResetError("replica gone")
+
+            async def close(self):
+                closed.append(True)
+
+        await replica.check()
+        replica.replica_factory = lambda: DeadReplicaSession(0)
+
+        session = await replica.open_session(42)
+
+        assert session == "primary"
+        assert closed == [True]
+        assert replica.healthy is False
+        assert replica.primary_retries == 1
+        assert "replica gone" in replica.last_error
+
+    @pytest.mark.asyncio
+    async def test_reads_own_writes_on_primary(self):
+        """Тест: после сделки чтение пользователя идет в основную БД, пока реплика может отставать"""
+        clock = [0.0]
+        replica, _ = self.make_replica(0, clock)
+
+        replica.mark_written(42)
+
+        assert (await replica.choose(42))[1] is False
+        assert (await replica.choose(7))[1] is True
+        clock[0] = 6
+        assert (await replica.choose(42))[1] is True
+
+    @pytest.mark.asyncio
+    async def test_disabled_without_replica(self):
+        """Тест: без READ_DATABASE_URL все чтение идет в основную БД"""
+        replica = ReadReplica(None, lambda: "primary")
+
+        assert (await replica.choose(42))[1] is False
+        assert replica.stats()["enabled"] is False
+
+
+class TestPoolMonitor:
+    """Тесты для мониторинга пула соединений"""
+
+    def test_wait_histogram(self):
+        """Тест: ожидания раскладываются по корзинам, крайняя - все, что дольше"""
+        monitor = PoolMonitor(buckets_ms=(1, 10))
+        for wait_ms in (0.5, 3, 10, 250):
+            monitor.observe_wait(wait_ms)
+
+        stats = monitor.stats()
+        assert stats["wait_histogram"] == {"<=1ms": 1, "<=10ms": 2, ">10ms": 1}
+        assert stats["max_wait_ms"] == 250
+        assert stats["avg_wait_ms"] == pytest.approx(65.875)
+
+    @pytest.mark.asyncio
+    async def test_exhausted_pool_counts_timeout(self):
+        """Тест: при исчерпании пула таймаут выдачи виден в счетчиках и статистике"""
+        monitor = PoolMonitor()
+        pool = InstrumentedAsyncQueuePool(FakeDBAPIConnection, pool_size=1, max_overflow=0, timeout=0.05)
+        pool.monitor = monitor
+
+        def exhaust():
+            held = pool.connect()
+            stats = pool_stats(SimpleNamespace(pool=pool), monitor)
+            with pytest.raises(exc.TimeoutError):
+                pool.connect()
+            held.close()
+            return stats
+
+        stats = await greenlet_spawn(exhaust)
+
+        assert stats["checked_out"] == 1
+        assert stats["size"] == 1
+        assert monitor.timeouts == 1
+        assert monitor.max_wait_ms >= 50
+
+
+class TestEngineOptions:
+    """Тесты для параметров движка по настройкам"""
+
+    def test_pgbouncer_transaction_mode(self, monkeypatch):
+        """Тест: за pgbouncer без пула кэши подготовленных выражений отключаются"""
+        monkeypatch.setattr(db_pool.settings, "DB_POOL_MODE", "null")
+        monkeypatch.setattr(db_pool.settings, "DB_PGBOUNCER_MODE", "transaction")
+
+        options = async_engine_options()
+
+        assert options["poolclass"] is NullPool
+        assert "pool_size" not in options
+        assert options["connect_args"]["statement_cache_size"] == 0
+        assert options["connect_args"]["prepared_statement_cache_size"] == 0
+        assert options["connect_args"]["prepared_statement_name_func"]() != options["connect_args"]["prepared_statement_name_func"]()
+
+    def test_queue_pool_settings(self, monkeypatch):
+        """Тест: размеры пула и таймауты берутся из настроек"""
+        monkeypatch.setattr(db_pool.settings, "DB_POOL_MODE", "queue")
+        monkeypatch.setattr(db_pool.settings, "DB_PGBOUNCER_MODE", "")
+        monkeypatch.setattr(db_pool.settings, "DB_POOL_SIZE", 20)
+        monkeypatch.setattr(db_pool.settings, "DB_MAX_OVERFLOW", 5)
+
+        options = async_engine_options()
+
+        assert options["poolclass"] is InstrumentedAsyncQueuePool
+        assert (options["pool_size"], options["max_overflow"]) == (20, 5)
+        assert options["connect_args"] == {"statement_cache_size": db_pool.settings.DB_STATEMENT_CACHE_SIZE}
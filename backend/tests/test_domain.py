@@ -2,7 +2,7 @@ import pytest
 from decimal import Decimal
 from datetime import datetime
 
-from domain.entities.user import User, UserPortfolio, CoinTransaction
+from domain.entities.user import User, UserPortfolio, CoinTransaction, TransactionCursor
 
 
 class TestUserEntity:
@@ -90,4 +90,22 @@ class TestCoinTransactionEntity:
         assert transaction.symbol == 'BTC'
         assert transaction.quantity == Decimal('0.5')
         assert transaction.price == Decimal('50000.00')
-        assert transaction.total_spent == Decimal('25000.00') 
\ No newline at end of file
+        assert transaction.total_spent == Decimal('25000.00')
+
+
+class TestTransactionCursor:
+    """Тесты для курсора истории транзакций"""
+
+    def test_roundtrip(self):
+        """Тест: курсор кодируется в строку для URL и восстанавливается"""
+        cursor = TransactionCursor(timestamp=datetime(2025, 3, 1, 12, 30, 15, 123456), id=42)
+
+        token = cursor.encode()
+
+        assert "=" not in token and "/" not in token
+        assert TransactionCursor.decode(token) == cursor
+
+    def test_corrupted(self):
+        """Тест: поврежденный курсор - ValueError"""
+        with pytest.raises(ValueError):
+            TransactionCursor.decode("not-a-cursor")
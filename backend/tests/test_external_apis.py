@@ -0,0 +1,789 @@
+import asyncio
+from decimal import Decimal
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestServer
+
+from infrastructure.external_apis.coinmarketcap_api import CoinMarketCapAPI
+from infrastructure.external_apis.http_cache import HTTPResponseCache
+from infrastructure.external_apis.fx_rates import FXRates, FXRatesUnavailableError, UnsupportedCurrencyError
+from infrastructure.external_apis import json_codec
+from infrastructure.external_apis.json_codec import loads, project_records
+from infrastructure.external_apis.coin_directory import BUILTIN_COINS, CoinIndex, CoinDirectoryRecord
+from infrastructure.external_apis import coin_gecko_api
+from infrastructure.external_apis.base import MarketDataProvider
+from infrastructure.external_apis.circuit_breaker import (
+    CircuitBreaker, CircuitOpenError, CLOSED, HALF_OPEN, OPEN, parse_retry_after
+)
+from infrastructure.external_apis.price_cache import PriceCache, price_key
+from infrastructure.external_apis.provider_router import ProviderRouter
+from infrastructure.external_apis.rate_limiter import TokenBucket, RateLimitExceeded
+from infrastructure.external_apis.single_flight import SingleFlight
+from scripts.fake_market_server import SERVER_KEY, FakeMarketConfig, create_app
+
+
+class TestSingleFlight:
+    """Тесты для объединения одновременных запросов"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_request(self):
+        """Тест: одновременные вызовы с одним ключом выполняют загрузку один раз"""
+        flight = SingleFlight()
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 42
+
+        results = await asyncio.gather(*[flight.do('btc', load) for _ in range(5)])
+
+        assert results == [42] * 5
+        assert len(calls) == 1
+        assert flight.inflight == 0
+
+    @pytest.mark.asyncio
+    async def test_do_many_fetches_only_missing_keys(self):
+        """Тест: пакетный запрос ждет уже запрошенные ключи и догружает остальные"""
+        flight = SingleFlight()
+        requested = []
+
+        async def fetch_many(keys):
+            requested.append(sorted(keys))
+            await asyncio.sleep(0.01)
+            return {key: key.upper() for key in keys}
+
+        first, second = await asyncio.gather(
+            flight.do_many(['btc', 'eth'], fetch_many),
+            flight.do_many(['eth', 'sol', 'sol'], fetch_many),
+        )
+
+        assert first == {'btc': 'BTC', 'eth': 'ETH'}
+        assert second == {'eth': 'ETH', 'sol': 'SOL'}
+        assert requested == [['btc', 'eth'], ['sol']]
+
+    @pytest.mark.asyncio
+    async def test_do_many_failure_returns_empty(self):
+        """Тест: ошибка загрузчика не ломает ожидающих"""
+        flight = SingleFlight()
+
+        async def fetch_many(keys):
+            await asyncio.sleep(0.01)
+            raise RuntimeError("429")
+
+        results = await asyncio.gather(
+            flight.do_many(['btc'], fetch_many),
+            flight.do_many(['btc'], fetch_many),
+        )
+
+        assert results == [{}, {}]
+        assert flight.inflight == 0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPriceCache:
+    """Тесты для in-memory кэша цен"""
+
+    @pytest.mark.asyncio
+    async def test_get_or_load_loads_only_missing(self):
+        """Тест: из загрузчика запрашиваются только отсутствующие ключи"""
+        cache = PriceCache(ttl_seconds=60, clock=FakeClock())
+        cache.set('btc', 100.0)
+        requested = []
+
+        async def loader(keys):
+            requested.extend(keys)
+            return {key: 1.0 for key in keys}
+
+        result = await cache.get_or_load(['btc', 'eth'], loader)
+
+        assert result == {'btc': 100.0, 'eth': 1.0}
+        assert requested == ['eth']
+        assert cache.hits == 1 and cache.misses == 1
+
+    def test_lru_eviction(self):
+        """Тест: при переполнении вытесняется давно не использованный ключ"""
+        cache = PriceCache(max_size=2, clock=FakeClock())
+        cache.set('btc', 1)
+        cache.set('eth', 2)
+        cache.get('btc')
+        cache.set('sol', 3)
+
+        assert cache.get('eth') is None
+        assert cache.get('btc') == 1
+        assert cache.evictions == 1
+
+    @pytest.mark.asyncio
+    async def test_serve_stale_while_refreshing(self):
+        """Тест: устаревшее значение отдается сразу, обновление идет в фоне"""
+        clock = FakeClock()
+        cache = PriceCache(ttl_seconds=60, stale_ttl_seconds=600, clock=clock)
+        cache.set('btc', 100.0)
+        clock.now = 120
+
+        async def loader(keys):
+            return {'btc': 200.0}
+
+        assert await cache.get_or_load(['btc'], loader) == {'btc': 100.0}
+        await asyncio.sleep(0)
+        assert cache.get('btc') == 200.0
+        assert cache.stale_hits == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_load_falls_back_to_stale(self):
+        """Тест: при ошибке загрузки отдается последнее известное значение"""
+        clock = FakeClock()
+        cache = PriceCache(ttl_seconds=60, serve_stale=False, clock=clock)
+        cache.set('btc', 100.0)
+        clock.now = 120
+
+        async def loader(keys):
+            return {}
+
+        assert await cache.get_or_load(['btc'], loader) == {'btc': 100.0}
+
+
+class TestCoinIndex:
+    """Тесты для in-memory справочника монет"""
+
+    def test_symbol_collision_prefers_ranked_coin(self):
+        """Тест: при совпадении тикеров выбирается монета с лучшим рейтингом"""
+        index = CoinIndex()
+        index.load([
+            {'symbol': 'eth', 'name': 'Bridged Ether', 'coingecko_id': 'bridged-eth'},
+            {'symbol': 'ETH', 'name': 'Ethereum', 'coingecko_id': 'ethereum', 'rank': 2},
+            {'symbol': 'eth', 'name': 'Other ETH', 'coingecko_id': 'other-eth', 'rank': 900},
+        ])
+
+        assert index.coingecko_id('ETH') == 'ethereum'
+        assert len(index) == 3
+
+    def test_resolve_name(self):
+        """Тест: поиск по названию, id и символу"""
+        index = CoinIndex()
+        index.load([{'symbol': 'btc', 'name': 'Bitcoin', 'coingecko_id': 'bitcoin', 'rank': 1}])
+
+        assert index.resolve_name('Bitcoin').coingecko_id == 'bitcoin'
+        assert index.resolve_name(' bitcoin ').coingecko_id == 'bitcoin'
+        assert index.resolve_name('BTC').coingecko_id == 'bitcoin'
+        assert index.resolve_name('unknown') is None
+
+    def test_add_discovered_coin(self):
+        """Тест: монета, найденная вне справочника, доступна до следующей загрузки"""
+        index = CoinIndex()
+        index.add(CoinDirectoryRecord(symbol='NEW', name='New Coin', coingecko_id='new-coin'))
+
+        assert index.coingecko_id('new') == 'new-coin'
+
+
+class TestTokenBucket:
+    """Тесты для лимитера запросов"""
+
+    @pytest.mark.asyncio
+    async def test_no_wait_while_tokens_available(self):
+        """Тест: пока есть токены, запросы не ждут"""
+        limiter = TokenBucket('test', requests_per_minute=600, burst=5)
+
+        for _ in range(5):
+            await limiter.acquire()
+
+        assert limiter.acquired == 5
+        assert limiter.waited == 0
+
+    @pytest.mark.asyncio
+    async def test_waits_when_bucket_is_empty(self):
+        """Тест: при пустом ведре запрос ждет пополнения"""
+        limiter = TokenBucket('test', requests_per_minute=6000, burst=1)
+
+        await limiter.acquire()
+        await limiter.acquire()
+
+        assert limiter.waited == 1
+        assert limiter.total_wait_seconds > 0
+
+    @pytest.mark.asyncio
+    async def test_monthly_budget(self):
+        """Тест: после исчерпания месячного бюджета запросы отклоняются"""
+        limiter = TokenBucket('test', requests_per_minute=600, burst=10, monthly_budget=3)
+
+        await limiter.acquire(2)
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire(2)
+        assert limiter.monthly_used == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_wait_not_charged(self):
+        """Тест: запрос, отмененный в ожидании токена, не списывает кредиты"""
+        limiter = TokenBucket('test', requests_per_minute=60, burst=1, monthly_budget=10)
+        await limiter.acquire()
+
+        waiting = asyncio.create_task(limiter.acquire(3))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+        assert limiter.monthly_used == 1
+
+
+class FakeProvider(MarketDataProvider):
+    """Провайдер с заданной задержкой и ответом"""
+
+    def __init__(self, name, delay, coins):
+        self.name = name
+        self.delay = delay
+        self.coins = coins
+        self.started = 0
+        self.cancelled = False
+
+    async def get_top_coins(self, limit=100):
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if isinstance(self.coins, Exception):
+            raise self.coins
+        return self.coins
+
+    async def get_growth_leaders(self, limit=20):
+        return await self.get_top_coins(limit)
+
+    async def get_current_prices(self, symbols, use_cache=True):
+        return {}
+
+
+class TestProviderRouter:
+    """Тесты для хеджированных запросов к провайдерам"""
+
+    @pytest.mark.asyncio
+    async def test_fast_primary_does_not_start_secondary(self):
+        """Тест: быстрый основной провайдер отвечает без хеджирования"""
+        primary = FakeProvider('primary', 0.01, [{'id': 'bitcoin'}])
+        secondary = FakeProvider('secondary', 0.01, [{'id': 'ethereum'}])
+        router = ProviderRouter([primary, secondary], timeout=1.0, min_hedge_delay=0.1)
+        router.latency['primary'].default_seconds = 0.1
+
+        result, name = await router.call('get_top_coins', 10)
+
+        assert name == 'primary'
+        assert result == [{'id': 'bitcoin'}]
+        assert secondary.started == 0
+        assert router.hedges == 0
+
+    @pytest.mark.asyncio
+    async def test_slow_primary_is_hedged_and_cancelled(self):
+        """Тест: основной провайдер дольше p90 - запускается резервный, основной отменяется"""
+        primary = FakeProvider('primary', 1.0, [{'id': 'bitcoin'}])
+        secondary = FakeProvider('secondary', 0.01, [{'id': 'ethereum'}])
+        router = ProviderRouter([primary, secondary], timeout=2.0, min_hedge_delay=0.01)
+        router.latency['primary'].default_seconds = 0.05
+
+        result, name = await router.call('get_top_coins', 10)
+        await asyncio.sleep(0)
+
+        assert name == 'secondary'
+        assert result == [{'id': 'ethereum'}]
+        assert router.hedges == 1
+        assert primary.cancelled
+
+    @pytest.mark.asyncio
+    async def test_failed_primary_falls_back_immediately(self):
+        """Тест: ошибка основного провайдера сразу переключает на резервный"""
+        primary = FakeProvider('primary', 0.0, RuntimeError('boom'))
+        secondary = FakeProvider('secondary', 0.01, [{'id': 'ethereum'}])
+        router = ProviderRouter([primary, secondary], timeout=1.0)
+        router.latency['primary'].default_seconds = 10.0
+
+        coins = await router.get_top_coins(10)
+
+        assert coins == [{'id': 'ethereum'}]
+        assert router.latency['primary'].failures == 1
+        assert router.hedges == 0
+
+    @pytest.mark.asyncio
+    async def test_all_providers_empty_returns_empty(self):
+        """Тест: пустые ответы всех провайдеров дают пустой результат"""
+        router = ProviderRouter([FakeProvider('a', 0.0, []), FakeProvider('b', 0.0, [])], timeout=1.0)
+
+        assert await router.get_growth_leaders(5) == []
+
+
+class TestCircuitBreaker:
+    """Тесты для выключателя провайдера"""
+
+    def make_breaker(self, clock, threshold=3):
+        return CircuitBreaker('test', failure_threshold=threshold, base_backoff_seconds=5,
+                              max_backoff_seconds=60, jitter=0.0, clock=clock)
+
+    def test_opens_after_threshold_and_rejects(self):
+        """Тест: серия ошибок размыкает выключатель, запросы сразу отклоняются"""
+        clock = FakeClock()
+        breaker = self.make_breaker(clock)
+
+        for _ in range(3):
+            breaker.before_request()
+            breaker.record_response(503)
+
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request()
+        assert breaker.rejected == 1
+
+    def test_429_honors_retry_after(self):
+        """Тест: 429 размыкает сразу на время из Retry-After"""
+        clock = FakeClock()
+        breaker = self.make_breaker(clock)
+
+        breaker.before_request()
+        breaker.record_response(429, '30')
+
+        assert breaker.state == OPEN
+        clock.now += 29
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request()
+        clock.now += 2
+        breaker.before_request()
+        assert breaker.state == HALF_OPEN
+
+    def test_half_open_allows_single_probe(self):
+        """Тест: после backoff пропускается одна проба; успех замыкает выключатель"""
+        clock = FakeClock()
+        breaker = self.make_breaker(clock, threshold=1)
+        breaker.before_request()
+        breaker.record_response(500)
+        clock.now += 5
+
+        breaker.before_request()
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request()
+        breaker.record_response(200)
+
+        assert breaker.state == CLOSED
+        breaker.before_request()
+
+    def test_failed_probe_doubles_backoff(self):
+        """Тест: неудачная проба размыкает снова с удвоенным backoff"""
+        clock = FakeClock()
+        breaker = self.make_breaker(clock, threshold=1)
+        breaker.before_request()
+        breaker.record_response(500)
+        clock.now += 5
+
+        breaker.before_request()
+        breaker.record_failure('TimeoutError')
+
+        assert breaker.state == OPEN
+        assert breaker.retry_in() == pytest.approx(10)
+
+    def test_parse_retry_after(self):
+        """Тест: Retry-After в секундах и в виде HTTP-даты"""
+        from datetime import datetime, timezone
+        now = datetime(2024, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+        assert parse_retry_after('15') == 15
+        assert parse_retry_after('Mon, 01 Jan 2024 12:01:00 GMT', now=now) == 60
+        assert parse_retry_after('garbage') is None
+        assert parse_retry_after(None) is None
+
+
+class TestBuiltinCoins:
+    """Тесты для запасного справочника крупнейших монет"""
+
+    def test_fallback_until_directory_loaded(self):
+        """Тест: до загрузки справочника топ монет разрешается встроенным списком"""
+        index = CoinIndex(fallback=BUILTIN_COINS)
+
+        assert not index.loaded
+        assert index.coingecko_id('BTC') == 'bitcoin'
+        assert index.cmc_id('eth') == 1027
+
+        index.load([{'symbol': 'btc', 'name': 'Bitcoin', 'coingecko_id': 'bitcoin', 'cmc_id': 1, 'rank': 1},
+                    {'symbol': 'new', 'name': 'New Coin', 'coingecko_id': 'new-coin'}])
+
+        assert index.loaded
+        assert index.coingecko_id('new') == 'new-coin'
+        assert index.coingecko_id('sol') == 'solana'
+
+    @pytest.mark.asyncio
+    async def test_no_search_before_directory_loaded(self, monkeypatch):
+        """Тест: пока справочник не загружен, неизвестные символы не ищутся через /search"""
+        monkeypatch.setattr(coin_gecko_api, 'coin_index', CoinIndex(fallback=BUILTIN_COINS))
+        api = coin_gecko_api.CoinGeckoAPI(session=object())
+        searched = []
+
+        async def fake_get_json(url, **kwargs):
+            searched.append(url)
+            return 200, {'coins': []}
+
+        monkeypatch.setattr(api, '_get_json', fake_get_json)
+
+        assert await api._resolve_symbols(['btc', 'unknown1', 'unknown2']) == {'btc': 'bitcoin'}
+        assert await api._resolve_name(object(), 'Unknown Coin') is None
+        assert searched == []
+
+
+class TestCoinGeckoSearch:
+    """Тесты для поиска монет вне справочника"""
+
+    @pytest.mark.asyncio
+    async def test_search_params_encoded_and_concurrent(self, monkeypatch):
+        """Тест: запрос передается параметром, неизвестные символы ищутся параллельно"""
+        index = CoinIndex()
+        index.load([{'symbol': 'btc', 'name': 'Bitcoin', 'coingecko_id': 'bitcoin', 'rank': 1}])
+        monkeypatch.setattr(coin_gecko_api, 'coin_index', index)
+        api = coin_gecko_api.CoinGeckoAPI(session=object())
+        calls = []
+        active = {'now': 0, 'max': 0}
+
+        async def fake_get_json(url, params=None, **kwargs):
+            calls.append((url, params))
+            active['now'] += 1
+            active['max'] = max(active['max'], active['now'])
+            await asyncio.sleep(0.01)
+            active['now'] -= 1
+            symbol = params['query']
+            return 200, {'coins': [{'id': f'{symbol}-id', 'symbol': symbol, 'name': symbol}]}
+
+        monkeypatch.setattr(api, '_get_json', fake_get_json)
+
+        resolved = await api._resolve_symbols(['btc', 'a&b', 'c d'])
+
+        assert resolved == {'btc': 'bitcoin', 'a&b': 'a&b-id', 'c d': 'c d-id'}
+        assert all(url.endswith('/search') for url, _ in calls)
+        assert sorted(params['query'] for _, params in calls) == ['a&b', 'c d']
+        assert active['max'] == 2
+
+
+class TestCoinGeckoPricesBatch:
+    """Тесты для пакетного получения цен по названиям"""
+
+    @pytest.mark.asyncio
+    async def test_names_resolved_locally_and_fetched_in_one_call(self, monkeypatch):
+        """Тест: названия ищутся в справочнике, цены - одним запросом, повторы не дублируются"""
+        index = CoinIndex()
+        index.load([
+            {'symbol': 'btc', 'name': 'Bitcoin', 'coingecko_id': 'bitcoin', 'rank': 1},
+            {'symbol': 'eth', 'name': 'Ethereum', 'coingecko_id': 'ethereum', 'rank': 2},
+        ])
+        cache = PriceCache(max_size=10, ttl_seconds=60, stale_ttl_seconds=600)
+        monkeypatch.setattr(coin_gecko_api, 'coin_index', index)
+        monkeypatch.setattr(coin_gecko_api, 'price_cache', cache)
+
+        api = coin_gecko_api.CoinGeckoAPI(session=object())
+        calls = []
+
+        async def fake_simple_prices(coin_ids, session=None):
+            calls.append(coin_ids)
+            return {'bitcoin': 50000, 'ethereum': 3000}
+
+        monkeypatch.setattr(api, '_fetch_simple_prices', fake_simple_prices)
+
+        prices = await api.get_prices_batch(['bitcoin', 'Bitcoin', 'ethereum'])
+
+        assert calls == [['bitcoin', 'ethereum']]
+        assert prices['bitcoin'] == prices['Bitcoin'] == 50000
+        assert prices['ethereum'] == 3000
+        assert cache.get(price_key('coingecko', 'bitcoin')) == 50000
+
+        # Повторный запрос обслуживается из кэша цен
+        await api.get_prices_batch(['ethereum'])
+        assert len(calls) == 1
+
+
+    @pytest.mark.asyncio
+    async def test_shared_ticker_does_not_share_price(self, monkeypatch):
+        """Тест: монеты с одним тикером кэшируются по id и не получают цену друг друга"""
+        index = CoinIndex()
+        index.load([
+            {'symbol': 'uni', 'name': 'Uniswap', 'coingecko_id': 'uniswap', 'rank': 20},
+            {'symbol': 'uni', 'name': 'Universe', 'coingecko_id': 'universe-token', 'rank': 3000},
+        ])
+        cache = PriceCache(max_size=10, ttl_seconds=60, stale_ttl_seconds=600)
+        monkeypatch.setattr(coin_gecko_api, 'coin_index', index)
+        monkeypatch.setattr(coin_gecko_api, 'price_cache', cache)
+
+        api = coin_gecko_api.CoinGeckoAPI(session=object())
+
+        async def fake_simple_prices(coin_ids, session=None):
+            return {'uniswap': 7.5, 'universe-token': 0.01}
+
+        monkeypatch.setattr(api, '_fetch_simple_prices', fake_simple_prices)
+
+        assert await api.get_current_prices(['UNI']) == {'uni': 7.5}
+        prices = await api.get_prices_batch(['Universe'])
+
+        assert prices['Universe'] == Decimal('0.01')
+        assert cache.get(price_key('coingecko', 'uniswap')) == 7.5
+        assert cache.get(price_key('coingecko', 'universe-token')) == 0.01
+
+
+MARKET_FIELDS = (
+    'id', 'symbol', 'name', 'current_price', 'market_cap', 'market_cap_rank',
+    'price_change_percentage_24h', 'image', 'total_volume',
+)
+
+
+class TestMarketRecords:
+    """Тесты для разбора больших ответов рыночных данных"""
+
+    def test_loads_without_orjson(self, monkeypatch):
+        """Тест: без orjson ответ разбирается стандартным json"""
+        monkeypatch.setattr(json_codec, 'orjson', None)
+
+        assert loads(b'{"bitcoin": {"usd": 50000}}') == {'bitcoin': {'usd': 50000}}
+
+    def test_coingecko_markets_projected_to_market_fields(self):
+        """Тест: из /coins/markets остаются только нужные поля, неполные монеты пропускаются"""
+        payload = b"""[
+            {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin", "current_price": 50000,
+             "market_cap": 1, "market_cap_rank": 1, "price_change_percentage_24h": 2.5,
+             "image": "img", "total_volume": 10, "ath": 69000, "roi": null},
+            {"id": "broken", "symbol": "brk"}
+        ]"""
+
+        records = project_records(loads(payload), coin_gecko_api.CoinGeckoAPI._market_record)
+
+        assert len(records) == 1
+        assert tuple(records[0]) == MARKET_FIELDS
+        assert records[0]['symbol'] == 'BTC'
+
+    def test_cmc_listing_projection_respects_limit(self):
+        """Тест: записи CoinMarketCap сводятся к тем же полям с учетом лимита"""
+        coins = [
+            {'id': i, 'slug': f'coin-{i}', 'symbol': f'C{i}', 'name': f'Coin {i}', 'cmc_rank': i,
+             'quote': {'USD': {'price': 1.0, 'market_cap': 2.0, 'percent_change_24h': i, 'volume_24h': 3.0}}}
+            for i in range(1, 6)
+        ]
+
+        records = project_records(coins, CoinMarketCapAPI._market_record, limit=2)
+
+        assert [record['id'] for record in records] == ['coin-1', 'coin-2']
+        assert tuple(records[0]) == MARKET_FIELDS
+
+
+class TestFakeMarketServer:
+    """Тесты клиентов провайдеров против локального фейкового сервера"""
+
+    @staticmethod
+    def isolate(api):
+        """Отдельные лимитер и выключатель, чтобы не трогать общие на процесс"""
+        api.rate_limiter = TokenBucket(api.name, 6000)
+        api.circuit_breaker = CircuitBreaker(api.name, failure_threshold=1, jitter=0.0)
+        return api
+
+    @pytest.mark.asyncio
+    async def test_clients_read_fixtures(self, monkeypatch):
+        """Тест: оба клиента получают топ монет и цены с фейкового сервера"""
+        from infrastructure.external_apis import coinmarketcap_api
+        # id фейкового сервера не совпадают со встроенным справочником
+        monkeypatch.setattr(coinmarketcap_api, 'coin_index', CoinIndex())
+        server = TestServer(create_app(FakeMarketConfig(coins=300)))
+        await server.start_server()
+        try:
+            async with aiohttp.ClientSession(headers={'X-CMC_PRO_API_KEY': 'test'}) as session:
+                gecko = self.isolate(coin_gecko_api.CoinGeckoAPI(session))
+                gecko.base_url = str(server.make_url('/api/v3'))
+                cmc = self.isolate(CoinMarketCapAPI('test', session))
+                cmc.base_url = str(server.make_url('/v1'))
+
+                gecko_top = await gecko.get_top_coins(250)
+                cmc_top = await cmc.get_top_coins(250)
+                cmc_prices = await cmc.get_current_prices(['BTC', 'ETH'], use_cache=False)
+
+            assert len(gecko_top) == len(cmc_top) == 250
+            assert gecko_top[0]['id'] == cmc_top[0]['id'] == 'bitcoin'
+            assert cmc_prices == {'btc': 112000.0, 'eth': 4600.0}
+        finally:
+            await server.close()
+
+    @pytest.mark.asyncio
+    async def test_cmc_prices_by_directory_id(self, monkeypatch):
+        """Тест: символы из справочника запрашиваются и кэшируются по id CoinMarketCap"""
+        from infrastructure.external_apis import coinmarketcap_api
+        index = CoinIndex()
+        index.load([{'symbol': 'btc', 'name': 'Bitcoin', 'coingecko_id': 'bitcoin', 'cmc_id': 1, 'rank': 1}])
+        cache = PriceCache(max_size=10)
+        monkeypatch.setattr(coinmarketcap_api, 'coin_index', index)
+        monkeypatch.setattr(coinmarketcap_api, 'price_cache', cache)
+
+        app = create_app(FakeMarketConfig(coins=300))
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            async with aiohttp.ClientSession(headers={'X-CMC_PRO_API_KEY': 'test'}) as session:
+                cmc = self.isolate(CoinMarketCapAPI('test', session))
+                cmc.base_url = str(server.make_url('/v1'))
+
+                prices = await cmc.get_current_prices(['BTC', 'ETH'])
+                again = await cmc.get_current_prices(['BTC'])
+
+            assert prices == {'btc': 112000.0, 'eth': 4600.0}
+            assert again == {'btc': 112000.0}
+            assert cache.get(price_key('coinmarketcap', 1)) == 112000.0
+            # ETH нет в справочнике: запрошен по символу, цена сохранена под id из ответа
+            assert cache.get(price_key('coinmarketcap', 2)) == 4600.0
+            assert app[SERVER_KEY].requests['/v1/cryptocurrency/quotes/latest'] == 2
+        finally:
+            await server.close()
+
+    @pytest.mark.asyncio
+    async def test_429_opens_breaker(self):
+        """Тест: 429 от сервера размыкает выключатель с учетом Retry-After"""
+        app = create_app(FakeMarketConfig(rate_limit_rate=1.0, retry_after_seconds=30))
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            async with aiohttp.ClientSession() as session:
+                gecko = self.isolate(coin_gecko_api.CoinGeckoAPI(session))
+                gecko.base_url = str(server.make_url('/api/v3'))
+
+                assert await gecko.get_top_coins(10) == []
+                assert await gecko.get_top_coins(10) == []
+
+            assert gecko.circuit_breaker.state == OPEN
+            assert gecko.circuit_breaker.retry_in() > 29
+            # Второй запрос не дошел до сервера
+            assert app[SERVER_KEY].requests['/api/v3/coins/markets'] == 1
+        finally:
+            await server.close()
+
+    @pytest.mark.asyncio
+    async def test_conditional_get_reuses_cached_body(self, monkeypatch):
+        """Тест: устаревший ответ проверяется через If-None-Match, свежий - без запроса"""
+        cache = HTTPResponseCache()
+        monkeypatch.setattr('infrastructure.external_apis.base.http_response_cache', cache)
+        app = create_app(FakeMarketConfig(coins=50, cache_max_age=0))
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            async with aiohttp.ClientSession() as session:
+                gecko = self.isolate(coin_gecko_api.CoinGeckoAPI(session))
+                gecko.base_url = str(server.make_url('/api/v3'))
+
+                first = await gecko.get_top_coins(10)
+                second = await gecko.get_top_coins(10)
+                assert first == second
+                assert dict(app[SERVER_KEY].statuses) == {200: 1, 304: 1}
+
+                app[SERVER_KEY].config.cache_max_age = 60
+                cache.clear()
+                await gecko.get_top_coins(10)
+                await gecko.get_top_coins(10)
+
+            assert app[SERVER_KEY].requests['/api/v3/coins/markets'] == 3
+            assert cache.stats()['revalidated'] == 1
+            assert cache.stats()['hits'] == 1
+        finally:
+            await server.close()
+
+
+    @pytest.mark.asyncio
+    async def test_exchange_rates_build_fx_matrix(self):
+        """Тест: один запрос /exchange_rates дает курсы всех валют котировки"""
+        server = TestServer(create_app(FakeMarketConfig(coins=20)))
+        await server.start_server()
+        try:
+            async with aiohttp.ClientSession() as session:
+                gecko = self.isolate(coin_gecko_api.CoinGeckoAPI(session))
+                gecko.base_url = str(server.make_url('/api/v3'))
+                rates = FXRates(['usd', 'eur', 'rub', 'btc', 'eth'])
+
+                assert rates.set_btc_rates(await gecko.get_exchange_rates()) == 5
+
+            assert rates.convert(Decimal('100'), 'eur') == Decimal('92.00')
+            assert rates.convert(112000.0, 'btc') == pytest.approx(1.0)
+            assert rates.convert(4600.0, 'eth') == pytest.approx(1.0)
+        finally:
+            await server.close()
+
+
+class TestHTTPResponseCache:
+    """Тесты для HTTP-кэша ответов"""
+
+    def test_max_age_and_no_store(self):
+        """Тест: max-age определяет свежесть, no-store не кэшируется"""
+        clock = FakeClock()
+        cache = HTTPResponseCache(clock=clock)
+
+        cache.store('a', b'[1]', {'Cache-Control': 'public, max-age=30', 'Age': '10'})
+        cache.store('b', b'[2]', {'Cache-Control': 'no-store', 'ETag': '"x"'})
+
+        assert cache.lookup('a').body == b'[1]'
+        assert cache.get('b') is None
+        clock.now += 21
+        assert cache.lookup('a') is None
+
+    def test_validators_kept_for_revalidation(self):
+        """Тест: ответ без max-age, но с ETag хранится для условного запроса"""
+        clock = FakeClock()
+        cache = HTTPResponseCache(clock=clock)
+
+        entry = cache.store('a', b'{"x": 1}', {'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+
+        assert cache.lookup('a') is None
+        assert cache.conditional_headers(entry) == {
+            'If-None-Match': '"v1"',
+            'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT',
+        }
+        cache.revalidate('a', entry, {'Cache-Control': 'max-age=5'})
+        assert loads(cache.lookup('a').body) == {'x': 1}
+        assert cache.stats()['bytes_saved'] == 16
+
+    def test_bounded_by_bytes(self):
+        """Тест: размер кэша ограничен суммой байт тел, вытесняются старые ответы"""
+        cache = HTTPResponseCache(max_bytes=100, clock=FakeClock())
+        headers = {'Cache-Control': 'max-age=60'}
+
+        cache.store('a', b'x' * 40, headers)
+        cache.store('b', b'x' * 40, headers)
+        cache.lookup('a')
+        cache.store('c', b'x' * 40, headers)
+        cache.store('huge', b'x' * 101, headers)
+
+        assert cache.get('b') is None
+        assert cache.get('a') is not None and cache.get('c') is not None
+        assert cache.get('huge') is None
+        assert cache.stats()['bytes'] == 80
+        assert cache.stats()['evictions'] == 1
+
+
+class TestFXRates:
+    """Тесты для матрицы курсов валют котировки"""
+
+    def test_convert_and_errors(self):
+        """Тест: пересчет без запросов, неизвестная и еще не загруженная валюта"""
+        rates = FXRates(['eur', 'rub'])
+
+        assert rates.currencies == ['usd', 'eur', 'rub']
+        assert rates.convert(Decimal('10'), 'USD') == Decimal('10')
+        with pytest.raises(FXRatesUnavailableError):
+            rates.convert(10.0, 'eur')
+        with pytest.raises(UnsupportedCurrencyError):
+            rates.rate('jpy')
+
+        rates.set_btc_rates({'usd': 100000.0, 'eur': 92000.0, 'rub': 8150000.0})
+
+        assert rates.convert(Decimal('10'), 'rub') == Decimal('815.0')
+        assert rates.format(Decimal('10'), 'eur') == '€9.20'
+
+    def test_convert_market_record(self):
+        """Тест: пересчитываются цена, капитализация и объем, процент изменения - нет"""
+        rates = FXRates(['eur'])
+        rates.set_btc_rates({'usd': 100.0, 'eur': 50.0})
+        coin = {'id': 'bitcoin', 'current_price': 10.0, 'market_cap': 1000.0,
+                'total_volume': None, 'price_change_percentage_24h': 2.5}
+
+        converted = rates.convert_market_record(coin, 'eur')
+
+        assert converted == {'id': 'bitcoin', 'current_price': 5.0, 'market_cap': 500.0,
+                             'total_volume': None, 'price_change_percentage_24h': 2.5}
+        assert coin['current_price'] == 10.0
@@ -0,0 +1,158 @@
+import asyncpg
+import pytest
+from datetime import datetime
+
+from infrastructure.database.migrations.runner import (
+    Migration, MigrationRunner, concurrent_index, pending_migrations, validate_migrations,
+)
+from infrastructure.database.migrations.versions import MIGRATIONS
+
+
+class FakeTransaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def __aenter__(self):
+        self.conn.log.append("BEGIN")
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.conn.log.append("ROLLBACK" if exc_type else "COMMIT")
+
+
+class FakeConnection:
+    """Соединение asyncpg, которое запоминает выполненный SQL"""
+
+    def __init__(self, applied=(), index_validity=None):
+        self.applied = list(applied)
+        self.index_validity = dict(index_validity or {})
+        self.log = []
+
+    async def execute(self, sql, *args):
+        sql = " ".join(sql.split())
+        self.log.append(sql)
+        if sql.startswith("INSERT INTO schema_migrations"):
+            self.applied.append(args[0])
+        if sql.startswith("DROP INDEX CONCURRENTLY"):
+            self.index_validity.pop(sql.split()[-1], None)
+
+    async def fetch(self, sql, *args):
+        return [{"version": version, "applied_at": datetime(2025, 1, 1)} for version in self.applied]
+
+    async def fetchval(self, sql, *args):
+        return self.index_validity.get(args[0])
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+
+class TestMigrationList:
+    """Тесты для списка миграций"""
+
+    def test_registered_migrations_are_valid(self):
+        """Тест: версии возрастают, индексы горячих путей строятся CONCURRENTLY"""
+        validate_migrations(MIGRATIONS)
+        concurrent = {name for migration in MIGRATIONS for name in migration.indexes}
+        assert {"ix_coin_transactions_user_timestamp", "uq_user_portfolio_user_symbol"} <= concurrent
+        assert all(not migration.transactional for migration in MIGRATIONS if migration.indexes)
+
+    def test_rejects_unordered_versions(self):
+        """Тест: повтор или убывание версии - ошибка"""
+        with pytest.raises(ValueError):
+            validate_migrations([Migration(2, "b", ("SELECT 1",)), Migration(2, "c", ("SELECT 1",))])
+
+    def test_rejects_concurrently_in_transaction(self):
+        """Тест: CONCURRENTLY в транзакционной миграции - ошибка"""
+        with pytest.raises(ValueError):
+            validate_migrations([Migration(1, "a", ("CREATE INDEX CONCURRENTLY ix ON t (c)",))])
+
+    def test_pending_respects_target(self):
+        """Тест: примененные версии пропускаются, target ограничивает сверху"""
+        migrations = [Migration(version, str(version), ("SELECT 1",)) for version in (1, 2, 3, 4)]
+        assert [m.version for m in pending_migrations(migrations, {1, 3}, target=3)] == [2]
+
+
+class TestMigrationRunner:
+    """Тесты для применения миграций"""
+
+    @pytest.mark.asyncio
+    async def test_transactional_and_concurrent(self):
+        """Тест: обычная миграция и запись версии - одна транзакция, индекс - вне транзакции"""
+        conn = FakeConnection(applied=[1])
+        migrations = [
+            Migration(1, "baseline", ("CREATE TABLE t (c INT)",)),
+            Migration(2, "column", ("ALTER TABLE t ADD COLUMN d INT",)),
+            concurrent_index(3, "index", "ix_t_c", "t", "c"),
+        ]
+
+        applied = await MigrationRunner(conn, migrations).upgrade()
+
+        assert [m.version for m in applied] == [2, 3]
+        assert conn.applied == [1, 2, 3]
+        log = conn.log
+        assert log[0].startswith("SELECT pg_advisory_lock")
+        assert log[-1].startswith("SELECT pg_advisory_unlock")
+        begin = log.index("BEGIN")
+        assert log[begin + 1] == "ALTER TABLE t ADD COLUMN d INT"
+        assert log[begin + 2].startswith("INSERT INTO schema_migrations")
+        assert log[begin + 3] == "COMMIT"
+        assert log.index("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_t_c ON t (c)") > begin + 3
+        assert "CREATE TABLE t (c INT)" not in log
+
+    @pytest.mark.asyncio
+    async def test_invalid_index_rebuilt(self):
+        """Тест: невалидный остаток прерванного построения удаляется перед повтором"""
+        conn = FakeConnection(index_validity={"ix_t_c": False})
+
+        await MigrationRunner(conn, [concurrent_index(1, "index", "ix_t_c", "t", "c")]).upgrade()
+
+        drop = conn.log.index("DROP INDEX CONCURRENTLY IF EXISTS ix_t_c")
+        assert conn.log.index("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_t_c ON t (c)") > drop
+        assert conn.applied == [1]
+
+    @pytest.mark.asyncio
+    async def test_unique_violation_merges_again(self):
+        """Тест: дубликат, появившийся во время построения UNIQUE индекса, сливается и индекс строится заново"""
+        conn = FakeConnection()
+        execute = conn.execute
+        failures = [asyncpg.exceptions.UniqueViolationError("duplicate key")]
+
+        async def racing_execute(sql, *args):
+            await execute(sql, *args)
+            if sql.startswith("CREATE UNIQUE INDEX") and failures:
+                conn.index_validity["uq_t_c"] = False
+                raise failures.pop()
+
+        conn.execute = racing_execute
+        migration = concurrent_index(1, "unique", "uq_t_c", "t", "c", unique=True, prepare=("DELETE FROM t",))
+
+        await MigrationRunner(conn, [migration]).upgrade()
+
+        build = "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_t_c ON t (c)"
+        assert conn.log.count(build) == 2
+        assert conn.log.count("DELETE FROM t") == 2
+        second_build = len(conn.log) - 1 - conn.log[::-1].index(build)
+        assert conn.log.index("DROP INDEX CONCURRENTLY IF EXISTS uq_t_c") < second_build
+        assert conn.applied == [1]
+
+    def test_position_index_merges_before_build(self):
+        """Тест: UNIQUE индекс позиций сливает дубликаты перед каждой попыткой"""
+        migration = next(m for m in MIGRATIONS if "uq_user_portfolio_user_symbol" in m.indexes)
+        assert any("DELETE FROM user_portfolio" in sql for sql in migration.prepare)
+
+    @pytest.mark.asyncio
+    async def test_failed_migration_not_recorded(self):
+        """Тест: упавшая миграция откатывается, версия не записывается, lock снимается"""
+        conn = FakeConnection()
+
+        async def failing_execute(sql, *args):
+            conn.log.append(" ".join(sql.split()))
+            if sql.startswith("BROKEN"):
+                raise RuntimeError("syntax error")
+
+        conn.execute = failing_execute
+        with pytest.raises(RuntimeError):
+            await MigrationRunner(conn, [Migration(1, "broken", ("BROKEN",))]).upgrade()
+
+        assert "ROLLBACK" in conn.log
+        assert conn.applied == []
+        assert conn.log[-1].startswith("SELECT pg_advisory_unlock")
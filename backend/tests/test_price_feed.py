@@ -0,0 +1,170 @@
+import asyncio
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from decimal import Decimal
+from datetime import datetime
+
+from domain.entities.user import CoinPrice
+from infrastructure.price_feed.base import IteratorFeed, PriceTick, normalize_tick
+from infrastructure.price_feed.ingest import PriceFeedIngestor
+from infrastructure.price_feed.price_table import LivePriceTable
+from infrastructure.price_feed.replay import ReplayFeed, load_ticks, save_ticks
+from infrastructure.price_feed.repository import LivePriceRepository
+from infrastructure.price_feed.websocket import WebSocketFeed
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakePriceRepository:
+    def __init__(self, prices):
+        self.prices = prices
+        self.requested = []
+
+    async def get_prices(self, symbols):
+        self.requested.extend(symbols)
+        return {symbol.lower(): self.prices[symbol.lower()] for symbol in symbols if symbol.lower() in self.prices}
+
+    async def upsert_prices(self, prices, source):
+        return len(prices)
+
+
+class TestNormalizeTick:
+    """Тесты для приведения сообщений источников к PriceTick"""
+
+    def test_exchange_message(self):
+        """Тест: символ с котировкой и время в миллисекундах"""
+        tick = normalize_tick({"s": "BTCUSDT", "p": "112000.5", "t": 1760000000123}, "binance")
+
+        assert tick == PriceTick("btc", 112000.5, 1760000000.123, "binance")
+
+    def test_invalid_messages(self):
+        """Тест: служебные сообщения и некорректные цены пропускаются"""
+        assert normalize_tick({"result": None, "id": 1}) is None
+        assert normalize_tick({"symbol": "btc", "price": "n/a"}) is None
+        assert normalize_tick({"symbol": "btc", "price": 0}) is None
+        assert normalize_tick("ping") is None
+
+
+class TestLivePriceTable:
+    """Тесты для общей таблицы живых цен"""
+
+    def test_out_of_order_and_max_age(self):
+        """Тест: более старый тик не перезаписывает цену, устаревшая цена не отдается"""
+        clock = FakeClock(1000.0)
+        table = LivePriceTable(clock=clock)
+
+        assert table.update(PriceTick("btc", 100.0, 990.0))
+        assert not table.update(PriceTick("btc", 90.0, 980.0))
+        assert table.get("BTC").price == 100.0
+        assert table.get("btc", max_age=5) is None
+        assert table.get("btc", max_age=15).price == 100.0
+        assert table.stats()["out_of_order"] == 1
+
+    @pytest.mark.asyncio
+    async def test_fan_out_drops_oldest_for_slow_subscriber(self):
+        """Тест: подписчики получают свои символы, медленный теряет самые старые тики"""
+        table = LivePriceTable()
+        all_symbols = table.subscribe(maxsize=2)
+        eth_only = table.subscribe(["ETH"])
+
+        for ts, (symbol, price) in enumerate([("btc", 1.0), ("eth", 2.0), ("btc", 3.0)]):
+            table.update(PriceTick(symbol, price, float(ts)))
+        all_symbols.close()
+        eth_only.close()
+
+        assert [tick.price async for tick in all_symbols] == [3.0]
+        assert [tick.price async for tick in eth_only] == [2.0]
+        assert all_symbols.dropped == 2
+        assert table.stats()["subscribers"] == 0
+
+
+class TestReplayFeed:
+    """Тесты для воспроизведения записи потока цен"""
+
+    @pytest.mark.asyncio
+    async def test_replay_recorded_file(self, tmp_path):
+        """Тест: запись воспроизводится по порядку времени, тики получают текущее время"""
+        path = tmp_path / "ticks.ndjson"
+        save_ticks(str(path), [PriceTick("eth", 4600.0, 20.0), PriceTick("btc", 112000.0, 10.0)])
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("not json\n")
+
+        assert len(load_ticks(str(path))) == 2
+
+        feed = ReplayFeed(str(path), speed=0)
+        ticks = [tick async for tick in feed.ticks()]
+
+        assert [tick.symbol for tick in ticks] == ["btc", "eth"]
+        assert all(tick.ts > 1e9 for tick in ticks)
+
+    @pytest.mark.asyncio
+    async def test_ingestor_fills_table(self):
+        """Тест: любой асинхронный итератор сообщений попадает в таблицу цен"""
+        async def messages():
+            yield {"symbol": "btc", "price": 1.0, "ts": 1}
+            yield {"event": "heartbeat"}
+            yield {"symbol": "btc", "price": 2.0, "ts": 2}
+
+        table = LivePriceTable()
+        ingestor = PriceFeedIngestor(IteratorFeed(messages()), table, update_price_cache=False)
+
+        assert await ingestor.run_once() == 2
+        assert table.get("btc").price == 2.0
+
+
+class TestWebSocketFeed:
+    """Тесты для WebSocket-источника цен"""
+
+    @pytest.mark.asyncio
+    async def test_ticks_from_websocket(self):
+        """Тест: сообщения-массивы и обертки {"data": ...} разворачиваются в тики"""
+        async def handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            await ws.receive_str()  # Сообщение подписки
+            await ws.send_json({"data": [{"s": "BTCUSDT", "c": "112000", "t": 1760000000000}]})
+            await ws.send_json([{"symbol": "eth", "price": 4600, "ts": 1760000001}])
+            await ws.close()
+            return ws
+
+        app = web.Application()
+        app.router.add_get("/ws", handler)
+        async with TestServer(app) as server:
+            feed = WebSocketFeed(str(server.make_url("/ws")), subscribe_message={"method": "SUBSCRIBE"})
+            stream = feed.ticks()
+            ticks = [await asyncio.wait_for(stream.__anext__(), 5) for _ in range(2)]
+            await stream.aclose()
+
+        assert [(tick.symbol, tick.price) for tick in ticks] == [("btc", 112000.0), ("eth", 4600.0)]
+
+
+class TestLivePriceRepository:
+    """Тесты для наложения живых цен на таблицу coin_prices"""
+
+    @pytest.mark.asyncio
+    async def test_live_prices_override_stored(self):
+        """Тест: свежие живые цены важнее сохраненных, остальные берутся из БД"""
+        clock = FakeClock(1760000000.0)
+        table = LivePriceTable(clock=clock)
+        table.update(PriceTick("btc", 112000.0, 1759999990.0, "binance"))
+        table.update(PriceTick("eth", 4600.0, 1759999000.0, "binance"))
+        stored = FakePriceRepository({
+            "eth": CoinPrice(symbol="eth", price="4500", source="coingecko", last_updated=datetime(2025, 10, 9)),
+            "btc": CoinPrice(symbol="btc", price="100000", source="coingecko", last_updated=datetime(2025, 10, 9)),
+        })
+
+        repo = LivePriceRepository(stored, table, max_age_seconds=60)
+        prices = await repo.get_prices(["BTC", "ETH"])
+
+        assert prices["btc"].price == Decimal("112000.0")
+        assert prices["btc"].source == "binance"
+        assert prices["btc"].last_updated == datetime.utcfromtimestamp(1759999990.0)
+        assert prices["eth"].price == Decimal("4500")
+        assert stored.requested == ["ETH"]
@@ -0,0 +1,64 @@
+import gzip
+import json
+import pytest
+from datetime import datetime
+from decimal import Decimal
+
+from domain.entities.user import CoinTransaction, TransactionType
+from presentation.web_api.transaction_export import encode_transactions, gzip_chunks
+
+
+def make_transactions(count):
+    for index in range(1, count + 1):
+        yield CoinTransaction(
+            id=index, user_id=1, symbol='BTC', name='Bitcoin', quantity=Decimal('0.5'),
+            price=Decimal('100'), total_spent=Decimal('50'),
+            transaction_type=TransactionType.SELL if index % 2 else TransactionType.BUY,
+            timestamp=datetime(2025, 1, 1, 12, 0, index),
+        )
+
+
+async def stream(count):
+    for tx in make_transactions(count):
+        yield tx
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+class TestTransactionExport:
+    """Тесты для потоковой выгрузки транзакций"""
+
+    @pytest.mark.asyncio
+    async def test_csv_chunks_with_single_header(self):
+        """Тест: CSV идет чанками, заголовок только в первом"""
+        chunks = await collect(encode_transactions(stream(5), "csv", rows_per_chunk=2))
+
+        assert len(chunks) == 3
+        lines = b"".join(chunks).decode().splitlines()
+        assert lines[0].startswith("id,user_id,symbol")
+        assert len(lines) == 6
+        assert lines[1] == "1,1,BTC,Bitcoin,0.5,100,50,SELL,2025-01-01T12:00:01"
+
+    @pytest.mark.asyncio
+    async def test_empty_csv_has_header(self):
+        """Тест: пустая история - CSV из одного заголовка"""
+        chunks = await collect(encode_transactions(stream(0), "csv"))
+        assert b"".join(chunks).decode().strip() == "id,user_id,symbol,name,quantity,price,total_spent,transaction_type,timestamp"
+
+    @pytest.mark.asyncio
+    async def test_ndjson_gzip(self):
+        """Тест: NDJSON сжимается на лету в корректный gzip"""
+        chunks = await collect(gzip_chunks(encode_transactions(stream(3), "ndjson", rows_per_chunk=1)))
+
+        rows = [json.loads(line) for line in gzip.decompress(b"".join(chunks)).decode().splitlines()]
+        assert [row["id"] for row in rows] == [1, 2, 3]
+        assert rows[1]["transaction_type"] == "BUY"
+        assert rows[0]["quantity"] == "0.5"
+
+    @pytest.mark.asyncio
+    async def test_unknown_format(self):
+        """Тест: неизвестный формат - ValueError"""
+        with pytest.raises(ValueError):
+            await collect(encode_transactions(stream(1), "xml"))
@@ -0,0 +1,360 @@
+import pytest
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+
+from domain.entities.user import User, UserPortfolio, CoinPrice
+from domain.repositories.unit_of_work import UnitOfWork
+from domain.use_cases.portfolio_use_cases import (
+    GetUserPortfolioUseCase, AddCoinToPortfolioUseCase, SellCoinFromPortfolioUseCase,
+    TakePortfolioSnapshotsUseCase
+)
+
+
+class FakeUserRepository:
+    def __init__(self, users):
+        self.users = {user.telegram_id: user for user in users}
+
+    async def get_by_telegram_id(self, telegram_id):
+        return self.users.get(telegram_id)
+
+    async def create(self, user):
+        user.id = len(self.users) + 1
+        self.users[user.telegram_id] = user
+        return user
+
+
+class FakePortfolioRepository:
+    def __init__(self, items):
+        self.items = items
+        self.updated = []
+        self.bulk_updates = 0
+
+    async def get_user_portfolio(self, user_id):
+        return [item for item in self.items if item.user_id == user_id]
+
+    async def update_portfolio_item(self, item):
+        self.updated.append(item)
+        return item
+
+    async def update_current_prices(self, items):
+        self.bulk_updates += 1
+        self.updated.extend(items)
+        return len(items)
+
+    async def get_held_symbols(self):
+        return sorted({item.symbol.lower() for item in self.items})
+
+    async def stream_positions(self, batch_size=1000):
+        for item in sorted(self.items, key=lambda item: item.user_id):
+            yield item
+
+    def _find(self, user_id, symbol):
+        return next((item for item in self.items if item.user_id == user_id and item.symbol == symbol), None)
+
+    async def apply_buy(self, user_id, symbol, name, quantity, price):
+        item = self._find(user_id, symbol)
+        if item is None:
+            item = UserPortfolio(id=len(self.items) + 1, user_id=user_id, symbol=symbol, name=name,
+                                 total_quantity=Decimal('0'), avg_price=price, total_spent=Decimal('0'))
+            self.items.append(item)
+        new_quantity = item.total_quantity + quantity
+        item.avg_price = (item.avg_price * item.total_quantity + price * quantity) / new_quantity
+        item.total_quantity = new_quantity
+        item.total_spent += price * quantity
+        return item
+
+    async def apply_sell(self, user_id, symbol, quantity):
+        item = self._find(user_id, symbol)
+        if item is None or item.total_quantity < quantity:
+            return None
+        item.total_quantity -= quantity
+        item.total_spent -= item.avg_price * quantity
+        if item.total_quantity == 0:
+            self.items.remove(item)
+        return item
+
+
+class FakePriceRepository:
+    def __init__(self, prices):
+        self.prices = prices
+        self.reads = 0
+
+    async def get_prices(self, symbols):
+        self.reads += 1
+        return {symbol.lower(): self.prices[symbol.lower()] for symbol in symbols if symbol.lower() in self.prices}
+
+
+class FakeUnitOfWork(UnitOfWork):
+    """Единица работы в памяти: изменения видны только после commit"""
+
+    def __init__(self, users=(), items=()):
+        self.committed_users = {user.telegram_id: user for user in users}
+        self.committed_items = list(items)
+        self.committed_transactions = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.fail_on_transaction = False
+
+    async def __aenter__(self):
+        self.users = FakeUserRepository(list(self.committed_users.values()))
+        self.portfolio = FakePortfolioRepository([UserPortfolio(**vars(item)) for item in self.committed_items])
+        self.transactions = self
+        self.pending_transactions = []
+        return self
+
+    async def create_transaction(self, transaction):
+        if self.fail_on_transaction:
+            raise RuntimeError("connection lost")
+        self.pending_transactions.append(transaction)
+        return transaction
+
+    async def commit(self):
+        self.commits += 1
+        self.committed_users = dict(self.users.users)
+        self.committed_items = self.portfolio.items
+        self.committed_transactions.extend(self.pending_transactions)
+        self.pending_transactions = []
+
+    async def rollback(self):
+        self.rollbacks += 1
+        self.pending_transactions = []
+
+
+class FakeSnapshotRepository:
+    def __init__(self, dates_by_user=None):
+        self.batches = []
+        self.dates_by_user = dates_by_user or {}
+
+    async def get_user_ids(self, since, until):
+        return [user_id for user_id, dates in self.dates_by_user.items()
+                if any(since <= snapshot_date <= until for snapshot_date in dates)]
+
+    async def upsert_snapshots(self, snapshots):
+        self.batches.append(list(snapshots))
+        return len(snapshots)
+
+
+def make_item(symbol, current_price='0', last_updated=None, user_id=1):
+    return UserPortfolio(
+        id=None,
+        user_id=user_id,
+        symbol=symbol,
+        name=symbol,
+        total_quantity=Decimal('1'),
+        avg_price=Decimal('100'),
+        total_spent=Decimal('100'),
+        current_price=Decimal(current_price),
+        last_updated=last_updated
+    )
+
+
+class TestGetUserPortfolioUseCase:
+    """Тесты для получения портфеля с ценами из общей таблицы"""
+
+    @pytest.mark.asyncio
+    async def test_prices_are_read_from_price_table(self):
+        """Тест: цены берутся из таблицы цен, недостающие символы запрашиваются в фоне"""
+        now = datetime.utcnow()
+        portfolio_repo = FakePortfolioRepository([
+            make_item('BTC', '50000', now - timedelta(minutes=5)),
+            make_item('NEW'),
+        ])
+        price_repo = FakePriceRepository({'btc': CoinPrice(symbol='btc', price='60000', last_updated=now)})
+        requested = []
+
+        use_case = GetUserPortfolioUseCase(
+            FakeUserRepository([User(id=1, telegram_id=42)]),
+            portfolio_repo,
+            price_repo,
+            requested.extend
+        )
+        items = await use_case.execute(42)
+
+        assert items[0].current_price == Decimal('60000')
+        assert items[1].current_price == Decimal('0')
+        assert requested == ['NEW']
+        assert len(portfolio_repo.updated) == 1
+
+    @pytest.mark.asyncio
+    async def test_prices_written_back_in_one_call(self):
+        """Тест: все изменившиеся цены записываются одним пакетным обновлением"""
+        now = datetime.utcnow()
+        portfolio_repo = FakePortfolioRepository([
+            make_item('BTC', '50000', now - timedelta(minutes=5)),
+            make_item('ETH', '3000', now - timedelta(minutes=5)),
+            make_item('SOL', '200', now),
+        ])
+        price_repo = FakePriceRepository({
+            'btc': CoinPrice(symbol='btc', price='60000', last_updated=now),
+            'eth': CoinPrice(symbol='eth', price='4000', last_updated=now),
+            'sol': CoinPrice(symbol='sol', price='150', last_updated=now - timedelta(minutes=1)),
+        })
+
+        use_case = GetUserPortfolioUseCase(FakeUserRepository([User(id=1, telegram_id=42)]), portfolio_repo, price_repo)
+        items = await use_case.execute(42)
+
+        assert portfolio_repo.bulk_updates == 1
+        assert [item.symbol for item in portfolio_repo.updated] == ['BTC', 'ETH']
+        assert items[2].current_price == Decimal('200')
+
+    @pytest.mark.asyncio
+    async def test_read_only_does_not_write_prices(self):
+        """Тест: при чтении с реплики цены подставляются в ответ без записи в user_portfolio"""
+        now = datetime.utcnow()
+        replica_repo = FakePortfolioRepository([make_item('BTC', '50000', now - timedelta(minutes=5))])
+        price_repo = FakePriceRepository({'btc': CoinPrice(symbol='btc', price='60000', last_updated=now)})
+
+        use_case = GetUserPortfolioUseCase(FakeUserRepository([User(id=1, telegram_id=42)]), replica_repo, price_repo,
+                                           persist_prices=False)
+        items = await use_case.execute(42)
+
+        assert items[0].current_price == Decimal('60000')
+        assert replica_repo.bulk_updates == 0
+
+    @pytest.mark.asyncio
+    async def test_unknown_user(self):
+        """Тест: для неизвестного пользователя возвращается None"""
+        use_case = GetUserPortfolioUseCase(FakeUserRepository([]), FakePortfolioRepository([]))
+
+        assert await use_case.execute(42) is None
+
+
+class TestPortfolioWriteUseCases:
+    """Тесты для покупки и продажи через единицу работы"""
+
+    @pytest.mark.asyncio
+    async def test_add_coin_commits_once(self):
+        """Тест: новый пользователь, сделка и позиция фиксируются одним commit"""
+        uow = FakeUnitOfWork()
+        use_case = AddCoinToPortfolioUseCase(uow, new_user_balance=Decimal('10000'))
+
+        assert await use_case.execute(42, 'BTC', 'Bitcoin', Decimal('2'), Decimal('100'))
+
+        assert uow.commits == 1
+        assert 42 in uow.committed_users
+        assert len(uow.committed_transactions) == 1
+        assert uow.committed_items[0].total_spent == Decimal('200')
+
+    @pytest.mark.asyncio
+    async def test_add_coin_to_existing_position(self):
+        """Тест: повторная покупка увеличивает позицию, средняя цена - взвешенная"""
+        uow = FakeUnitOfWork(users=[User(id=1, telegram_id=42)], items=[make_item('BTC')])
+
+        assert await AddCoinToPortfolioUseCase(uow).execute(42, 'BTC', 'Bitcoin', Decimal('1'), Decimal('200'))
+
+        position = uow.committed_items[0]
+        assert len(uow.committed_items) == 1
+        assert position.total_quantity == Decimal('2')
+        assert position.avg_price == Decimal('150')
+        assert position.total_spent == Decimal('300')
+
+    @pytest.mark.asyncio
+    async def test_add_coin_unknown_user_without_balance(self):
+        """Тест: без new_user_balance неизвестный пользователь не создается"""
+        uow = FakeUnitOfWork()
+
+        assert not await AddCoinToPortfolioUseCase(uow).execute(42, 'BTC', 'Bitcoin', Decimal('1'), Decimal('1'))
+        assert uow.commits == 0
+
+    @pytest.mark.asyncio
+    async def test_failure_rolls_back_everything(self):
+        """Тест: ошибка посреди покупки не оставляет ни пользователя, ни позиции"""
+        uow = FakeUnitOfWork()
+        uow.fail_on_transaction = True
+
+        with pytest.raises(RuntimeError):
+            await AddCoinToPortfolioUseCase(uow, Decimal('10000')).execute(42, 'BTC', 'Bitcoin', Decimal('1'), Decimal('1'))
+
+        assert uow.commits == 0
+        assert uow.rollbacks == 1
+        assert uow.committed_users == {} and uow.committed_items == []
+
+    @pytest.mark.asyncio
+    async def test_sell_all_removes_position(self):
+        """Тест: продажа всей позиции удаляет ее и записывает сделку в той же транзакции"""
+        item = make_item('BTC')
+        item.id = 7
+        uow = FakeUnitOfWork(users=[User(id=1, telegram_id=42)], items=[item])
+        use_case = SellCoinFromPortfolioUseCase(uow)
+
+        assert not await use_case.execute(42, 'BTC', Decimal('5'), Decimal('120'))
+        assert uow.commits == 0
+
+        assert await use_case.execute(42, 'BTC', Decimal('1'), Decimal('120'))
+        assert uow.commits == 1
+        assert uow.committed_items == []
+        assert uow.committed_transactions[0].total_spent == Decimal('120')
+
+
+class TestTakePortfolioSnapshotsUseCase:
+    """Тесты для дневных снимков стоимости портфелей"""
+
+    @pytest.mark.asyncio
+    async def test_all_users_valued_from_one_price_read(self):
+        """Тест: цены читаются один раз на всех, снимки сохраняются пакетами"""
+        items = [make_item('BTC', user_id=user_id) for user_id in (3, 1, 2)] + [make_item('ETH', user_id=1)]
+        price_repo = FakePriceRepository({
+            'btc': CoinPrice(symbol='btc', price='150'),
+            'eth': CoinPrice(symbol='eth', price='50'),
+        })
+        snapshot_repo = FakeSnapshotRepository()
+
+        use_case = TakePortfolioSnapshotsUseCase(FakePortfolioRepository(items), price_repo, snapshot_repo, batch_size=2)
+        saved = await use_case.execute(date(2025, 1, 1))
+
+        assert saved == 3
+        assert price_repo.reads == 1
+        assert [len(batch) for batch in snapshot_repo.batches] == [2, 1]
+        first = snapshot_repo.batches[0][0]
+        assert first.user_id == 1
+        assert first.snapshot_date == date(2025, 1, 1)
+        assert first.total_value == Decimal('200')
+        assert first.cost_basis == Decimal('200')
+        assert first.pnl == Decimal('0')
+
+    @pytest.mark.asyncio
+    async def test_missing_price_uses_position_price(self):
+        """Тест: без цены в общей таблице берется последняя цена позиции, без нее - 0"""
+        items = [make_item('OLD', current_price='20'), make_item('NEW')]
+        snapshot_repo = FakeSnapshotRepository()
+
+        use_case = TakePortfolioSnapshotsUseCase(FakePortfolioRepository(items), FakePriceRepository({}), snapshot_repo)
+        await use_case.execute(date(2025, 1, 1))
+
+        snapshot = snapshot_repo.batches[0][0]
+        old, new = snapshot.positions
+        assert old.value == Decimal('20')
+        assert new.price is None
+        assert snapshot.total_value == Decimal('20')
+
+    @pytest.mark.asyncio
+    async def test_no_positions(self):
+        """Тест: без позиций ничего не сохраняется"""
+        snapshot_repo = FakeSnapshotRepository()
+
+        use_case = TakePortfolioSnapshotsUseCase(FakePortfolioRepository([]), FakePriceRepository({}), snapshot_repo)
+
+        assert await use_case.execute(date(2025, 1, 1)) == 0
+        assert snapshot_repo.batches == []
+
+    @pytest.mark.asyncio
+    async def test_sold_out_user_gets_zero_snapshot(self):
+        """Тест: продавший все получает нулевой снимок, если вчера были позиции; давно ушедшие - нет"""
+        snapshot_repo = FakeSnapshotRepository({
+            1: [date(2024, 12, 31)],
+            2: [date(2024, 12, 31)],
+            3: [date(2025, 1, 1)],
+            4: [date(2024, 12, 1)],
+        })
+
+        use_case = TakePortfolioSnapshotsUseCase(FakePortfolioRepository([make_item('BTC', '150', user_id=1)]),
+                                                 FakePriceRepository({}), snapshot_repo)
+        saved = await use_case.execute(date(2025, 1, 1))
+
+        snapshots = {snapshot.user_id: snapshot for snapshot in snapshot_repo.batches[0]}
+        assert saved == 3
+        assert set(snapshots) == {1, 2, 3}
+        assert snapshots[1].total_value == Decimal('150')
+        assert snapshots[2].total_value == Decimal('0') and snapshots[2].positions == []
+        assert snapshots[3].cost_basis == Decimal('0')
+